@@ -5,21 +5,36 @@ Called by Vercel Cron every 6 hours.
 
 import os
 import json
-import asyncio
+import time
 from http.server import BaseHTTPRequestHandler
-import requests
 
 # Add parent directory to path for imports
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import TELEGRAM_BOT_TOKEN
-from monitor import check_for_stock_change
-from api.storage import get_users_to_notify, mark_user_notified
+from api.session import get_session
 
+# Read straight from the environment so config (and dotenv) stays off the import path
+TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
 
 
+def warm_telegram():
+    """
+    Open a pooled connection to the Bot API.
+    
+    Returns:
+        float: Seconds taken, or None if it failed
+    """
+    started = time.monotonic()
+    try:
+        get_session().get(f"{TELEGRAM_API}/getMe", timeout=10)
+    except Exception as e:
+        print(f"Error warming Telegram connection: {e}")
+        return None
+    return time.monotonic() - started
+
+
 def send_message(chat_id, text, parse_mode="Markdown"):
     """Send a message via Telegram API."""
     url = f"{TELEGRAM_API}/sendMessage"
@@ -29,7 +44,21 @@ def send_message(chat_id, text, parse_mode="Markdown"):
         "parse_mode": parse_mode,
         "disable_web_page_preview": True
     }
-    return requests.post(url, json=data)
+    return get_session().post(url, json=data, timeout=10)
+
+
+def post_to_channel(channel_id, text):
+    """
+    Post an alert to the broadcast channel.
+    
+    Returns:
+        bool: Whether Telegram accepted it
+    """
+    try:
+        return send_message(channel_id, text).status_code == 200
+    except Exception as e:
+        print(f"Failed to post to broadcast channel {channel_id}: {e}")
+        return False
 
 
 async def run_stock_check():
@@ -37,28 +66,106 @@ async def run_stock_check():
     Check for stock changes and notify users.
     Returns dict with check results.
     """
-    result = check_for_stock_change()
+    # Deferred until the handler runs, so they stay out of the cold-start import
+    from monitor import check_for_stock_change, revalidate_stock
+    from api.storage import get_users_to_notify, mark_users_notified, get_store
+    from api.stock_cache import set_cached_stock, kv_command
+    from config import ADMIN_CHAT_IDS, REVALIDATE_INTERVAL, PIPELINE_CHUNK_SIZE, BROADCAST_CHANNEL_ID
+    from fanout import split_recipients
+    from slo import BroadcastTracker, BROADCAST_STATS_KEY, MAX_SUMMARIES, over_budget, format_summary
+    from prewarm import install_dns_cache, record_warmup, get_warmups
+    from concurrent.futures import ThreadPoolExecutor
+    
+    install_dns_cache()
+    
+    # Open the Telegram connection while the StanShop fetch runs, so an alert
+    # doesn't pay the handshake after stock is found
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        warming = executor.submit(warm_telegram)
+        result = check_for_stock_change()
+        record_warmup("telegram", warming.result())
     notified_count = 0
+    summary = None
+    
+    # Share the fresh result so webhook /check calls can skip the upstream fetch
+    if not result["status"].get("error"):
+        set_cached_stock(result["status"]["available"], result["status"]["message"])
     
     if result["changed"]:
         # Stock became available - notify all tracked users
-        users_to_notify = await get_users_to_notify()
+        users_to_notify = get_users_to_notify(result["status"]["denominations"])
+        tracker = BroadcastTracker(result["status"]["check_time"].timestamp(), source="cron")
+        last_revalidated = time.monotonic()
+        
+        # One channel post stands in for the DMs of subscribers without filters
+        if BROADCAST_CHANNEL_ID and post_to_channel(BROADCAST_CHANNEL_ID, result["status"]["message"]):
+            tracker.record_channel_post()
+            direct = []
+            for start in range(0, len(users_to_notify), PIPELINE_CHUNK_SIZE):
+                chunk = users_to_notify[start:start + PIPELINE_CHUNK_SIZE]
+                covered, chunk = split_recipients(chunk, get_store().get_many(chunk))
+                if covered:
+                    mark_users_notified(covered)
+                    tracker.record_channel(len(covered))
+                    notified_count += len(covered)
+                direct.extend(chunk)
+            users_to_notify = direct
+        
+        # Delivered chat ids are marked notified in batches, not one write each
+        delivered = []
+        
+        try:
+            for index, chat_id in enumerate(users_to_notify):
+                # Long broadcast: stop once stock sells out, leaving the rest tracked
+                if REVALIDATE_INTERVAL > 0 and time.monotonic() - last_revalidated >= REVALIDATE_INTERVAL:
+                    last_revalidated = time.monotonic()
+                    if revalidate_stock() is False:
+                        tracker.cancel()
+                        tracker.record_skipped(len(users_to_notify) - index)
+                        print("Stock sold out mid-broadcast, stopping notifications")
+                        break
+                try:
+                    message = result["status"]["message"]
+                    message += "\n\n_Tracking paused. Use /track to re-enable._"
+                    resp = send_message(int(chat_id), message)
+                    if resp.status_code == 200:
+                        tracker.record_delivery(ok=True)
+                        delivered.append(chat_id)
+                        notified_count += 1
+                    else:
+                        # Rejected (blocked, rate limited, bad request): leave the user pending
+                        tracker.record_delivery(ok=False)
+                        print(f"Failed to notify {chat_id}: HTTP {resp.status_code}")
+                except Exception as e:
+                    tracker.record_delivery(ok=False)
+                    print(f"Failed to notify {chat_id}: {e}")
+                if len(delivered) >= PIPELINE_CHUNK_SIZE:
+                    mark_users_notified(delivered)
+                    delivered = []
+        finally:
+            if delivered:
+                mark_users_notified(delivered)
         
-        for chat_id in users_to_notify:
-            try:
-                message = result["status"]["message"]
-                message += "\n\n_Tracking paused. Use /track to re-enable._"
-                send_message(int(chat_id), message)
-                await mark_user_notified(chat_id)
-                notified_count += 1
-            except Exception as e:
-                print(f"Failed to notify {chat_id}: {e}")
+        if users_to_notify or tracker.channel_posts:
+            summary = tracker.summary()
+            # One line per broadcast instead of one per recipient
+            print(json.dumps({"message": "Broadcast finished", **summary}))
+            kv_command("LPUSH", BROADCAST_STATS_KEY, json.dumps(summary))
+            kv_command("LTRIM", BROADCAST_STATS_KEY, 0, MAX_SUMMARIES - 1)
+            if over_budget(summary):
+                for admin_id in ADMIN_CHAT_IDS:
+                    send_message(int(admin_id), "⚠️ *Time-to-notify budget exceeded*\n\n" + format_summary(summary))
     
     return {
         "checked": True,
         "stock_available": result["status"]["available"],
         "stock_changed": result["changed"],
+        "fingerprint": result.get("fingerprint"),
         "users_notified": notified_count,
+        "sends_saved": summary["sends_saved"] if summary else 0,
+        "broadcast_cancelled": bool(summary and summary["cancelled"]),
+        "time_to_notify": summary,
+        "warmups": get_warmups(),
         "reason": result["reason"]
     }
 
@@ -78,6 +185,7 @@ class handler(BaseHTTPRequestHandler):
             print("Warning: CRON_SECRET mismatch or missing")
         
         try:
+            import asyncio  # Deferred: only needed once the handler actually runs
             result = asyncio.run(run_stock_check())
             
             self.send_response(200)
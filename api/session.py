@@ -0,0 +1,24 @@
+"""
+Shared HTTP session for the serverless functions.
+Created on first use and kept at module level, so warm invocations
+reuse pooled connections to Telegram, StanShop and KV.
+"""
+
+_session = None
+
+
+def get_session():
+    """
+    Get the module-level requests session, creating it on first use.
+
+    Importing requests is deferred to here so it is not paid for at
+    module load, before the handler even runs.
+
+    Returns:
+        requests.Session: Shared session
+    """
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
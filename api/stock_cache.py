@@ -0,0 +1,154 @@
+"""
+Shared stock check cache in Vercel KV.
+Lets every serverless instance answer /check from one recent result
+instead of calling the StanShop API on each command.
+"""
+
+import os
+import json
+import time
+import uuid
+
+from api.session import get_session
+
+KV_REST_API_URL = os.environ.get("KV_REST_API_URL", "")
+KV_REST_API_TOKEN = os.environ.get("KV_REST_API_TOKEN", "")
+
+STOCK_CACHE_KEY = "stock_cache"
+STOCK_CACHE_LOCK_KEY = "stock_cache_lock"
+
+# How long a cached result is served before a fresh fetch is needed
+STOCK_CACHE_TTL = int(os.environ.get("STOCK_CACHE_TTL", "60"))
+# How long the fetch lock is held at most (should exceed the fetch timeout)
+STOCK_CACHE_LOCK_TTL = int(os.environ.get("STOCK_CACHE_LOCK_TTL", "15"))
+# How long a waiting instance polls for the lock holder's result
+STOCK_CACHE_WAIT = float(os.environ.get("STOCK_CACHE_WAIT", "3"))
+STOCK_CACHE_POLL_INTERVAL = 0.2
+
+# Delete a key only if it still holds our token (atomic, so an expired lock
+# re-acquired by another instance is never deleted)
+COMPARE_AND_DELETE = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+
+def kv_configured():
+    """Check whether KV REST credentials are available."""
+    return bool(KV_REST_API_URL and KV_REST_API_TOKEN)
+
+
+def kv_command(*args):
+    """
+    Run a single Redis command through the KV REST API.
+
+    Args:
+        *args: Command name followed by its arguments, e.g. ("GET", "key")
+
+    Returns:
+        The command result, or None if KV is unavailable or the call fails
+    """
+    if not kv_configured():
+        return None
+    try:
+        resp = get_session().post(
+            KV_REST_API_URL,
+            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+            json=[str(arg) for arg in args],
+            timeout=5
+        )
+        if resp.status_code == 200:
+            return resp.json().get("result")
+        return None
+    except Exception as e:
+        print(f"KV command error: {e}")
+        return None
+
+
+def get_cached_stock():
+    """
+    Get the cached stock result if it is still fresh.
+
+    Returns:
+        dict: Cached result with 'available', 'message' and 'cached_at', or None
+    """
+    raw = kv_command("GET", STOCK_CACHE_KEY)
+    if not raw:
+        return None
+    try:
+        cached = json.loads(raw) if isinstance(raw, str) else raw
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(cached, dict):
+        return None
+    if time.time() - cached.get("cached_at", 0) > STOCK_CACHE_TTL:
+        return None
+    return cached
+
+
+def set_cached_stock(available, message):
+    """
+    Store a stock result for other instances to reuse.
+
+    Args:
+        available: Whether vouchers are in stock
+        message: The rendered /check reply
+    """
+    value = json.dumps({
+        "available": available,
+        "message": message,
+        "cached_at": time.time()
+    })
+    # Expire in KV too, so stale entries never outlive the TTL by much
+    return kv_command("SET", STOCK_CACHE_KEY, value, "EX", STOCK_CACHE_TTL) == "OK"
+
+
+def _acquire_lock():
+    """Try to take the fetch lock. Returns a token if acquired, else None."""
+    token = uuid.uuid4().hex
+    result = kv_command("SET", STOCK_CACHE_LOCK_KEY, token, "NX", "EX", STOCK_CACHE_LOCK_TTL)
+    return token if result == "OK" else None
+
+
+def _release_lock(token):
+    """Release the fetch lock if this instance still holds it."""
+    kv_command("EVAL", COMPARE_AND_DELETE, 1, STOCK_CACHE_LOCK_KEY, token)
+
+
+def get_or_fetch_stock(fetch):
+    """
+    Answer a stock check from the shared cache, fetching at most once.
+
+    On a cache hit this costs a single KV round trip. On a miss, one
+    instance takes the lock and fetches; concurrent instances wait
+    briefly for its result instead of hitting the upstream API too.
+
+    Args:
+        fetch: Callable returning a dict with 'available' and 'message'
+
+    Returns:
+        dict: Stock result with 'available' and 'message'
+    """
+    cached = get_cached_stock()
+    if cached:
+        return cached
+
+    if not kv_configured():
+        return fetch()
+
+    token = _acquire_lock()
+    if token is None:
+        # Someone else is fetching - wait for their result
+        deadline = time.monotonic() + STOCK_CACHE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(STOCK_CACHE_POLL_INTERVAL)
+            cached = get_cached_stock()
+            if cached:
+                return cached
+        # Lock holder is slow or died, fetch ourselves
+        return fetch()
+
+    try:
+        result = fetch()
+        if not result.get("error"):
+            set_cached_stock(result["available"], result["message"])
+        return result
+    finally:
+        _release_lock(token)
@@ -1,103 +1,99 @@
 """
-Vercel KV Storage for tracked users.
-Replaces file-based tracked_users.json for serverless environment.
+Tracked user storage for the serverless functions.
+Uses the KV hash registry when KV is configured, and tracked_users.json for
+local development. Shared by the cron and the webhook.
 """
 
-import os
-import json
 from datetime import datetime
 
-# Try to import Vercel KV, fall back to local file for development
-try:
-    from vercel_kv import KV
-    kv = KV()
-    USE_VERCEL_KV = True
-except ImportError:
-    USE_VERCEL_KV = False
-    kv = None
+from registry import FileStore, KVStore
+from subscriptions import SubscriptionIndex
+from counters import KVCounters, transition_deltas, merge_deltas
 
-TRACKED_USERS_KEY = "tracked_users"
 LOCAL_FILE = "tracked_users.json"
 
+# Registry backend, opened on first use so module load stays cheap
+_store = None
 
-def _load_local():
-    """Load from local file (for development)."""
-    if os.path.exists(LOCAL_FILE):
-        try:
-            with open(LOCAL_FILE, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
 
+def get_store():
+    """Get the registry store: the KV hash if configured, else the local file."""
+    global _store
+    if _store is None:
+        from api.stock_cache import kv_configured
+        _store = KVStore() if kv_configured() else FileStore(LOCAL_FILE)
+    return _store
 
-def _save_local(users):
-    """Save to local file (for development)."""
-    with open(LOCAL_FILE, "w") as f:
-        json.dump(users, f, indent=2)
 
+def load_tracked_users():
+    """Load all tracked users from storage."""
+    return get_store().load_all()
 
-async def load_tracked_users():
-    """Load tracked users from storage."""
-    if USE_VERCEL_KV:
-        data = await kv.get(TRACKED_USERS_KEY)
-        return data if data else {}
-    return _load_local()
 
+# Aggregate counters, updated with HINCRBY on every mutation
+_counters = KVCounters(load_tracked_users)
 
-async def save_tracked_users(users):
-    """Save tracked users to storage."""
-    if USE_VERCEL_KV:
-        await kv.set(TRACKED_USERS_KEY, users)
-    else:
-        _save_local(users)
 
+def get_subscriber_stats():
+    """Get aggregate subscriber counters without scanning the registry."""
+    return _counters.get()
 
-async def add_tracked_user(chat_id, username=None):
-    """Add a user to tracking list."""
-    users = await load_tracked_users()
-    users[str(chat_id)] = {
+
+def add_tracked_user(chat_id, username=None, filters=None, channel=True):
+    """Add a user to tracking list (channel: whether the channel post may replace their DM)."""
+    record = {
         "username": username,
         "tracked_at": datetime.now().isoformat(),
-        "notified": False
+        "notified": False,
+        "filters": filters,
+        "channel": channel
     }
-    await save_tracked_users(users)
+    previous = get_store().put(chat_id, record)
+    _counters.apply(transition_deltas(previous, record))
 
 
-async def remove_tracked_user(chat_id):
+def remove_tracked_user(chat_id):
     """Remove a user from tracking list."""
-    users = await load_tracked_users()
-    if str(chat_id) in users:
-        del users[str(chat_id)]
-        await save_tracked_users(users)
-        return True
-    return False
+    previous = get_store().remove(chat_id)
+    if previous is None:
+        return False
+    _counters.apply(transition_deltas(previous, None))
+    return True
+
 
+def mark_users_notified(chat_ids):
+    """Mark a batch of users as notified with one storage round trip per batch."""
+    previous = get_store().mark_notified_many(chat_ids)
+    if previous:
+        _counters.apply(merge_deltas(*(
+            transition_deltas(record, dict(record, notified=True)) for record in previous.values()
+        )))
 
-async def mark_user_notified(chat_id):
+
+def mark_user_notified(chat_id):
     """Mark a user as notified."""
-    users = await load_tracked_users()
-    if str(chat_id) in users:
-        users[str(chat_id)]["notified"] = True
-        await save_tracked_users(users)
+    mark_users_notified([chat_id])
+
 
+def get_users_to_notify(denominations=None):
+    """
+    Get list of users who should receive notifications.
 
-async def get_users_to_notify():
-    """Get list of users who should receive notifications."""
-    users = await load_tracked_users()
-    return [
-        chat_id for chat_id, data in users.items()
-        if not data.get("notified", False)
-    ]
+    Args:
+        denominations: Denominations in stock; when given, only users whose
+            filters match are returned
+    """
+    pending = get_store().load_pending()
+    if denominations is not None:
+        return SubscriptionIndex.from_users(pending).match(denominations)
+    return list(pending)
 
 
-async def is_user_tracking(chat_id):
+def is_user_tracking(chat_id):
     """Check if a user is currently tracking."""
-    users = await load_tracked_users()
-    return str(chat_id) in users
+    return get_store().get(chat_id) is not None
 
 
-async def get_user_status(chat_id):
+def get_user_status(chat_id):
     """Get tracking status for a user."""
-    users = await load_tracked_users()
-    return users.get(str(chat_id))
+    return get_store().get(chat_id)
@@ -5,131 +5,38 @@ Handles incoming updates from Telegram via webhook.
 
 import os
 import json
+import time
 from http.server import BaseHTTPRequestHandler
-import requests
-from datetime import datetime
+
+# Add parent directory to path for imports
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.session import get_session
+from subscriptions import parse_filters, format_filters
+from counters import format_stats
+from fanout import channel_link, parse_delivery, format_delivery
+from api.storage import (
+    add_tracked_user, remove_tracked_user, get_user_status, get_subscriber_stats
+)
 
 # Get token from environment
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 KV_REST_API_URL = os.environ.get("KV_REST_API_URL", "")
-KV_REST_API_TOKEN = os.environ.get("KV_REST_API_TOKEN", "")
-
-TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-STANSHOP_PRODUCT_URL = "https://www.stanshop.co/in/product/phonepe-gift-voucher"
-
-
-def kv_get(key):
-    """Get value from Vercel KV."""
-    if not KV_REST_API_URL or not KV_REST_API_TOKEN:
-        return None
-    try:
-        resp = requests.get(
-            f"{KV_REST_API_URL}/get/{key}",
-            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
-            timeout=5
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            result = data.get("result")
-            if result:
-                # Handle both string and dict responses
-                if isinstance(result, str):
-                    return json.loads(result)
-                return result  # Already a dict/list
-        return None
-    except Exception as e:
-        print(f"KV get error: {e}")
-        return None
 
+# /check limits over a sliding window, shared by all instances through KV (0 disables)
+CHECK_RATE_WINDOW = float(os.environ.get("CHECK_RATE_WINDOW", "60"))
+CHECK_RATE_PER_CHAT = int(os.environ.get("CHECK_RATE_PER_CHAT", "3"))
+CHECK_RATE_GLOBAL = int(os.environ.get("CHECK_RATE_GLOBAL", "30"))
 
-def kv_set(key, value):
-    """Set value in Vercel KV."""
-    if not KV_REST_API_URL or not KV_REST_API_TOKEN:
-        print("KV not configured")
-        return False
-    try:
-        # Serialize value to JSON string for storage
-        json_value = json.dumps(value)
-        resp = requests.post(
-            f"{KV_REST_API_URL}/set/{key}",
-            headers={
-                "Authorization": f"Bearer {KV_REST_API_TOKEN}",
-                "Content-Type": "application/json"
-            },
-            data=json_value,  # Send as raw JSON string, not double-encoded
-            timeout=5
-        )
-        print(f"KV set response: {resp.status_code}")
-        return resp.status_code == 200
-    except Exception as e:
-        print(f"KV set error: {e}")
-        return False
-
-
-def load_tracked_users():
-    """Load tracked users from KV storage."""
-    users = kv_get("tracked_users")
-    
-    # Handle corrupted data - if it's a string, try to parse it
-    if isinstance(users, str):
-        try:
-            users = json.loads(users)
-        except:
-            print(f"Corrupted users data, resetting")
-            users = {}
-    
-    # Validate structure - each user entry should be a dict
-    if isinstance(users, dict):
-        cleaned = {}
-        for chat_id, data in users.items():
-            if isinstance(data, dict):
-                cleaned[chat_id] = data
-            elif isinstance(data, str):
-                try:
-                    cleaned[chat_id] = json.loads(data)
-                except:
-                    pass  # Skip corrupted entry
-        return cleaned
-    
-    return {} if not users else users
-
-
-def save_tracked_users(users):
-    """Save tracked users to KV storage."""
-    kv_set("tracked_users", users)
-
-
-def add_tracked_user(chat_id, username=None):
-    """Add a user to tracking list."""
-    users = load_tracked_users()
-    users[str(chat_id)] = {
-        "username": username,
-        "tracked_at": datetime.now().isoformat(),
-        "notified": False
-    }
-    save_tracked_users(users)
+# Optional broadcast channel that replaces DMs for subscribers without filters
+BROADCAST_CHANNEL_ID = os.environ.get("BROADCAST_CHANNEL_ID", "")
+BROADCAST_CHANNEL_URL = os.environ.get("BROADCAST_CHANNEL_URL", "")
 
+ADMIN_CHAT_IDS = [c.strip() for c in os.environ.get("ADMIN_CHAT_IDS", "").split(",") if c.strip()]
 
-def remove_tracked_user(chat_id):
-    """Remove a user from tracking list."""
-    users = load_tracked_users()
-    if str(chat_id) in users:
-        del users[str(chat_id)]
-        save_tracked_users(users)
-        return True
-    return False
-
-
-def is_user_tracking(chat_id):
-    """Check if a user is currently tracking."""
-    users = load_tracked_users()
-    return str(chat_id) in users
-
-
-def get_user_status(chat_id):
-    """Get tracking status for a user."""
-    users = load_tracked_users()
-    return users.get(str(chat_id))
+TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+STANSHOP_PRODUCT_URL = "https://www.stanshop.co/in/product/phonepe-gift-voucher"
 
 
 def send_message(chat_id, text, parse_mode="Markdown"):
@@ -142,7 +49,7 @@ def send_message(chat_id, text, parse_mode="Markdown"):
         "disable_web_page_preview": True
     }
     try:
-        resp = requests.post(url, json=data, timeout=10)
+        resp = get_session().post(url, json=data, timeout=10)
         return resp.json()
     except Exception as e:
         print(f"Error sending message: {e}")
@@ -151,30 +58,28 @@ def send_message(chat_id, text, parse_mode="Markdown"):
 
 def check_stock():
     """Check PhonePe voucher stock."""
+    # Deferred: only /check parses inventory, through the same snapshot model as the bot
+    from inventory import parse_inventory
+    
     try:
         api_url = "https://api.getstan.app/api/v1/shop/store/inventory/slug/phonepe-gift-voucher"
-        resp = requests.get(api_url, timeout=10)
+        resp = get_session().get(api_url, timeout=10)
         if resp.status_code == 200:
-            data = resp.json()
-            variants = data.get("data", {}).get("variants", [])
-            
-            if variants:
-                available = [v for v in variants if v.get("available", False)]
-                if available:
-                    msg = "✅ *Stock Available!*\n\n"
-                    for v in available:
-                        name = v.get("title", "Unknown")
-                        price = v.get("price", 0) / 100
-                        msg += f"• {name}: ₹{price:.0f}\n"
-                    msg += f"\n🔗 [Buy Now]({STANSHOP_PRODUCT_URL})"
-                    return {"available": True, "message": msg}
-            return {"available": False, "message": "❌ *Out of Stock*\n\nNo vouchers currently available."}
-        return {"available": False, "message": "⚠️ Could not check stock. Try again later."}
+            snapshot = parse_inventory(resp.json(), STANSHOP_PRODUCT_URL)
+            return {"available": snapshot.available, "message": snapshot.message, "error": False}
+        return {"available": False, "message": "⚠️ Could not check stock. Try again later.", "error": True}
     except Exception as e:
-        return {"available": False, "message": f"⚠️ Error checking stock: {str(e)}"}
+        return {"available": False, "message": f"⚠️ Error checking stock: {str(e)}", "error": True}
+
+
+def delivery_text(filters, channel):
+    """Where a subscriber's alerts go, as an extra reply line (empty without a channel)."""
+    if not BROADCAST_CHANNEL_ID:
+        return ""
+    return "\n" + format_delivery(filters, channel, channel_link(BROADCAST_CHANNEL_ID, BROADCAST_CHANNEL_URL))
 
 
-def handle_command(chat_id, command, username=None):
+def handle_command(chat_id, command, username=None, args=None):
     """Handle bot commands."""
     
     if command == "/start" or command == "/help":
@@ -185,6 +90,8 @@ Welcome! I'll help you track PhonePe gift voucher availability.
 
 *Commands:*
 /track - Start tracking for stock alerts
+/track 500 max=480 discount=5 - Only alert for matching vouchers
+/track dm - Get alerts as a private message, not in the channel
 /untrack - Stop tracking
 /check - Check current stock status
 /status - View your tracking status
@@ -197,17 +104,27 @@ Welcome! I'll help you track PhonePe gift voucher availability.
         if not KV_REST_API_URL:
             send_message(chat_id, "⚠️ Tracking is not configured. Contact the bot admin.")
             return
-            
-        if is_user_tracking(chat_id):
-            user_data = get_user_status(chat_id)
-            if user_data and user_data.get("notified"):
-                add_tracked_user(chat_id, username)
-                send_message(chat_id, "🔄 *Tracking Reset!*\n\nI'll notify you when new stock arrives.")
+        
+        args, channel = parse_delivery(args)
+        try:
+            filters = parse_filters(args)
+        except ValueError as e:
+            send_message(chat_id, f"⚠️ {e}")
+            return
+        
+        user_data = get_user_status(chat_id)
+        if user_data is not None:
+            if user_data.get("notified"):
+                add_tracked_user(chat_id, username, filters, channel)
+                send_message(chat_id, f"🔄 *Tracking Reset!*\n\nI'll notify you when new stock arrives.\n🎯 Watching: {format_filters(filters)}{delivery_text(filters, channel)}")
+            elif filters != user_data.get("filters") or channel != user_data.get("channel", False):
+                add_tracked_user(chat_id, username, filters, channel)
+                send_message(chat_id, f"✅ *Tracking Updated!*\n\n🎯 Watching: {format_filters(filters)}{delivery_text(filters, channel)}")
             else:
                 send_message(chat_id, "✅ You're already tracking!\n\nUse /untrack to stop.")
         else:
-            add_tracked_user(chat_id, username)
-            send_message(chat_id, "🔔 *Tracking Started!*\n\nI'll notify you when vouchers become available.")
+            add_tracked_user(chat_id, username, filters, channel)
+            send_message(chat_id, f"🔔 *Tracking Started!*\n\nI'll notify you when vouchers become available.\n🎯 Watching: {format_filters(filters)}{delivery_text(filters, channel)}")
     
     elif command == "/untrack":
         if remove_tracked_user(chat_id):
@@ -216,17 +133,34 @@ Welcome! I'll help you track PhonePe gift voucher availability.
             send_message(chat_id, "ℹ️ You weren't tracking.\nUse /track to start.")
     
     elif command == "/check":
+        # Deferred: only /check needs the shared stock cache and the limiter
+        from api.stock_cache import get_or_fetch_stock, get_cached_stock
+        from ratelimit import KVSlidingWindowLimiter, format_limited
+        
+        limiter = KVSlidingWindowLimiter(CHECK_RATE_PER_CHAT, CHECK_RATE_GLOBAL, CHECK_RATE_WINDOW)
+        wait = limiter.acquire(chat_id)
+        if wait > 0:
+            # Over the limit: answer from the shared cache instead of fetching again
+            cached = get_cached_stock()
+            if cached:
+                send_message(chat_id, format_limited(wait, cached["message"], time.time() - cached["cached_at"]))
+            else:
+                send_message(chat_id, format_limited(wait))
+            return
+        
         send_message(chat_id, "🔍 Checking stock...")
-        result = check_stock()
+        result = get_or_fetch_stock(check_stock)
         send_message(chat_id, result["message"])
     
     elif command == "/status":
-        if is_user_tracking(chat_id):
-            user_data = get_user_status(chat_id)
-            if user_data and user_data.get("notified"):
+        user_data = get_user_status(chat_id)
+        if user_data is not None:
+            if user_data.get("notified"):
                 track_status = "⚠️ Notified (use /track to re-enable)"
             else:
                 track_status = "✅ Active"
+            track_status += f"\n🎯 Watching: {format_filters(user_data.get('filters'))}"
+            track_status += delivery_text(user_data.get("filters"), user_data.get("channel", False))
         else:
             track_status = "❌ Not tracking"
         
@@ -237,10 +171,25 @@ Welcome! I'll help you track PhonePe gift voucher availability.
 🔄 Check interval: Daily at 12 PM IST
 """)
     
+    elif command == "/stats" and str(chat_id) in ADMIN_CHAT_IDS:
+        send_message(chat_id, format_stats(get_subscriber_stats()))
+    
     else:
         send_message(chat_id, "Unknown command. Use /help to see available commands.")
 
 
+def get_last_broadcast():
+    """Get the latest time-to-notify summary recorded by the cron."""
+    from api.stock_cache import kv_command
+    from slo import BROADCAST_STATS_KEY
+    
+    raw = kv_command("LINDEX", BROADCAST_STATS_KEY, 0)
+    try:
+        return json.loads(raw) if raw else None
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
 class handler(BaseHTTPRequestHandler):
     """Vercel serverless function handler."""
     
@@ -258,8 +207,9 @@ class handler(BaseHTTPRequestHandler):
             username = message.get("from", {}).get("username")
             
             if chat_id and text.startswith("/"):
-                command = text.split()[0].split("@")[0]
-                handle_command(chat_id, command, username)
+                parts = text.split()
+                command = parts[0].split("@")[0]
+                handle_command(chat_id, command, username, parts[1:])
             
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
@@ -281,6 +231,8 @@ class handler(BaseHTTPRequestHandler):
         status = {
             "status": "Bot webhook is active",
             "token_set": bool(TELEGRAM_BOT_TOKEN),
-            "kv_configured": bool(KV_REST_API_URL)
+            "kv_configured": bool(KV_REST_API_URL),
+            "stats": get_subscriber_stats() if KV_REST_API_URL else None,
+            "last_broadcast": get_last_broadcast()
         }
         self.wfile.write(json.dumps(status).encode())
@@ -0,0 +1,107 @@
+"""
+Backtest predictive polling against the fixed schedule.
+Learns a plan from the first part of the stock history, then replays the
+remaining restocks and reports how long each schedule takes to detect them
+with the same request budget.
+
+Usage:
+    python benchmarks/backtest.py --train-days 28 --budget 24
+"""
+
+import argparse
+import os
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import HISTORY_FILE, POLL_BUDGET_PER_DAY, POLL_MAX_PER_HOUR, POLL_FLOOR_SHARE
+from history import HistoryLog
+from predictor import build_plan, describe_plan, learn_probabilities, next_poll_time, restock_events
+
+
+def fixed_next_poll(interval):
+    """Next-poll function for a fixed interval aligned to the epoch."""
+    def next_poll(after):
+        return (int(after // interval) + 1) * interval
+    return next_poll
+
+
+def replay(events, next_poll, start, end):
+    """
+    Replay restock events against a schedule.
+
+    A restock counts as detected if a poll falls between the restock and
+    the sell-out; its latency is the time from restock to that poll.
+
+    Returns:
+        dict: latencies (seconds), missed count and polls made
+    """
+    latencies, missed = [], 0
+    for restocked_at, sold_out_at in events:
+        poll = next_poll(restocked_at - 1e-6)
+        if sold_out_at is not None and poll >= sold_out_at:
+            missed += 1
+        else:
+            latencies.append(poll - restocked_at)
+
+    polls, t = 0, start
+    while True:
+        t = next_poll(t)
+        if t >= end:
+            break
+        polls += 1
+    return {"latencies": latencies, "missed": missed, "polls": polls}
+
+
+def report(name, result, days):
+    latencies = sorted(result["latencies"])
+    if latencies:
+        p90 = latencies[max(0, int(len(latencies) * 0.9) - 1)]
+        detail = (f"mean {statistics.mean(latencies) / 60:6.1f} min  "
+                  f"p50 {statistics.median(latencies) / 60:6.1f} min  p90 {p90 / 60:6.1f} min")
+    else:
+        detail = "no restocks detected"
+    print(f"{name:10s} detected {len(latencies):3d}  missed {result['missed']:3d}  "
+          f"requests/day {result['polls'] / days:6.1f}  {detail}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--train-days", type=float, default=28)
+    parser.add_argument("--budget", type=int, default=POLL_BUDGET_PER_DAY, help="Requests per day")
+    parser.add_argument("--max-per-hour", type=int, default=POLL_MAX_PER_HOUR)
+    parser.add_argument("--floor-share", type=float, default=POLL_FLOOR_SHARE)
+    args = parser.parse_args()
+
+    with HistoryLog(args.history) as log:
+        if not len(log):
+            print(f"No history in {args.history}")
+            return 1
+        first, last = log.record(0).timestamp, log.record(len(log) - 1).timestamp
+
+    split = first + args.train_days * 86400
+    if split >= last:
+        print(f"History spans {(last - first) / 86400:.1f} days; need more than --train-days")
+        return 1
+
+    plan = build_plan(
+        learn_probabilities(args.history, first, split),
+        budget_per_day=args.budget,
+        max_per_hour=args.max_per_hour,
+        floor_share=args.floor_share,
+    )
+    events = restock_events(args.history, split, last + 1)
+    days = (last - split) / 86400
+
+    print(f"Trained on {args.train_days:g} days, testing {days:.1f} days with {len(events)} restocks")
+    print(f"Plan: {describe_plan(plan)}\n")
+    report("fixed", replay(events, fixed_next_poll(86400 / args.budget), split, last), days)
+    report("predictive", replay(events, lambda t: next_poll_time(plan, t), split, last), days)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
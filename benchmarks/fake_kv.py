@@ -0,0 +1,228 @@
+"""
+Local stand-in for the Upstash KV REST API, for benchmarks.
+Accepts a Redis command as a JSON array POSTed to the root URL, like
+kv_command() sends, and implements the commands the bot uses.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeKV:
+    """In-memory Redis-like store behind an HTTP endpoint."""
+
+    def __init__(self, token="bench-kv"):
+        self.token = token
+        self.calls = {}  # command -> call count
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Value for KV_REST_API_URL."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        """Start serving on a free local port in a background thread."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                fake._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _handle(self, request):
+        length = int(request.headers.get("Content-Length", 0))
+        args = json.loads(request.rfile.read(length) or b"[]")
+        if request.headers.get("Authorization") != f"Bearer {self.token}":
+            status, body = 401, {"error": "Unauthorized"}
+        else:
+            try:
+                status, body = 200, {"result": self.execute(*args)}
+            except (KeyError, ValueError, IndexError) as e:
+                status, body = 400, {"error": f"ERR {e}"}
+
+        raw = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(raw)))
+        request.end_headers()
+        request.wfile.write(raw)
+
+    # ---- Commands --------------------------------------------------------
+
+    def execute(self, command, *args):
+        """Run one command against the store and return its result."""
+        command = command.upper()
+        with self._lock:
+            self.calls[command] = self.calls.get(command, 0) + 1
+            handler = getattr(self, f"_cmd_{command.lower()}", None)
+            if handler is None:
+                raise ValueError(f"unknown command '{command}'")
+            return handler(*args)
+
+    def _get_live(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def _cmd_get(self, key):
+        return self._get_live(key)
+
+    def _cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        if "NX" in options and self._get_live(key) is not None:
+            return None
+        self._data[key] = value
+        self._expires.pop(key, None)
+        for unit, scale in (("EX", 1), ("PX", 0.001)):
+            if unit in options:
+                self._expires[key] = time.time() + float(options[options.index(unit) + 1]) * scale
+        return "OK"
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            removed += self._data.pop(key, None) is not None
+            self._expires.pop(key, None)
+        return removed
+
+    def _cmd_exists(self, *keys):
+        return sum(self._get_live(key) is not None for key in keys)
+
+    def _cmd_incr(self, key):
+        return self._cmd_incrby(key, 1)
+
+    def _cmd_decr(self, key):
+        return self._cmd_incrby(key, -1)
+
+    def _cmd_incrby(self, key, delta):
+        value = int(self._get_live(key) or 0) + int(delta)
+        self._data[key] = str(value)
+        return value
+
+    def _cmd_expire(self, key, seconds):
+        if self._get_live(key) is None:
+            return 0
+        self._expires[key] = time.time() + float(seconds)
+        return 1
+
+    def _cmd_strlen(self, key):
+        return len((self._get_live(key) or "").encode())
+
+    def _cmd_getrange(self, key, start, end):
+        raw = (self._get_live(key) or "").encode()
+        end = int(end)
+        return raw[int(start):None if end == -1 else end + 1].decode()
+
+    def _cmd_append(self, key, value):
+        self._data[key] = (self._get_live(key) or "") + value
+        return len(self._data[key].encode())
+
+    def _cmd_rename(self, key, new_key):
+        if key not in self._data:
+            raise KeyError("no such key")
+        self._data[new_key] = self._data.pop(key)
+        self._expires.pop(new_key, None)
+        if key in self._expires:
+            self._expires[new_key] = self._expires.pop(key)
+        return "OK"
+
+    def _cmd_hincrby(self, key, field, delta):
+        hash_ = self._data.setdefault(key, {})
+        hash_[field] = int(hash_.get(field, 0)) + int(delta)
+        return hash_[field]
+
+    def _cmd_hset(self, key, *pairs):
+        hash_ = self._data.setdefault(key, {})
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            hash_[field] = value
+        return len(pairs) // 2
+
+    def _cmd_hmget(self, key, *fields):
+        hash_ = self._get_live(key) or {}
+        return [hash_.get(field) for field in fields]
+
+    def _cmd_hdel(self, key, *fields):
+        hash_ = self._get_live(key) or {}
+        removed = sum(hash_.pop(field, None) is not None for field in fields)
+        if key in self._data and not hash_:
+            del self._data[key]
+        return removed
+
+    def _cmd_hlen(self, key):
+        return len(self._get_live(key) or {})
+
+    def _cmd_hscan(self, key, cursor, *options):
+        # The cursor is an offset into the fields in insertion order
+        options = [o.upper() for o in options]
+        count = int(options[options.index("COUNT") + 1]) if "COUNT" in options else 10
+        items = list((self._get_live(key) or {}).items())[int(cursor):int(cursor) + count]
+        next_cursor = int(cursor) + count
+        if next_cursor >= len(self._get_live(key) or {}):
+            next_cursor = 0
+        return [str(next_cursor), [item for pair in items for item in pair]]
+
+    def _cmd_hgetall(self, key):
+        return [str(item) for pair in (self._get_live(key) or {}).items() for item in pair]
+
+    def _cmd_lpush(self, key, *values):
+        list_ = self._data.setdefault(key, [])
+        for value in values:
+            list_.insert(0, value)
+        return len(list_)
+
+    def _cmd_ltrim(self, key, start, stop):
+        list_ = self._data.get(key, [])
+        stop = int(stop)
+        self._data[key] = list_[int(start):None if stop == -1 else stop + 1]
+        return "OK"
+
+    def _cmd_lindex(self, key, index):
+        list_ = self._get_live(key) or []
+        try:
+            return list_[int(index)]
+        except IndexError:
+            return None
+
+    def _cmd_lrange(self, key, start, stop):
+        stop = int(stop)
+        return (self._get_live(key) or [])[int(start):None if stop == -1 else stop + 1]
+
+    def _cmd_zadd(self, key, score, member):
+        zset = self._data.setdefault(key, {})
+        added = member not in zset
+        zset[member] = float(score)
+        return int(added)
+
+    def _cmd_zrem(self, key, member):
+        return int(self._data.get(key, {}).pop(member, None) is not None)
+
+    def _cmd_zrangebyscore(self, key, low, high):
+        low, high = float(low), float(high)  # Also parses "-inf" / "+inf"
+        zset = self._get_live(key) or {}
+        return [m for m, s in sorted(zset.items(), key=lambda item: item[1]) if low <= s <= high]
+
+    def _cmd_zremrangebyscore(self, key, low, high):
+        doomed = self._cmd_zrangebyscore(key, low, high)
+        for member in doomed:
+            del self._data[key][member]
+        return len(doomed)
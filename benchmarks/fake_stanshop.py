@@ -0,0 +1,106 @@
+"""
+Local stand-in for the StanShop inventory API, for benchmarks.
+Replays recorded inventory snapshots: each request gets the latest
+snapshot at or before the current (virtual) time, with an ETag so
+conditional re-checks see 304s while the inventory is unchanged.
+"""
+
+import json
+import threading
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def load_fixture(path):
+    """
+    Load an NDJSON fixture of inventory snapshots.
+
+    Each line is {"t": epoch seconds, "body": API response or null}.
+
+    Returns:
+        list: Snapshots sorted by time
+    """
+    with open(path, "r") as f:
+        snapshots = [json.loads(line) for line in f if line.strip()]
+    return sorted(snapshots, key=lambda s: s["t"])
+
+
+def snapshot_available(snapshot):
+    """Whether a snapshot has any denomination in stock."""
+    body = snapshot.get("body") or {}
+    return bool((body.get("inventory") or {}).get("stanValueDenomination"))
+
+
+class FakeStanShop:
+    """Serves fixture snapshots according to a clock."""
+
+    def __init__(self, snapshots, clock):
+        self.snapshots = snapshots
+        self.clock = clock
+        self.calls = {}  # HTTP method -> request count
+        self.not_modified = 0
+        self._times = [s["t"] for s in snapshots]
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Value to use in place of STANSHOP_API_URL."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/inventory"
+
+    @property
+    def requests(self):
+        return sum(self.calls.values())
+
+    def start(self):
+        """Start serving on a free local port in a background thread."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._handle(self, body=True)
+
+            def do_HEAD(self):
+                fake._handle(self, body=False)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def current(self):
+        """Index of the snapshot in effect at the clock's time."""
+        return max(0, bisect_right(self._times, self.clock.now) - 1)
+
+    def _handle(self, request, body):
+        index = self.current()
+        etag = f'"{index}"'
+        with self._lock:
+            self.calls[request.command] = self.calls.get(request.command, 0) + 1
+
+        if request.headers.get("If-None-Match") == etag:
+            with self._lock:
+                self.not_modified += 1
+            request.send_response(304)
+            request.send_header("ETag", etag)
+            request.end_headers()
+            return
+
+        snapshot = self.snapshots[index]
+        status = 200 if snapshot.get("body") is not None else 503
+        raw = json.dumps(snapshot.get("body") or {"error": "unavailable"}).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(raw)))
+        request.send_header("ETag", etag)
+        request.end_headers()
+        if body:
+            request.wfile.write(raw)
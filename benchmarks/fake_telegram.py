@@ -0,0 +1,224 @@
+"""
+Local stand-in for the Telegram Bot API, for benchmarks.
+Serves the handful of methods the bot uses, long-polls getUpdates,
+pushes updates to a registered webhook and records every sent message.
+"""
+
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Bench",
+    "username": "bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class FakeTelegram:
+    """In-process fake of api.telegram.org."""
+
+    def __init__(self, token="123456:bench"):
+        self.token = token
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.sent = []  # (received_at, params) for every sendMessage
+        self.calls = {}  # method -> call count
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._server = None
+
+    @property
+    def base_url(self):
+        """Base URL to pass to ApplicationBuilder.base_url()."""
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def api_url(self):
+        """Base URL for raw Bot API calls (token included)."""
+        return f"{self.base_url}{self.token}"
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        """Start serving on a free local port in a background thread."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                fake._handle(self)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # ---- Update injection ------------------------------------------------
+
+    def make_update(self, chat_id, text):
+        """Build a private-chat message update."""
+        update = {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+                "text": text,
+            },
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            update["message"]["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        return update
+
+    def push_update(self, chat_id, text, secret=None):
+        """
+        Deliver an update the way Telegram would.
+
+        With a webhook registered, POSTs it to the bot; otherwise queues it
+        for the next getUpdates call. Blocking - call from a worker thread
+        when the bot runs on the same event loop.
+
+        Returns:
+            int: HTTP status from the webhook, or None when queued for polling
+        """
+        update = self.make_update(chat_id, text)
+        if self.webhook_url:
+            request = urllib.request.Request(
+                self.webhook_url,
+                data=json.dumps(update).encode(),
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Telegram-Bot-Api-Secret-Token": secret if secret is not None else (self.webhook_secret or ""),
+                },
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=10) as resp:
+                    return resp.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        with self._cond:
+            self._updates.append(update)
+            self._cond.notify_all()
+        return None
+
+    def wait_for_message(self, chat_id, timeout=10.0):
+        """
+        Block until a message is sent to chat_id.
+
+        Returns:
+            float: time.perf_counter() when the sendMessage request arrived
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for received_at, params in self.sent:
+                    if str(params.get("chat_id")) == str(chat_id):
+                        return received_at
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No message to {chat_id} within {timeout}s")
+                self._cond.wait(remaining)
+
+    # ---- Bot API ---------------------------------------------------------
+
+    def _handle(self, request):
+        received_at = time.perf_counter()
+        method = request.path.rsplit("/", 1)[-1]
+        params = self._read_params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            result = self._get_updates(params)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+            result = True
+        elif method == "sendMessage":
+            result = self._send_message(received_at, params)
+        else:
+            result = True
+
+        body = json.dumps({"ok": True, "result": result}).encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    @staticmethod
+    def _read_params(request):
+        length = int(request.headers.get("Content-Length", 0))
+        raw = request.rfile.read(length).decode() if length else ""
+        if not raw:
+            return {}
+        if "json" in request.headers.get("Content-Type", ""):
+            return json.loads(raw)
+        params = {}
+        for key, values in parse_qs(raw).items():
+            value = values[0]
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return list(self._updates)
+
+    def _send_message(self, received_at, params):
+        with self._cond:
+            self.sent.append((received_at, params))
+            self._cond.notify_all()
+        chat_id = str(params.get("chat_id", 0))
+        # Channels can be addressed by @username
+        chat = {"id": -1, "type": "channel", "username": chat_id[1:]} if chat_id.startswith("@") \
+            else {"id": int(chat_id), "type": "private"}
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
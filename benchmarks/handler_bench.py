@@ -0,0 +1,305 @@
+"""
+Per-command micro-benchmark for the bot.py command handlers.
+Calls each PTB handler directly with synthetic Update and Context objects
+and a recording fake bot, over registries of several sizes, and reports
+per-command latency, allocations (tracemalloc), registry reads/writes and
+messages sent. Results can be saved as a baseline and compared later.
+
+Usage:
+    python benchmarks/handler_bench.py --sizes 1000 100000
+    python benchmarks/handler_bench.py --sizes 1000 100000 1000000 --backend sqlite
+    python benchmarks/handler_bench.py --save-baseline handler_baseline.json
+    python benchmarks/handler_bench.py --baseline handler_baseline.json --tolerance 1.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ADMIN_CHAT_ID = 1
+FIRST_USER_ID = 10000
+NEW_USER_ID = 50_000_000
+
+READS = {"get", "get_many", "load_all", "load_pending", "iter_all", "iter_pending", "count"}
+WRITES = {"put", "put_many", "remove", "remove_many", "mark_notified_many"}
+
+
+class RecordingBot:
+    """Stands in for telegram.Bot: records every message instead of sending it."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+class CountingStore:
+    """Wraps a registry store and counts read and write calls."""
+
+    def __init__(self, store):
+        self._store = store
+        self.reads = 0
+        self.writes = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name not in READS and name not in WRITES:
+            return attr
+
+        def counted(*args, **kwargs):
+            if name in READS:
+                self.reads += 1
+            else:
+                self.writes += 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+def make_update(bot, update_id, chat_id, text):
+    """A private-chat command message, as PTB would deserialize it."""
+    from telegram import Update
+
+    command = text.split()[0]
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User", "username": f"user{chat_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }, bot)
+
+
+def configure(workdir, backend):
+    """Environment for importing bot.py against a scratch directory."""
+    os.chdir(workdir)
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "STORAGE_BACKEND": backend,
+        "SQLITE_PATH": os.path.join(workdir, "tracked_users.db"),
+        "HISTORY_FILE": os.path.join(workdir, "stock_history.bin"),
+        "BROADCAST_STATS_FILE": os.path.join(workdir, "broadcast_stats.json"),
+        "ADMIN_CHAT_IDS": str(ADMIN_CHAT_ID),
+        "CHECK_RATE_PER_CHAT": "0",
+        "CHECK_RATE_GLOBAL": "0",
+        "STOCK_CACHE_TTL": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+
+
+def fresh_registry(bot, backend, workdir, size):
+    """Point bot.py at a new registry of `size` pending users and build its counters."""
+    from counters import FileCounters
+    from registry import create_store
+
+    path = os.path.join(workdir, f"users-{size}")
+    store = create_store(backend, path + ".json", path + ".db")
+    tracked_at = datetime.now().isoformat()
+    for start in range(FIRST_USER_ID, FIRST_USER_ID + size, 10000):
+        store.put_many({
+            str(chat_id): {"username": f"user{chat_id}", "tracked_at": tracked_at, "notified": False,
+                           "filters": None, "channel": True}
+            for chat_id in range(start, min(start + 10000, FIRST_USER_ID + size))
+        })
+
+    bot._store = CountingStore(store)
+    bot._counters = FileCounters(path + "_stats.json", bot.load_tracked_users)
+    bot._subscription_index = None
+    bot.get_subscriber_stats()
+    return bot._store
+
+
+def stub_check(bot):
+    """Replace the StanShop fetch with a canned result."""
+    def check_availability():
+        return {
+            "available": False,
+            "denominations": [],
+            "message": "📭 No PhonePe vouchers currently available",
+            "check_time": datetime.now(),
+            "error": False,
+        }
+
+    bot.check_availability = check_availability
+
+
+def scenarios(size):
+    """
+    (name, handler name, text, chat id for iteration i) per measured command.
+    Tracked users are existing ids; new users get ids outside the registry.
+    """
+    existing = lambda i: FIRST_USER_ID + (i * 7919) % size
+    new = lambda i: NEW_USER_ID + i
+    return [
+        ("start", "start_command", "/start", existing),
+        ("help", "help_command", "/help", existing),
+        ("status (tracking)", "status_command", "/status", existing),
+        ("status (not tracking)", "status_command", "/status", new),
+        ("track (already)", "track_command", "/track", existing),
+        ("track (new)", "track_command", "/track", new),
+        ("track (filters)", "track_command", "/track 500 max=480", existing),
+        ("untrack", "untrack_command", "/untrack", new),
+        ("untrack (not tracking)", "untrack_command", "/untrack", lambda i: NEW_USER_ID * 2 + i),
+        ("check", "check_command", "/check", existing),
+        ("history", "history_command", "/history", existing),
+        ("stats (admin)", "stats_command", "/stats", lambda i: ADMIN_CHAT_ID),
+    ]
+
+
+async def measure(bot, store, handler, text, chat_for, iterations, max_seconds, alloc_iterations):
+    """
+    Run one command repeatedly.
+
+    Returns:
+        dict: p50/p95 latency (ms), peak allocation (KiB), and per-call
+            registry reads, writes and messages sent
+    """
+    fake = RecordingBot()
+    args = text.split()[1:]
+    latencies = []
+    reads, writes = store.reads, store.writes
+    deadline = time.perf_counter() + max_seconds
+
+    for i in range(iterations):
+        update = make_update(fake, i + 1, chat_for(i), text)
+        context = SimpleNamespace(args=args, bot=fake)
+        started = time.perf_counter()
+        await handler(update, context)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if i >= 2 and time.perf_counter() > deadline:
+            break
+    calls = len(latencies)
+    result = {
+        "calls": calls,
+        "p50": statistics.median(latencies),
+        "p95": sorted(latencies)[max(0, int(calls * 0.95) - 1)],
+        "reads": (store.reads - reads) / calls,
+        "writes": (store.writes - writes) / calls,
+        "messages": len(fake.sent) / calls,
+    }
+
+    # Allocations are traced in a separate, shorter pass since tracing slows everything down
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(calls, calls + min(alloc_iterations, calls)):
+            update = make_update(fake, i + 1, chat_for(i), text)
+            context = SimpleNamespace(args=args, bot=fake)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            await handler(update, context)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    result["peak_kib"] = statistics.mean(peaks) / 1024 if peaks else 0.0
+    return result
+
+
+async def run(args, workdir):
+    configure(workdir, args.backend)
+    import bot
+    stub_check(bot)
+
+    results = {}
+    for size in args.sizes:
+        started = time.perf_counter()
+        store = fresh_registry(bot, args.backend, workdir, size)
+        print(f"\n{size} users ({args.backend}, seeded in {time.perf_counter() - started:.1f}s)")
+        print(f"  {'command':24s}{'p50 ms':>9s}{'p95 ms':>9s}{'peak KiB':>10s}{'reads':>7s}{'writes':>7s}{'msgs':>6s}")
+        results[str(size)] = {}
+        for name, handler_name, text, chat_for in scenarios(size):
+            result = await measure(bot, store, getattr(bot, handler_name), text, chat_for,
+                                   args.iterations, args.max_seconds, args.alloc_iterations)
+            results[str(size)][name] = result
+            print(f"  {name:24s}{result['p50']:9.3f}{result['p95']:9.3f}{result['peak_kib']:10.1f}"
+                  f"{result['reads']:7.1f}{result['writes']:7.1f}{result['messages']:6.1f}")
+    return results
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """
+    Compare results with a saved baseline.
+
+    Returns:
+        int: Number of regressions (slower than tolerance x baseline p50 by
+             more than min_ms, or more registry reads/writes per call)
+    """
+    regressions = 0
+    print(f"\nAgainst baseline (tolerance {tolerance:g}x p50)")
+    for size, commands in results.items():
+        for name, result in commands.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            ratio = result["p50"] / base["p50"] if base["p50"] else 1.0
+            problems = []
+            if ratio > tolerance and result["p50"] - base["p50"] > min_ms:
+                problems.append(f"p50 {ratio:.2f}x")
+            for field in ("reads", "writes"):
+                if result[field] > base[field]:
+                    problems.append(f"{field} {base[field]:g} -> {result[field]:g}")
+            if problems:
+                regressions += 1
+                print(f"  ✗ {size:>8s} {name:24s} {', '.join(problems)}")
+            else:
+                print(f"  ✓ {size:>8s} {name:24s} p50 {ratio:.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 100000])
+    parser.add_argument("--backend", choices=["file", "sqlite"], default="file")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per command (at most)")
+    parser.add_argument("--max-seconds", type=float, default=5, help="Stop a command's loop after this long")
+    parser.add_argument("--alloc-iterations", type=int, default=20, help="Calls traced with tracemalloc")
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed p50 slowdown vs the baseline")
+    parser.add_argument("--min-ms", type=float, default=0.1, help="Ignore p50 slowdowns smaller than this")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="handler-bench-")
+    try:
+        results = asyncio.run(run(args, workdir))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump({"backend": args.backend, "results": results}, f, indent=2)
+        print(f"\nSaved baseline to {save_path}")
+    if baseline is not None:
+        if baseline.get("backend") != args.backend:
+            print(f"\nNote: baseline was measured with the {baseline.get('backend')} backend")
+        return 1 if compare(results, baseline["results"], args.tolerance, args.min_ms) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Cold-start import time benchmark for the Vercel functions.
+Runs `python -X importtime` for each entry module in a fresh interpreter
+and fails if any module's cumulative import time exceeds its budget.
+
+Usage:
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --runs 10 --budget api.webhook=80
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import budget per module, in milliseconds
+DEFAULT_BUDGETS = {
+    "api.webhook": 100,
+    "api.cron": 100,
+    "api.storage": 40,
+    "api.stock_cache": 40,
+}
+
+
+def measure_import(module, env=None):
+    """
+    Import a module in a fresh interpreter and parse the importtime report.
+
+    Args:
+        module: Dotted module name to import
+        env: Environment for the child process
+
+    Returns:
+        tuple: (cumulative_us for the module, list of (cumulative_us, name) for its imports)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    total = None
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(parts[1].strip())
+        except ValueError:
+            continue  # Header line
+        name = parts[2].rstrip()
+        entries.append((cumulative, name.strip()))
+        if name.strip() == module and not name.startswith("  "):
+            total = cumulative
+    if total is None:
+        raise RuntimeError(f"No importtime entry found for {module}")
+    return total, entries
+
+
+def parse_budgets(values):
+    """Parse --budget module=ms overrides on top of the defaults."""
+    budgets = dict(DEFAULT_BUDGETS)
+    for value in values or []:
+        module, _, ms = value.partition("=")
+        budgets[module] = float(ms)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per module (best is reported)")
+    parser.add_argument("--budget", action="append", help="Override a budget, e.g. api.cron=80")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per module")
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    env = dict(os.environ, VERCEL="1")
+    failed = False
+
+    for module, budget_ms in budgets.items():
+        runs = [measure_import(module, env) for _ in range(args.runs)]
+        total_us, entries = min(runs, key=lambda run: run[0])
+        total_ms = total_us / 1000
+        ok = total_ms <= budget_ms
+        failed = failed or not ok
+
+        print(f"{'OK  ' if ok else 'FAIL'} {module}: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+        for cumulative, name in sorted(entries, reverse=True)[1:args.top + 1]:
+            print(f"       {cumulative / 1000:7.1f} ms  {name}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
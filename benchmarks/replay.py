@@ -0,0 +1,307 @@
+"""
+End-to-end replay of recorded StanShop inventory through the bot.
+Recorded inventory snapshots are served by a local StanShop stand-in on a
+virtual clock, the real APScheduler check trigger decides when to poll, and
+each check goes through the real check -> notify path against local Telegram
+and KV stand-ins, so days of polling run in seconds. Reports detection
+latency, upstream requests and send volume.
+
+Usage:
+    python benchmarks/replay.py record --out inventory.ndjson --interval 300 --hours 24
+    python benchmarks/replay.py from-history --out inventory.ndjson
+    python benchmarks/replay.py run --fixture inventory.ndjson --schedule fixed --interval 3600
+    python benchmarks/replay.py run --fixture inventory.ndjson --schedule predictive --store kv
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_kv import FakeKV
+from fake_stanshop import FakeStanShop, load_fixture, snapshot_available
+from fake_telegram import FakeTelegram
+
+
+class VirtualClock:
+    """Simulated time shared by the trigger loop and the StanShop stand-in."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def datetime(self):
+        return datetime.fromtimestamp(self.now, tz=timezone.utc)
+
+
+def restocks(snapshots):
+    """(restocked_at, sold_out_at) pairs in a fixture; sold_out_at is None if still in stock."""
+    events, start = [], None
+    for snapshot in snapshots:
+        available = snapshot_available(snapshot)
+        if available and start is None:
+            start = snapshot["t"]
+        elif not available and start is not None:
+            events.append((start, snapshot["t"]))
+            start = None
+    if start is not None:
+        events.append((start, None))
+    return events
+
+
+# ---- Fixtures ----------------------------------------------------------------
+
+def record(args):
+    """Poll the live API and append each response to the fixture."""
+    from monitor import fetch_inventory
+
+    deadline = time.time() + args.hours * 3600
+    with open(args.out, "a") as f:
+        while time.time() < deadline:
+            snapshot = fetch_inventory()
+            body = snapshot.to_body() if snapshot is not None else None
+            f.write(json.dumps({"t": time.time(), "body": body}) + "\n")
+            f.flush()
+            print(f"Recorded snapshot ({'ok' if snapshot is not None else 'error'})")
+            time.sleep(args.interval)
+    return 0
+
+
+def from_history(args):
+    """Turn the stock history log into a fixture, one snapshot per check."""
+    from history import HistoryLog
+
+    count = 0
+    with HistoryLog(args.history) as log, open(args.out, "w") as f:
+        for timestamp, records in log.iter_checks():
+            denominations = [
+                {"value": r.denomination, "price": r.price / 100, "discount": r.discount / 100}
+                for r in records if r.available
+            ]
+            body = {"inventory": {"stanValueDenomination": denominations}}
+            f.write(json.dumps({"t": timestamp, "body": body}) + "\n")
+            count += 1
+    print(f"Wrote {count} snapshots to {args.out}")
+    return 0
+
+
+# ---- Replay ------------------------------------------------------------------
+
+def seed_users(store, count):
+    """Put `count` pending subscribers without filters into the registry store."""
+    tracked_at = datetime.now().isoformat()
+    store.put_many({
+        str(10000 + i): {"username": f"user{i}", "tracked_at": tracked_at, "notified": False,
+                          "filters": None, "channel": True}
+        for i in range(count)
+    })
+
+
+def build_trigger(args, clock):
+    """The same trigger scheduler.py would build, anchored to the virtual clock."""
+    from apscheduler.triggers.interval import IntervalTrigger
+    from predictor import PlanTrigger, build_plan, describe_plan, learn_probabilities
+
+    if args.schedule == "predictive":
+        plan = build_plan(learn_probabilities(args.history))
+        print(f"Plan: {describe_plan(plan)}")
+        return PlanTrigger(plan)
+    return IntervalTrigger(seconds=args.interval, start_date=clock.datetime(), timezone=timezone.utc)
+
+
+async def replay(args, snapshots, workdir):
+    """
+    Drive the check trigger over the fixture's time span.
+
+    Returns:
+        dict: Detection times, check count and the stand-ins used
+    """
+    start, end = snapshots[0]["t"], snapshots[-1]["t"]
+    if args.days:
+        end = min(end, start + args.days * 86400)
+    clock = VirtualClock(start)
+
+    stanshop = FakeStanShop(snapshots, clock).start()
+    telegram = FakeTelegram().start()
+    kv = FakeKV().start() if args.store == "kv" else None
+
+    # Configuration is read at import time, so set it up before importing the bot
+    os.chdir(workdir)
+    os.environ["HISTORY_FILE"] = os.path.join(workdir, "stock_history.bin")
+    os.environ["TELEGRAM_BOT_TOKEN"] = telegram.token
+    if kv is not None:
+        os.environ["KV_REST_API_URL"] = kv.url
+        os.environ["KV_REST_API_TOKEN"] = kv.token
+
+    import monitor
+    monitor.STANSHOP_API_URL = stanshop.url
+
+    detections = []
+    detect = monitor.detect_stock_change
+
+    def detect_and_record(status):
+        result = detect(status)
+        if result["changed"]:
+            detections.append(clock.now)
+        return result
+
+    monitor.detect_stock_change = detect_and_record
+
+    if args.store == "kv":
+        from api import cron
+        cron.TELEGRAM_API = telegram.api_url
+        from api.storage import get_store
+        run_check = cron.run_stock_check
+        store = get_store()
+        app = None
+    else:
+        from telegram.ext import Application
+        import bot
+        bot.detect_stock_change = detect_and_record
+        app = Application.builder().token(telegram.token).base_url(telegram.base_url).build()
+        await app.initialize()
+        bot._application = app
+        run_check = bot.scheduled_check
+        store = bot._store
+    logging.getLogger().setLevel(logging.WARNING)
+
+    seed_users(store, args.users)
+    trigger = build_trigger(args, clock)
+    checks, previous = 0, None
+    started = time.perf_counter()
+    try:
+        while True:
+            fire = trigger.get_next_fire_time(previous, clock.datetime())
+            if fire is None or fire.timestamp() > end:
+                break
+            clock.now = fire.timestamp()
+            found = len(detections)
+            await run_check()
+            checks += 1
+            previous = fire
+            if len(detections) > found and args.retrack:
+                # Subscribers re-enable tracking before the next restock
+                seed_users(store, args.users)
+                if kv is not None:
+                    kv.execute("DEL", "tracked_users_stats")
+                else:
+                    bot._subscription_index = None
+                    if os.path.exists(bot.TRACKED_USERS_STATS_FILE):
+                        os.remove(bot.TRACKED_USERS_STATS_FILE)
+    finally:
+        wall = time.perf_counter() - started
+        if app is not None:
+            await app.shutdown()
+        stanshop.stop()
+        telegram.stop()
+        if kv is not None:
+            kv.stop()
+
+    return {
+        "start": start, "end": end, "wall": wall, "checks": checks,
+        "detections": detections, "stanshop": stanshop, "telegram": telegram, "kv": kv,
+    }
+
+
+def report(args, snapshots, result):
+    days = (result["end"] - result["start"]) / 86400
+    events = [e for e in restocks(snapshots) if e[0] <= result["end"]]
+
+    latencies, missed = [], 0
+    for restocked_at, sold_out_at in events:
+        hits = [d for d in result["detections"]
+                if d >= restocked_at and (sold_out_at is None or d < sold_out_at)]
+        if hits:
+            latencies.append(hits[0] - restocked_at)
+        else:
+            missed += 1
+
+    schedule = f"fixed every {args.interval:g}s" if args.schedule == "fixed" else "predictive"
+    print(f"Replayed {days:.1f} days ({len(snapshots)} snapshots, {len(events)} restocks), "
+          f"{schedule}, store={args.store}, {args.users} users")
+    per_day = f", {result['checks'] / days:.1f}/day" if days else ""
+    print(f"  checks             {result['checks']} in {result['wall']:.1f}s wall{per_day}")
+
+    stanshop = result["stanshop"]
+    methods = ", ".join(f"{m} {n}" for m, n in sorted(stanshop.calls.items()))
+    print(f"  upstream requests  {stanshop.requests} ({methods}; 304s {stanshop.not_modified})")
+
+    if latencies:
+        ordered = sorted(latencies)
+        p90 = ordered[max(0, int(len(ordered) * 0.9) - 1)]
+        print(f"  detected           {len(latencies)}/{len(events)}  latency p50 "
+              f"{statistics.median(ordered) / 60:.1f} min  p90 {p90 / 60:.1f} min  max {ordered[-1] / 60:.1f} min")
+    else:
+        print(f"  detected           0/{len(events)}")
+    if missed:
+        print(f"  missed             {missed} (sold out before the next check)")
+
+    telegram = result["telegram"]
+    calls = ", ".join(f"{m} {n}" for m, n in sorted(telegram.calls.items()))
+    print(f"  sends              {len(telegram.sent)} messages ({calls or 'no Bot API calls'})")
+    if result["kv"] is not None:
+        commands = ", ".join(f"{c} {n}" for c, n in sorted(result["kv"].calls.items()))
+        print(f"  kv commands        {sum(result['kv'].calls.values())} ({commands})")
+
+
+def run(args):
+    snapshots = load_fixture(args.fixture)
+    if not snapshots:
+        print(f"No snapshots in {args.fixture}")
+        return 1
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    try:
+        result = asyncio.run(replay(args, snapshots, workdir))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    report(args, snapshots, result)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="Record live inventory responses")
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--interval", type=float, default=300, help="Seconds between snapshots")
+    rec.add_argument("--hours", type=float, default=24)
+    rec.set_defaults(func=record)
+
+    hist = commands.add_parser("from-history", help="Build a fixture from the stock history log")
+    hist.add_argument("--out", required=True)
+    hist.add_argument("--history", default=os.path.join(ROOT, "stock_history.bin"))
+    hist.set_defaults(func=from_history)
+
+    rep = commands.add_parser("run", help="Replay a fixture through the bot")
+    rep.add_argument("--fixture", required=True)
+    rep.add_argument("--schedule", choices=["fixed", "predictive"], default="fixed")
+    rep.add_argument("--interval", type=float, default=3600, help="Seconds between fixed checks")
+    rep.add_argument("--history", default=os.path.join(ROOT, "stock_history.bin"),
+                     help="History log the predictive plan is learned from")
+    rep.add_argument("--store", choices=["file", "kv"], default="file",
+                     help="file: bot pipeline with STORAGE_BACKEND's store; kv: serverless cron with the KV hash")
+    rep.add_argument("--users", type=int, default=100)
+    rep.add_argument("--days", type=float, help="Replay only the first N days of the fixture")
+    rep.add_argument("--no-retrack", dest="retrack", action="store_false",
+                     help="Don't re-enable tracking for notified users after each restock")
+    rep.set_defaults(func=run)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Registry storage conformance and throughput benchmark.
+Runs the same behaviour checks against every registry backend (file,
+SQLite, and the KV hash against a local KV stand-in), then measures
+operations per second for each at several registry sizes.
+
+Usage:
+    python benchmarks/storage_bench.py
+    python benchmarks/storage_bench.py --backends file sqlite --sizes 1000 10000 100000 --ops 500
+    python benchmarks/storage_bench.py --conformance-only
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_kv import FakeKV
+
+
+def make_record(i, notified=False):
+    return {
+        "username": f"user{i}",
+        "tracked_at": "2024-01-01T00:00:00",
+        "notified": notified,
+        "filters": {"denominations": [500], "max_price": 490} if i % 4 == 0 else None,
+    }
+
+
+class Backends:
+    """Creates empty stores of each kind; KV stores share one local stand-in."""
+
+    def __init__(self):
+        self.workdir = tempfile.mkdtemp(prefix="storage-bench-")
+        self.kv = None
+        self._count = 0
+
+    def create(self, kind):
+        from registry import FileStore, SQLiteStore, KVStore
+
+        self._count += 1
+        if kind == "file":
+            return FileStore(os.path.join(self.workdir, f"users{self._count}.json"))
+        if kind == "sqlite":
+            return SQLiteStore(os.path.join(self.workdir, f"users{self._count}.db"))
+        if self.kv is None:
+            # api.stock_cache reads the KV settings at import time
+            self.kv = FakeKV().start()
+            os.environ["KV_REST_API_URL"] = self.kv.url
+            os.environ["KV_REST_API_TOKEN"] = self.kv.token
+        return KVStore(f"bench:{self._count}", legacy_key=None)
+
+    def close(self):
+        if self.kv is not None:
+            self.kv.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# ---- Conformance ---------------------------------------------------------------
+
+def conformance(store):
+    """
+    Check the storage protocol's behaviour on an empty store.
+
+    Returns:
+        list: Descriptions of failed checks
+    """
+    failures = []
+
+    def expect(name, actual, expected):
+        if actual != expected:
+            failures.append(f"{name}: expected {expected!r}, got {actual!r}")
+
+    expect("count of empty store", store.count(), 0)
+    expect("get missing", store.get(1), None)
+    expect("get_many missing", store.get_many([1, 2]), {})
+
+    expect("put new returns None", store.put(1, make_record(1)), None)
+    expect("put replace returns previous", store.put(1, make_record(1, notified=True)), make_record(1))
+    expect("int and str ids are the same user", store.get("1"), make_record(1, notified=True))
+
+    expect("put_many returns previous", store.put_many({str(i): make_record(i) for i in range(1, 6)}),
+           {"1": make_record(1, notified=True), "2": None, "3": None, "4": None, "5": None})
+    expect("get_many skips missing", store.get_many([2, 3, 99]), {"2": make_record(2), "3": make_record(3)})
+    expect("count", store.count(), 5)
+
+    expect("mark_notified_many returns changed", store.mark_notified_many([2, 3, 99]),
+           {"2": make_record(2), "3": make_record(3)})
+    expect("mark_notified_many skips notified", store.mark_notified_many([2]), {})
+    expect("mark_notified_many updates record", store.get(2), make_record(2, notified=True))
+
+    pending = [chat_id for chunk in store.iter_pending(2) for chat_id, _ in chunk]
+    expect("iter_pending", sorted(pending), ["1", "4", "5"])
+    expect("iter_pending chunk size", max(len(chunk) for chunk in store.iter_pending(2)), 2)
+    expect("load_pending", sorted(store.load_pending()), ["1", "4", "5"])
+    expect("iter_all", sorted(chat_id for chunk in store.iter_all(2) for chat_id, _ in chunk),
+           ["1", "2", "3", "4", "5"])
+    expect("load_all", store.load_all()["3"], make_record(3, notified=True))
+
+    expect("remove returns previous", store.remove(4), make_record(4))
+    expect("remove missing returns None", store.remove(4), None)
+    expect("remove_many returns existing", store.remove_many([5, 99]), {"5": make_record(5)})
+    expect("count after removes", store.count(), 3)
+    return failures
+
+
+def run_conformance(kinds, backends=None):
+    """
+    Run the conformance checks against each backend and print the results.
+
+    Args:
+        kinds: Backend names ("file", "sqlite", "kv")
+        backends: Backends to create stores from; a temporary one is used if omitted
+
+    Returns:
+        bool: True if every backend passed
+    """
+    owned = backends is None
+    backends = backends or Backends()
+    try:
+        passed = True
+        for kind in kinds:
+            failures = conformance(backends.create(kind))
+            passed = passed and not failures
+            print(f"{kind:7s} conformance: {'ok' if not failures else f'{len(failures)} failed'}")
+            for failure in failures:
+                print(f"  ✗ {failure}")
+        return passed
+    finally:
+        if owned:
+            backends.close()
+
+
+# ---- Throughput ----------------------------------------------------------------
+
+def timed(ops, fn):
+    """Run fn once and return operations per second for `ops` operations."""
+    started = time.perf_counter()
+    fn()
+    return ops / max(time.perf_counter() - started, 1e-9)
+
+
+def throughput(store, size, ops, chunk_size):
+    """
+    Measure one backend at one registry size.
+
+    Returns:
+        dict: Operation -> operations (records for batch ops) per second
+    """
+    ids = [str(i) for i in range(size)]
+    results = {}
+
+    def seed():
+        for start in range(0, size, chunk_size):
+            store.put_many({chat_id: make_record(int(chat_id)) for chat_id in ids[start:start + chunk_size]})
+
+    results["seed (records/s)"] = timed(size, seed)
+
+    sample = [random.choice(ids) for _ in range(ops)]
+    results["get"] = timed(ops, lambda: [store.get(chat_id) for chat_id in sample])
+    results["get_many (records/s)"] = timed(ops * 10, lambda: [
+        store.get_many(random.sample(ids, min(100, size))) for _ in range(ops // 10 or 1)
+    ])
+    results["put"] = timed(ops, lambda: [store.put(chat_id, make_record(int(chat_id))) for chat_id in sample])
+    results["iter_pending (records/s)"] = timed(size, lambda: sum(len(c) for c in store.iter_pending(chunk_size)))
+
+    def mark_all():
+        for start in range(0, size, chunk_size):
+            store.mark_notified_many(ids[start:start + chunk_size])
+
+    results["mark_notified_many (records/s)"] = timed(size, mark_all)
+    results["remove"] = timed(ops, lambda: [store.remove(chat_id) for chat_id in sample])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=["file", "sqlite", "kv"], default=["file", "sqlite", "kv"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--ops", type=int, default=200, help="Single-record operations per measurement")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--conformance-only", action="store_true", help="Run the behaviour checks and skip throughput")
+    args = parser.parse_args()
+
+    backends = Backends()
+    try:
+        if not run_conformance(args.backends, backends):
+            return 1
+        if args.conformance_only:
+            return 0
+
+        for size in args.sizes:
+            print(f"\n{size} users ({args.ops} single-record ops, chunks of {args.chunk_size})")
+            results = {kind: throughput(backends.create(kind), size, args.ops, args.chunk_size)
+                       for kind in args.backends}
+            print(f"  {'ops/s':32s}" + "".join(f"{kind:>12s}" for kind in args.backends))
+            for operation in next(iter(results.values())):
+                print(f"  {operation:32s}" + "".join(f"{results[kind][operation]:12,.0f}" for kind in args.backends))
+    finally:
+        backends.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Command latency benchmark: polling vs webhook update delivery.
+Runs the bot's real /start handler against a local Telegram stand-in and
+measures the time from an update arriving at "Telegram" to the bot's
+reply reaching it, once per delivery mode.
+
+Usage:
+    python benchmarks/update_latency.py --rounds 200
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram.ext import Application, CommandHandler
+
+from bot import start_command, start_receiving_updates
+from fake_telegram import FakeTelegram
+
+WEBHOOK_SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def measure(mode, rounds):
+    """
+    Measure command round-trip latency for one delivery mode.
+
+    Returns:
+        list: Latencies in milliseconds
+    """
+    fake = FakeTelegram().start()
+    loop = asyncio.get_running_loop()
+
+    app = Application.builder().token(fake.token).base_url(fake.base_url).build()
+    app.add_handler(CommandHandler("start", start_command))
+    await app.initialize()
+    await app.start()
+
+    port = free_port()
+    await start_receiving_updates(
+        app,
+        mode=mode,
+        webhook_url=f"http://127.0.0.1:{port}",
+        listen="127.0.0.1",
+        port=port,
+        secret_token=WEBHOOK_SECRET,
+    )
+
+    if mode == "webhook":
+        status = await loop.run_in_executor(None, lambda: fake.push_update(1, "/start", secret="wrong"))
+        print(f"  webhook with wrong secret token -> HTTP {status}")
+
+    latencies = []
+    try:
+        # First round warms connections and is not counted
+        for chat_id in range(1000, 1000 + rounds + 1):
+            started = time.perf_counter()
+            await loop.run_in_executor(None, fake.push_update, chat_id, "/start")
+            replied = await loop.run_in_executor(None, fake.wait_for_message, chat_id)
+            if chat_id > 1000:
+                latencies.append((replied - started) * 1000)
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        fake.stop()
+
+    return latencies
+
+
+def summarize(mode, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(
+        f"{mode:8s} n={len(ordered)}  mean={statistics.mean(ordered):6.2f} ms  "
+        f"p50={statistics.median(ordered):6.2f} ms  p95={p95:6.2f} ms  max={ordered[-1]:6.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--modes", nargs="+", default=["polling", "webhook"])
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        print(f"Measuring {mode}...")
+        results[mode] = await measure(mode, args.rounds)
+
+    print()
+    for mode, latencies in results.items():
+        summarize(mode, latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -5,96 +5,217 @@ Users must use /track to register for notifications.
 """
 
 import asyncio
-import json
 import logging
-import os
+import threading
+import time
 from datetime import datetime
+from itertools import islice
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, ContextTypes, TypeHandler
 from telegram.constants import ParseMode
-
-from config import TELEGRAM_BOT_TOKEN, STANSHOP_PRODUCT_URL, validate_config
-from monitor import check_availability, get_last_check_time, check_for_stock_change
-
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
+from telegram.error import Forbidden, RetryAfter
+
+from config import (
+    TELEGRAM_BOT_TOKEN, STANSHOP_PRODUCT_URL, validate_config,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET,
+    ALLOWED_UPDATES,
+    PIPELINE_QUEUE_SIZE, PIPELINE_CHUNK_SIZE, PIPELINE_SEND_CONCURRENCY,
+    ADMIN_CHAT_IDS, REVALIDATE_INTERVAL, STORAGE_BACKEND, SQLITE_PATH,
+    CHECK_RATE_WINDOW, CHECK_RATE_PER_CHAT, CHECK_RATE_GLOBAL, STOCK_CACHE_TTL,
+    BROADCAST_CHANNEL_ID, BROADCAST_CHANNEL_URL,
+)
+from monitor import (
+    check_availability, get_last_check_time, get_last_status, detect_stock_change, revalidate_stock,
+    get_breaker_state
 )
+from resilience import OPEN
+from pipeline import Pipeline, Stage, format_stats
+from slo import BroadcastTracker, over_budget, format_summary, save_summary, load_summaries
+from history import get_summary
+from prewarm import format_warmups
+from logsetup import setup_logging, sample, dropped_records
+from subscriptions import SubscriptionIndex, parse_filters, format_filters
+from registry import create_store
+from ratelimit import SlidingWindowLimiter, format_limited
+from fanout import channel_link, parse_delivery, split_recipients, format_delivery
+from counters import FileCounters, transition_deltas, merge_deltas, format_stats as format_subscriber_stats
+
+# Configure logging (queued, written by a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Bot instance (set during initialization)
 _application = None
 
-# File to store tracked users
+# Newest update id seen, saved in the warm-restart checkpoint
+_last_update_id = None
+
+# File to store tracked users (also seeds the sqlite backend on first use)
 TRACKED_USERS_FILE = "tracked_users.json"
 
+# Aggregate counters kept next to the registry
+TRACKED_USERS_STATS_FILE = "tracked_users_stats.json"
+
+# Index of pending subscriptions, built on first use and kept in step with the registry
+_subscription_index = None
+
+# Registry backend selected by STORAGE_BACKEND
+_store = create_store(STORAGE_BACKEND, TRACKED_USERS_FILE, SQLITE_PATH)
+
+# SQLite and KV registries are also written by other processes (e.g. the
+# Vercel webhook), so the index is rebuilt from them for each broadcast
+_SHARED_REGISTRY = STORAGE_BACKEND != "file"
+
 
 def load_tracked_users():
-    """Load tracked users from file."""
-    if os.path.exists(TRACKED_USERS_FILE):
-        try:
-            with open(TRACKED_USERS_FILE, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
-
-
-def save_tracked_users(users):
-    """Save tracked users to file."""
-    with open(TRACKED_USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
-
-
-def add_tracked_user(chat_id, username=None):
-    """Add a user to tracking list."""
-    users = load_tracked_users()
-    users[str(chat_id)] = {
-        "username": username,
-        "tracked_at": datetime.now().isoformat(),
-        "notified": False
-    }
-    save_tracked_users(users)
-
-
-def remove_tracked_user(chat_id):
-    """Remove a user from tracking list."""
-    users = load_tracked_users()
-    if str(chat_id) in users:
-        del users[str(chat_id)]
-        save_tracked_users(users)
+    """Load all tracked users from the registry."""
+    return _store.load_all()
+
+
+_counters = FileCounters(TRACKED_USERS_STATS_FILE, load_tracked_users)
+
+# Keeps registry writes, counters and the index in step (batched writes run in a worker thread)
+_registry_lock = threading.RLock()
+
+
+def get_subscription_index(refresh=False):
+    """
+    Get the pending subscription index, building it from the registry once.
+    
+    Args:
+        refresh: Rebuild it from the registry even if it was already built
+    """
+    global _subscription_index
+    with _registry_lock:
+        if _subscription_index is None or refresh:
+            _subscription_index = SubscriptionIndex.from_users(_store.load_pending())
+        return _subscription_index
+
+
+def add_tracked_user(chat_id, username=None, filters=None, channel=True):
+    """
+    Add a user to tracking list.
+    
+    Args:
+        chat_id: User's chat id
+        username: Telegram username, if any
+        filters: Alert filters from parse_filters() (None for any voucher)
+        channel: Whether the broadcast channel post may stand in for this user's DM
+    """
+    with _registry_lock:
+        record = {
+            "username": username,
+            "tracked_at": datetime.now().isoformat(),
+            "notified": False,
+            "filters": filters,
+            "channel": channel
+        }
+        previous = _store.put(chat_id, record)
+        _counters.apply(transition_deltas(previous, record))
+        if _subscription_index is not None:
+            _subscription_index.add(chat_id, filters)
+
+
+def remove_tracked_user(chat_id, pruned=False):
+    """
+    Remove a user from tracking list.
+    
+    Args:
+        chat_id: User's chat id
+        pruned: True when removed because the chat is unreachable (e.g. blocked the bot)
+    """
+    with _registry_lock:
+        previous = _store.remove(chat_id)
+        if previous is None:
+            return False
+        _counters.apply(transition_deltas(previous, None, pruned=pruned))
+        if _subscription_index is not None:
+            _subscription_index.remove(chat_id)
         return True
-    return False
 
 
 def mark_user_notified(chat_id):
     """Mark a user as notified (stops further notifications)."""
-    users = load_tracked_users()
-    if str(chat_id) in users:
-        users[str(chat_id)]["notified"] = True
-        save_tracked_users(users)
+    mark_users_notified([chat_id])
 
 
-def get_users_to_notify():
-    """Get list of users who should receive notifications (tracked but not yet notified)."""
-    users = load_tracked_users()
-    return [
-        chat_id for chat_id, data in users.items()
-        if not data.get("notified", False)
-    ]
+def mark_users_notified(chat_ids):
+    """Mark a batch of users as notified with a single registry write."""
+    with _registry_lock:
+        previous = _store.mark_notified_many(chat_ids)
+        if not previous:
+            return
+        _counters.apply(merge_deltas(*(
+            transition_deltas(record, dict(record, notified=True)) for record in previous.values()
+        )))
+        if _subscription_index is not None:
+            for chat_id in previous:
+                _subscription_index.remove(chat_id)
+
+
+def get_subscriber_stats():
+    """Get aggregate subscriber counters without scanning the registry."""
+    return _counters.get()
+
+
+def get_users_to_notify(denominations=None):
+    """
+    Get list of users who should receive notifications (tracked but not yet notified).
+    
+    Args:
+        denominations: Denominations in stock; when given, only users whose
+            filters match are returned (looked up in the subscription index)
+    """
+    if denominations is not None:
+        return get_subscription_index(refresh=_SHARED_REGISTRY).match(denominations)
+    return [chat_id for chunk in _store.iter_pending(PIPELINE_CHUNK_SIZE) for chat_id, _ in chunk]
+
+
+def iter_users_to_notify(chunk_size, denominations=None, owns=None):
+    """
+    Stream users to notify in chunks.
+    
+    Args:
+        chunk_size: Maximum chat ids per chunk
+        denominations: Denominations in stock, used to match user filters
+        owns: Optional predicate on chat id (this instance's shard in a cluster)
+    
+    Yields:
+        list: Chat ids
+    """
+    live_index = False
+    if denominations is None:
+        # Paged straight from the registry, so other instances' updates are seen
+        pending = (chat_id for chunk in _store.iter_pending(chunk_size) for chat_id, _ in chunk)
+    elif owns is None:
+        pending = get_subscription_index(refresh=_SHARED_REGISTRY).iter_match(denominations)
+        live_index = True
+    else:
+        # Other instances update the registry too, so match against a fresh copy
+        pending = SubscriptionIndex.from_users(_store.load_pending()).iter_match(denominations)
+    if owns is not None:
+        pending = (chat_id for chat_id in pending if owns(chat_id))
+    
+    while True:
+        if live_index:
+            # The shared index is updated from worker threads under the same lock
+            with _registry_lock:
+                chunk = list(islice(pending, chunk_size))
+        else:
+            chunk = list(islice(pending, chunk_size))
+        if not chunk:
+            return
+        yield chunk
 
 
 def is_user_tracking(chat_id):
     """Check if a user is currently tracking."""
-    users = load_tracked_users()
-    return str(chat_id) in users
+    return _store.get(chat_id) is not None
 
 
 def get_user_status(chat_id):
     """Get tracking status for a user."""
-    users = load_tracked_users()
-    return users.get(str(chat_id))
+    return _store.get(chat_id)
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -109,6 +230,7 @@ Welcome! I'll help you track PhonePe gift voucher availability on StanShop.
 /untrack - Stop tracking
 /check - Check current stock status
 /status - View your tracking status
+/history - Recent stock availability
 /help - Show this help message
 
 📡 Use /track to get notified when vouchers become available!
@@ -123,35 +245,65 @@ Welcome! I'll help you track PhonePe gift voucher availability on StanShop.
     )
 
 
+def _delivery_text(filters, channel):
+    """Where a subscriber's alerts go, as an extra reply line (empty without a channel)."""
+    if not BROADCAST_CHANNEL_ID:
+        return ""
+    return "\n" + format_delivery(filters, channel, channel_link(BROADCAST_CHANNEL_ID, BROADCAST_CHANNEL_URL))
+
+
 async def track_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /track command - Register for notifications."""
+    """Handle /track command - Register for notifications, optionally with filters."""
     chat_id = update.effective_chat.id
     username = update.effective_user.username
     
-    if is_user_tracking(chat_id):
-        user_data = get_user_status(chat_id)
-        if user_data and user_data.get("notified"):
+    args, channel = parse_delivery(context.args)
+    try:
+        filters = parse_filters(args)
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+    
+    user_data = get_user_status(chat_id)
+    if user_data is not None:
+        if user_data.get("notified"):
             # User was notified before, reset tracking
-            add_tracked_user(chat_id, username)
+            add_tracked_user(chat_id, username, filters, channel)
             await update.message.reply_text(
                 "🔄 *Tracking Reset!*\n\n"
                 "You were previously notified about stock availability.\n"
-                "I'll notify you again when new stock arrives.",
+                "I'll notify you again when new stock arrives.\n\n"
+                f"🎯 Watching: {format_filters(filters)}"
+                f"{_delivery_text(filters, channel)}",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        elif filters != user_data.get("filters") or channel != user_data.get("channel", False):
+            # Already tracking - update the filters or delivery
+            add_tracked_user(chat_id, username, filters, channel)
+            await update.message.reply_text(
+                "✅ *Tracking Updated!*\n\n"
+                f"🎯 Watching: {format_filters(filters)}"
+                f"{_delivery_text(filters, channel)}",
                 parse_mode=ParseMode.MARKDOWN
             )
         else:
             await update.message.reply_text(
                 "✅ You're already tracking!\n\n"
                 "I'll notify you as soon as PhonePe vouchers become available.\n"
+                f"🎯 Watching: {format_filters(user_data.get('filters'))}"
+                f"{_delivery_text(user_data.get('filters'), user_data.get('channel', False))}\n"
                 "Use /untrack to stop tracking.",
                 parse_mode=ParseMode.MARKDOWN
             )
     else:
-        add_tracked_user(chat_id, username)
+        add_tracked_user(chat_id, username, filters, channel)
         await update.message.reply_text(
             "🔔 *Tracking Started!*\n\n"
             "I'll notify you as soon as PhonePe vouchers become available.\n"
             "You'll receive one notification, then tracking will stop automatically.\n\n"
+            f"🎯 Watching: {format_filters(filters)}"
+            f"{_delivery_text(filters, channel)}\n"
+            "Add filters like `/track 500 max=480 discount=5` to narrow alerts.\n\n"
             "Use /track again after being notified to re-enable tracking.\n"
             "Use /untrack to stop tracking.",
             parse_mode=ParseMode.MARKDOWN
@@ -177,8 +329,30 @@ async def untrack_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+# Per-chat and global /check limits, so spam can't burn the StanShop and Telegram budgets
+_check_limiter = SlidingWindowLimiter(CHECK_RATE_PER_CHAT, CHECK_RATE_GLOBAL, CHECK_RATE_WINDOW)
+
+
 async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /check command - Manual stock check."""
+    wait = _check_limiter.acquire(update.effective_chat.id)
+    if wait > 0:
+        # Over the limit: answer from the last result instead of fetching again
+        last = get_last_status()
+        if last is None:
+            reply = format_limited(wait)
+        else:
+            age = (datetime.now() - last["check_time"]).total_seconds()
+            reply = format_limited(wait, last["message"], age)
+        await update.message.reply_text(reply, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+        return
+    
+    # A recent result (e.g. restored from the checkpoint) answers without a fetch
+    last = get_last_status()
+    if last is not None and (datetime.now() - last["check_time"]).total_seconds() < STOCK_CACHE_TTL:
+        await update.message.reply_text(last["message"], parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+        return
+    
     await update.message.reply_text("🔍 Checking stock...")
     
     status = check_availability()
@@ -195,13 +369,15 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     last_check = get_last_check_time()
     
-    # User tracking status
-    if is_user_tracking(chat_id):
-        user_data = get_user_status(chat_id)
-        if user_data and user_data.get("notified"):
+    # User tracking status (one registry lookup)
+    user_data = get_user_status(chat_id)
+    if user_data is not None:
+        if user_data.get("notified"):
             track_status = "⚠️ Notified (use /track to re-enable)"
         else:
             track_status = "✅ Active"
+        track_status += f"\n🎯 Watching: {format_filters(user_data.get('filters'))}"
+        track_status += _delivery_text(user_data.get("filters"), user_data.get("channel", False))
     else:
         track_status = "❌ Not tracking (use /track to start)"
     
@@ -223,6 +399,10 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         check_info = "⏰ No checks performed yet"
     
+    if get_breaker_state() == OPEN:
+        # Checks are being skipped until the StanShop API recovers
+        check_info += "\n⚠️ StanShop API is having trouble - checks will resume shortly"
+    
     status_text = f"""
 📊 *Your Status*
 
@@ -239,15 +419,82 @@ Use /check to manually check now.
     )
 
 
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /history command - Show recent availability from precomputed rollups."""
+    summary = get_summary(days=7)
+    
+    if summary["last_check"] is None:
+        await update.message.reply_text("📭 No stock history recorded yet.")
+        return
+    
+    lines = ["📈 *Stock History* (UTC)\n"]
+    
+    ratio_24h, checks_24h = summary["last_24h"]
+    if checks_24h:
+        lines.append(f"Last 24h: {ratio_24h:.0%} of {checks_24h} checks found stock\n")
+    
+    for day_start, ratio, checks in summary["daily"]:
+        day = datetime.utcfromtimestamp(day_start).strftime("%a %d %b")
+        lines.append(f"{'🟢' if ratio else '⚪'} {day}: {ratio:.0%} ({checks} checks)")
+    
+    if summary["last_restock"]:
+        restock = datetime.utcfromtimestamp(summary["last_restock"]).strftime("%Y-%m-%d %H:%M")
+        lines.append(f"\n🕒 Last restock seen: {restock}")
+    
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+
+def is_admin(chat_id):
+    """Check whether a chat is listed in ADMIN_CHAT_IDS."""
+    return str(chat_id) in ADMIN_CHAT_IDS
+
+
+async def slo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /slo command (admin only) - Show recent time-to-notify summaries and pipeline stats."""
+    if not is_admin(update.effective_chat.id):
+        return
+    
+    summaries = load_summaries()[:3]
+    stages = get_pipeline_stats()
+    if not summaries and not stages:
+        await update.message.reply_text("No broadcasts recorded yet.")
+        return
+    
+    if summaries:
+        text = "📊 *Recent Broadcasts*\n\n" + "\n\n".join(format_summary(s) for s in summaries)
+    else:
+        text = "📊 No broadcasts recorded yet."
+    if stages:
+        # Live queue depths while a broadcast is still running
+        text += f"\n\n*Latest pipeline run:*\n```\n{format_stats(stages)}\n```"
+    if format_warmups():
+        text += f"\n\n{format_warmups()}"
+    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats command (admin only) - Show subscriber counters."""
+    if not is_admin(update.effective_chat.id):
+        return
+    
+    await update.message.reply_text(
+        format_subscriber_stats(get_subscriber_stats()),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command - Show help message."""
     help_text = """
 📖 *Available Commands*
 
 /track - Start tracking for stock notifications
+/track 500 max=480 discount=5 - Only alert for matching vouchers
+/track dm - Get alerts as a private message, not in the channel
 /untrack - Stop tracking
 /check - Check current PhonePe voucher stock
 /status - View your tracking status
+/history - Recent stock availability
 /help - Show this help message
 
 *How it works:*
@@ -267,57 +514,353 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def send_notification_to_users(message: str):
+NOTIFICATION_FOOTER = "\n\n_Tracking paused. Use /track to re-enable._"
+
+# Most recent (or running) check/broadcast pipeline, for its per-stage stats
+_last_pipeline = None
+
+
+def _log_fields(chat_id, tracker):
+    """Structured fields for a per-recipient log line."""
+    fields = {"chat_id": chat_id}
+    if tracker is not None:
+        fields["broadcast"] = tracker.event_id
+    return fields
+
+
+def build_notify_stages(owns=None, tracker=None, claim=None):
     """
-    Send notification to all tracked users who haven't been notified yet.
+    Build the match -> render -> send -> persist stages of a broadcast.
+    
+    The match stage takes an event dict with 'message', 'denominations' and
+    'detected_at' and streams matching subscribers in chunks; users are
+    marked notified in batches as their sends succeed.
+    
+    With a broadcast channel configured, the alert is posted there first
+    (unless the event's 'via_channel' says whether that already happened)
+    and matched subscribers it covers skip the send stage.
+    
+    While the broadcast runs, stock is re-checked every REVALIDATE_INTERVAL
+    seconds; once it has sold out the remaining sends are dropped and those
+    users stay tracked for the next restock.
     
     Args:
-        message: The message to send (supports Markdown)
+        owns: Optional predicate on chat id (this instance's shard in a cluster)
+        tracker: Optional BroadcastTracker recording time-to-notify per delivery
+        claim: Optional blocking callable taking a chunk of chat ids and
+            returning those this instance may message; in a cluster it stops
+            a chat that changes owner mid-broadcast being messaged twice
     
     Returns:
-        int: Number of users notified
+        list: Pipeline stages
     """
-    global _application
+    cancelled = asyncio.Event()  # Set when stock sold out mid-broadcast
+    finished = asyncio.Event()
+    watchers = []
     
-    if _application is None:
-        logger.error("Bot application not initialized")
-        return 0
+    async def watch_stock():
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(finished.wait(), REVALIDATE_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                pass
+            available = await loop.run_in_executor(None, revalidate_stock)
+            if available is False and not finished.is_set():
+                logger.info("Stock sold out mid-broadcast, stopping notifications")
+                cancelled.set()
+                if tracker is not None:
+                    tracker.cancel()
+                return
     
-    users_to_notify = get_users_to_notify()
-    notified_count = 0
+    async def stop_watchers():
+        finished.set()
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+        watchers.clear()
     
-    for chat_id in users_to_notify:
+    async def match(event, emit):
+        if tracker is not None and tracker.detected_at is None:
+            tracker.stamp(event.get("detected_at"))
+        if REVALIDATE_INTERVAL > 0 and not watchers:
+            watchers.append(asyncio.ensure_future(watch_stock()))
+        try:
+            await match_event(event, emit)
+        except BaseException:
+            # Nothing more will be sent for this event, so stop revalidating now
+            await stop_watchers()
+            raise
+    
+    async def match_event(event, emit):
+        text = event["message"] + NOTIFICATION_FOOTER  # Rendered once per event
+        via_channel = event.get("via_channel")
+        if via_channel is None:
+            via_channel = await post_to_channel(event["message"], tracker)
+        loop = asyncio.get_running_loop()
+        for chunk in iter_users_to_notify(PIPELINE_CHUNK_SIZE, event.get("denominations"), owns):
+            if cancelled.is_set():
+                break
+            if via_channel:
+                records = await loop.run_in_executor(None, _store.get_many, chunk)
+                covered, chunk = split_recipients(chunk, records)
+                if covered:
+                    if tracker is not None:
+                        tracker.record_channel(len(covered))
+                    await emit((covered, None))
+            if chunk and claim is not None:
+                chunk = await loop.run_in_executor(None, claim, chunk)
+            if chunk:
+                await emit((chunk, text))
+    
+    async def render(item, emit):
+        chunk, text = item
+        for chat_id in chunk:
+            await emit((chat_id, text))
+    
+    async def send(item, emit):
+        chat_id, text = item
+        if text is None:
+            # Reached by the channel post: only mark notified
+            await emit(chat_id)
+            return
+        for attempt in range(2):
+            if cancelled.is_set():
+                # Sold out: leave the user pending for the next restock
+                if tracker is not None:
+                    tracker.record_skipped()
+                return
+            try:
+                await _application.bot.send_message(
+                    chat_id=int(chat_id),
+                    text=text,
+                    parse_mode=ParseMode.MARKDOWN,
+                    disable_web_page_preview=True
+                )
+                if sample():
+                    logger.info("Notified user", extra=_log_fields(chat_id, tracker))
+                if tracker is not None:
+                    tracker.record_delivery(ok=True)
+                await emit(chat_id)
+                return
+            except Forbidden as e:
+                # User blocked the bot or deleted the chat - stop tracking them
+                if sample():
+                    logger.info(f"Pruning unreachable user: {e}", extra=_log_fields(chat_id, tracker))
+                remove_tracked_user(chat_id, pruned=True)
+                if tracker is not None:
+                    tracker.record_delivery(ok=False)
+                return
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                delay = e.retry_after
+                await asyncio.sleep(delay.total_seconds() if hasattr(delay, "total_seconds") else delay)
+            except Exception as e:
+                logger.error(f"Failed to notify user: {e}", extra=_log_fields(chat_id, tracker))
+                if tracker is not None:
+                    tracker.record_delivery(ok=False)
+                return
+    
+    pending = []
+    
+    async def persist(chat_id, emit):
+        pending.append(chat_id)
+        if len(pending) >= PIPELINE_CHUNK_SIZE:
+            await flush(emit)
+    
+    async def flush(emit):
+        batch = pending[:]
+        pending.clear()
+        if batch:
+            await asyncio.get_running_loop().run_in_executor(None, mark_users_notified, batch)
+            for chat_id in batch:
+                await emit(chat_id)
+    
+    async def finish(emit):
+        try:
+            await flush(emit)
+        finally:
+            # Sends are over: the watcher must not keep polling StanShop
+            await stop_watchers()
+    
+    return [
+        Stage("match", match, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("render", render, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("send", send, concurrency=PIPELINE_SEND_CONCURRENCY, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("persist", persist, queue_size=PIPELINE_QUEUE_SIZE, on_finish=finish),
+    ]
+
+
+async def post_to_channel(message, tracker=None):
+    """
+    Post an alert to the broadcast channel, if one is configured.
+    
+    Args:
+        message: The alert text (Markdown)
+        tracker: Optional BroadcastTracker to record the post on
+    
+    Returns:
+        bool: Whether the post went out; if not, every subscriber is DMed
+    """
+    if not BROADCAST_CHANNEL_ID or _application is None:
+        return False
+    for attempt in range(2):
         try:
             await _application.bot.send_message(
-                chat_id=int(chat_id),
-                text=message + "\n\n_Tracking paused. Use /track to re-enable._",
+                chat_id=BROADCAST_CHANNEL_ID,
+                text=message,
                 parse_mode=ParseMode.MARKDOWN,
                 disable_web_page_preview=True
             )
-            mark_user_notified(chat_id)
-            notified_count += 1
-            logger.info(f"Notified user {chat_id}")
+            break
+        except RetryAfter as e:
+            if attempt:
+                logger.error(f"Failed to post to broadcast channel: {e}")
+                return False
+            delay = e.retry_after
+            await asyncio.sleep(delay.total_seconds() if hasattr(delay, "total_seconds") else delay)
         except Exception as e:
-            logger.error(f"Failed to notify user {chat_id}: {e}")
+            logger.error(f"Failed to post to broadcast channel, falling back to DMs: {e}")
+            return False
+    if tracker is not None:
+        tracker.record_channel_post()
+    logger.info(f"Posted alert to broadcast channel {BROADCAST_CHANNEL_ID}")
+    return True
+
+
+async def warm_telegram():
+    """
+    Open (or keep alive) a pooled connection to the Bot API.
+    
+    Returns:
+        float: Seconds taken, or None if it failed
+    """
+    if _application is None:
+        return None
+    started = time.monotonic()
+    try:
+        await _application.bot.get_me()
+    except Exception as e:
+        logger.error(f"Error warming Telegram connection: {e}")
+        return None
+    return time.monotonic() - started
+
+
+async def _run_pipeline(stages, items):
+    """Run a pipeline, keep its stats for inspection and return the persisted count."""
+    global _last_pipeline
+    
+    pipeline = Pipeline(stages)
+    _last_pipeline = pipeline
+    stats = await pipeline.run(items)
+    logger.info(f"Pipeline stats:\n{format_stats(stats)}")
+    return stats[-1]["emitted"]
+
+
+async def _finish_broadcast(tracker):
+    """Persist a broadcast's time-to-notify summary and alert admins if over budget."""
+    if not tracker.latencies and not tracker.failed and not tracker.skipped:
+        return
     
-    return notified_count
+    summary = tracker.summary()
+    try:
+        save_summary(summary)
+    except OSError as e:
+        logger.error(f"Failed to save broadcast stats: {e}")
+    logger.info(
+        "Broadcast finished",
+        extra=dict(
+            {key: summary[key] for key in ("event_id", "sent", "failed", "skipped", "p50", "p99", "max", "throughput")},
+            log_dropped=dropped_records()
+        )
+    )
+    
+    if over_budget(summary):
+        logger.warning(f"Broadcast {summary['event_id']} p99 time-to-notify over budget")
+        for admin_id in ADMIN_CHAT_IDS:
+            try:
+                await _application.bot.send_message(
+                    chat_id=int(admin_id),
+                    text="⚠️ *Time-to-notify budget exceeded*\n\n" + format_summary(summary),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            except Exception as e:
+                logger.error(f"Failed to alert admin {admin_id}: {e}")
+
+
+def get_pipeline_stats():
+    """Get per-stage stats (queue depth, throughput) of the latest pipeline run."""
+    if _last_pipeline is None:
+        return []
+    return _last_pipeline.snapshot()
+
+
+async def send_notification_to_users(message: str, denominations=None, owns=None, detected_at=None,
+                                     via_channel=None, claim=None):
+    """
+    Send notification to all tracked users who haven't been notified yet.
+    
+    Args:
+        message: The message to send (supports Markdown)
+        denominations: Denominations in stock, used to match user filters
+        owns: Optional predicate on chat id; when given, only chats it accepts
+            are notified (this instance's shard in a cluster)
+        detected_at: When the stock was detected (epoch seconds, defaults to now)
+        via_channel: Whether the alert was already posted to the broadcast
+            channel; None posts it now if a channel is configured
+        claim: Optional callable claiming chunks of chat ids before they are
+            messaged (see build_notify_stages)
+    
+    Returns:
+        int: Number of users notified
+    """
+    if _application is None:
+        logger.error("Bot application not initialized")
+        return 0
+    
+    tracker = BroadcastTracker()
+    event = {"message": message, "denominations": denominations, "detected_at": detected_at, "via_channel": via_channel}
+    count = await _run_pipeline(build_notify_stages(owns, tracker, claim), [event])
+    await _finish_broadcast(tracker)
+    return count
 
 
 async def scheduled_check():
     """
     Perform a scheduled check and send notification if stock appeared.
     Called by the scheduler.
+    
+    Runs as a staged pipeline: fetch -> diff -> match -> render -> send -> persist.
     """
     logger.info("Running scheduled stock check...")
     
-    result = check_for_stock_change()
+    async def fetch(_, emit):
+        status = await asyncio.get_running_loop().run_in_executor(None, check_availability)
+        await emit(status)
     
-    if result["changed"]:
-        logger.info("Stock change detected! Sending notifications to tracked users...")
-        count = await send_notification_to_users(result["status"]["message"])
-        logger.info(f"Notified {count} user(s)")
-    else:
-        logger.info(f"No stock change. Reason: {result['reason']}")
+    async def diff(status, emit):
+        result = detect_stock_change(status)
+        if result["changed"]:
+            logger.info("Stock change detected! Sending notifications to tracked users...")
+            await emit({
+                "message": result["status"]["message"],
+                "denominations": result["status"]["denominations"],
+                "detected_at": result["status"]["check_time"].timestamp()
+            })
+        else:
+            logger.info(f"No stock change. Reason: {result['reason']}")
+    
+    tracker = BroadcastTracker()
+    stages = [Stage("fetch", fetch), Stage("diff", diff)]
+    if _application is not None:
+        stages += build_notify_stages(tracker=tracker)
+    count = await _run_pipeline(stages, [None])
+    if _application is not None:
+        await _finish_broadcast(tracker)
+        if count:
+            logger.info(f"Notified {count} user(s)")
 
 
 def get_application():
@@ -325,6 +868,26 @@ def get_application():
     return _application
 
 
+async def remember_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Note the id of each incoming update, for the warm-restart checkpoint."""
+    global _last_update_id
+    if _last_update_id is None or update.update_id > _last_update_id:
+        _last_update_id = update.update_id
+
+
+def get_last_update_id():
+    """Id of the newest update received, or None."""
+    return _last_update_id
+
+
+async def confirm_updates(app, last_update_id):
+    """
+    Tell Telegram that updates up to last_update_id were handled, so a
+    restarted poller doesn't get them again.
+    """
+    await app.bot.get_updates(offset=last_update_id + 1, limit=1, timeout=0, allowed_updates=ALLOWED_UPDATES)
+
+
 def create_bot():
     """
     Create and configure the Telegram bot application.
@@ -340,18 +903,59 @@ def create_bot():
     # Create application
     _application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
     
+    # Runs before the command handlers, without blocking them
+    _application.add_handler(TypeHandler(Update, remember_update, block=False), group=-1)
+    
     # Add command handlers
     _application.add_handler(CommandHandler("start", start_command))
     _application.add_handler(CommandHandler("track", track_command))
     _application.add_handler(CommandHandler("untrack", untrack_command))
     _application.add_handler(CommandHandler("check", check_command))
     _application.add_handler(CommandHandler("status", status_command))
+    _application.add_handler(CommandHandler("history", history_command))
+    _application.add_handler(CommandHandler("slo", slo_command))
+    _application.add_handler(CommandHandler("stats", stats_command))
     _application.add_handler(CommandHandler("help", help_command))
     
     logger.info("Bot created successfully")
     return _application
 
 
+async def start_receiving_updates(app, mode=None, webhook_url=None, listen=None, port=None, secret_token=None):
+    """
+    Start delivering updates to the application's handlers.
+    
+    In polling mode the updater long-polls getUpdates. In webhook mode it
+    runs an embedded HTTP server and registers it with Telegram, which then
+    pushes each update as it happens. Telegram's secret token header is
+    checked on every request and only ALLOWED_UPDATES are requested.
+    
+    Args:
+        app: Initialized and started Application
+        mode: "polling" or "webhook" (defaults to BOT_MODE)
+        webhook_url: Public base URL (defaults to WEBHOOK_URL)
+        listen: Interface to bind (defaults to WEBHOOK_LISTEN)
+        port: Port to bind (defaults to WEBHOOK_PORT)
+        secret_token: Webhook secret (defaults to WEBHOOK_SECRET)
+    """
+    mode = mode or BOT_MODE
+    
+    if mode == "webhook":
+        base_url = (webhook_url or WEBHOOK_URL).rstrip("/")
+        await app.updater.start_webhook(
+            listen=listen or WEBHOOK_LISTEN,
+            port=port or WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{base_url}/{WEBHOOK_PATH}",
+            secret_token=secret_token or WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        logger.info(f"Receiving updates via webhook at {base_url}/{WEBHOOK_PATH}")
+    else:
+        await app.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+        logger.info("Receiving updates via polling")
+
+
 async def run_bot():
     """Run the bot (for use with scheduler)."""
     app = create_bot()
@@ -359,7 +963,7 @@ async def run_bot():
     # Initialize and start
     await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    await start_receiving_updates(app)
     
     logger.info("Bot is running...")
     
@@ -372,4 +976,14 @@ if __name__ == "__main__":
     print("Press Ctrl+C to stop")
     
     app = create_bot()
-    app.run_polling()
+    if BOT_MODE == "webhook":
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
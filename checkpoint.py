@@ -0,0 +1,93 @@
+"""
+Warm-restart checkpoint for scheduler.py.
+The monitor's last snapshot and check result, the Telegram polling offset
+and the next scheduled check time are written to a small JSON file
+periodically and on shutdown. A restarted process loads it to answer
+/status and /check straight away and to keep its check schedule, instead of
+hitting StanShop and re-reading updates as soon as it starts.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from config import CHECKPOINT_FILE
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def collect(next_check=None, last_update_id=None):
+    """
+    Gather the state to checkpoint.
+
+    Args:
+        next_check: Next scheduled stock check (datetime), if known
+        last_update_id: Id of the last Telegram update handled, if any
+
+    Returns:
+        dict: JSON-safe checkpoint
+    """
+    from monitor import export_state
+
+    return {
+        "version": VERSION,
+        "saved_at": time.time(),
+        "monitor": export_state(),
+        "last_update_id": last_update_id,
+        "next_check": next_check.isoformat() if next_check else None,
+    }
+
+
+def save(state, path=CHECKPOINT_FILE):
+    """Write a checkpoint atomically (temp file + rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def load(path=CHECKPOINT_FILE):
+    """
+    Read a checkpoint.
+
+    Returns:
+        dict: The checkpoint, or None if missing, unreadable or from another version
+    """
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        return None
+    return state
+
+
+def restore(state, now=None):
+    """
+    Apply a checkpoint to the monitor.
+
+    Args:
+        state: Checkpoint from load()
+        now: Current time (timezone-aware), defaults to now
+
+    Returns:
+        datetime: The saved next check time if it is still ahead, else None
+            (the check was due while the process was down)
+    """
+    from monitor import restore_state
+
+    restore_state(state.get("monitor") or {})
+    next_check = state.get("next_check")
+    if not next_check:
+        return None
+    next_check = datetime.fromisoformat(next_check)
+    now = now or datetime.now(next_check.tzinfo)
+    return next_check if next_check > now else None
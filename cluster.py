@@ -0,0 +1,253 @@
+"""
+Coordination between multiple bot worker processes.
+One instance holds a leader lease and runs the scheduled stock checks;
+every live instance sends alerts to its share of the subscribers, picked
+by rendezvous hashing on chat id. When an instance stops heartbeating its
+chats hash to the survivors, which pick up whoever is still pending.
+Chats are claimed per broadcast before they are messaged, so a chat that
+changes owner mid-broadcast isn't messaged by both instances.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import socket
+import time
+
+from config import CLUSTER_DIR, LEASE_TTL, BROADCAST_TTL
+
+LEADER_KEY = "cluster:leader"
+MEMBERS_KEY = "cluster:members"
+BROADCAST_KEY = "cluster:broadcast"
+CLAIMS_KEY = "cluster:claims:{}"
+
+# Renew the lease if we hold it, otherwise take it only if it is free
+_RENEW_OR_ACQUIRE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Claim each chat for one instance; returns the chat ids this call claimed
+_CLAIM = """
+local claimed = {}
+for i = 3, #ARGV do
+    if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[1]) == 1 then
+        claimed[#claimed + 1] = ARGV[i]
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return claimed
+"""
+
+
+def default_instance_id():
+    """Identify this process across the cluster."""
+    return os.getenv("DYNO") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def owner_of(chat_id, members):
+    """
+    Pick the instance responsible for a chat (rendezvous hashing).
+
+    Only chats owned by a departed member move when membership changes.
+    """
+    key = str(chat_id).encode()
+
+    def weight(member):
+        digest = hashlib.blake2b(key + b"@" + member.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    return max(members, key=weight)
+
+
+class FileCoordinator:
+    """
+    Coordinator for instances sharing a filesystem.
+
+    Leadership is an exclusive flock held for the life of the process, so
+    the OS releases it the moment the leader dies. Membership is a
+    heartbeat file per instance.
+    """
+
+    def __init__(self, directory=CLUSTER_DIR, instance_id=None, ttl=LEASE_TTL):
+        self.instance_id = instance_id or default_instance_id()
+        self.ttl = ttl
+        self.directory = directory
+        self._members_dir = os.path.join(directory, "members")
+        self._claims_dir = os.path.join(directory, "claims")
+        os.makedirs(self._members_dir, exist_ok=True)
+        self._lock_file = None
+
+    def try_acquire_leadership(self):
+        """Take (or keep) the leader lock. Returns True if this instance leads."""
+        if self._lock_file is not None:
+            return True
+        import fcntl
+        lock_file = open(os.path.join(self.directory, "leader.lock"), "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(self.instance_id)
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def heartbeat(self):
+        """Mark this instance as alive."""
+        path = os.path.join(self._members_dir, self.instance_id)
+        with open(path, "w") as f:
+            f.write(str(time.time()))
+
+    def live_members(self):
+        """Sorted ids of instances that heartbeated within the TTL."""
+        cutoff = time.time() - self.ttl
+        members = []
+        for name in os.listdir(self._members_dir):
+            path = os.path.join(self._members_dir, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    members.append(name)
+                else:
+                    os.remove(path)
+            except OSError:
+                continue  # Removed by another instance meanwhile
+        return sorted(members)
+
+    def publish_broadcast(self, job):
+        """Share a broadcast job with all instances."""
+        path = os.path.join(self.directory, "broadcast.json")
+        tmp = f"{path}.{self.instance_id}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+        # Claims of earlier broadcasts are no longer consulted
+        if os.path.isdir(self._claims_dir):
+            for name in os.listdir(self._claims_dir):
+                if name != job["id"]:
+                    shutil.rmtree(os.path.join(self._claims_dir, name), ignore_errors=True)
+
+    def claim(self, broadcast_id, chat_ids):
+        """
+        Claim chats for this instance before messaging them.
+
+        Returns:
+            list: The chat ids no other instance claimed for this broadcast
+        """
+        directory = os.path.join(self._claims_dir, broadcast_id)
+        os.makedirs(directory, exist_ok=True)
+        claimed = []
+        for chat_id in chat_ids:
+            try:
+                os.close(os.open(os.path.join(directory, str(chat_id)), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            claimed.append(chat_id)
+        return claimed
+
+    def get_broadcast(self):
+        """Get the latest broadcast job, or None."""
+        try:
+            with open(os.path.join(self.directory, "broadcast.json"), "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return None
+
+    def leave(self):
+        """Release leadership and membership on shutdown."""
+        try:
+            os.remove(os.path.join(self._members_dir, self.instance_id))
+        except OSError:
+            pass
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class KVCoordinator:
+    """
+    Coordinator for instances on different hosts, backed by the KV store.
+
+    Leadership is a key with a TTL that the leader keeps renewing; members
+    are a sorted set scored by last heartbeat time.
+    """
+
+    def __init__(self, instance_id=None, ttl=LEASE_TTL):
+        from api.stock_cache import kv_command, COMPARE_AND_DELETE
+        self._kv = kv_command
+        self._compare_and_delete = COMPARE_AND_DELETE
+        self.instance_id = instance_id or default_instance_id()
+        self.ttl = ttl
+
+    def try_acquire_leadership(self):
+        """Take or renew the leader lease. Returns True if this instance leads."""
+        result = self._kv("EVAL", _RENEW_OR_ACQUIRE, 1, LEADER_KEY, self.instance_id, int(self.ttl * 1000))
+        return str(result) == "1"
+
+    def heartbeat(self):
+        """Mark this instance as alive."""
+        self._kv("ZADD", MEMBERS_KEY, time.time(), self.instance_id)
+
+    def live_members(self):
+        """Sorted ids of instances that heartbeated within the TTL."""
+        cutoff = time.time() - self.ttl
+        self._kv("ZREMRANGEBYSCORE", MEMBERS_KEY, "-inf", cutoff)
+        return sorted(self._kv("ZRANGEBYSCORE", MEMBERS_KEY, cutoff, "+inf") or [])
+
+    def publish_broadcast(self, job):
+        """Share a broadcast job with all instances."""
+        self._kv("SET", BROADCAST_KEY, json.dumps(job))
+
+    def claim(self, broadcast_id, chat_ids):
+        """
+        Claim chats for this instance before messaging them (one request per batch).
+
+        Returns:
+            list: The chat ids no other instance claimed for this broadcast
+        """
+        chat_ids = list(chat_ids)
+        if not chat_ids:
+            return []
+        result = self._kv("EVAL", _CLAIM, 1, CLAIMS_KEY.format(broadcast_id),
+                          self.instance_id, BROADCAST_TTL, *chat_ids)
+        if result is None:
+            raise RuntimeError("KV claim failed")
+        claimed = set(result)
+        return [chat_id for chat_id in chat_ids if str(chat_id) in claimed]
+
+    def get_broadcast(self):
+        """Get the latest broadcast job, or None."""
+        raw = self._kv("GET", BROADCAST_KEY)
+        try:
+            return json.loads(raw) if raw else None
+        except (json.JSONDecodeError, TypeError):
+            return None
+
+    def leave(self):
+        """Release leadership and membership on shutdown."""
+        self._kv("ZREM", MEMBERS_KEY, self.instance_id)
+        self._kv("EVAL", self._compare_and_delete, 1, LEADER_KEY, self.instance_id)
+
+
+def create_coordinator(mode):
+    """
+    Create the coordinator for a CLUSTER_MODE value.
+
+    Returns:
+        FileCoordinator, KVCoordinator or None when clustering is off
+    """
+    if mode == "file":
+        return FileCoordinator()
+    if mode == "kv":
+        return KVCoordinator()
+    return None
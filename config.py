@@ -4,10 +4,13 @@ Loads settings from .env file.
 """
 
 import os
-from dotenv import load_dotenv
+import re
 
-# Load environment variables from .env file
-load_dotenv()
+# Load environment variables from .env file.
+# Vercel injects them directly, so skip dotenv there to save cold-start time.
+if not os.getenv("VERCEL"):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Telegram Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
@@ -16,6 +19,96 @@ TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
 # Monitoring Configuration
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "86400"))  # Default: 24 hours (1 day)
 
+# Polling schedule: "fixed" (every CHECK_INTERVAL) or "predictive" (learned from history)
+POLL_MODE = os.getenv("POLL_MODE", "fixed").lower()
+POLL_BUDGET_PER_DAY = int(os.getenv("POLL_BUDGET_PER_DAY", str(max(1, 86400 // CHECK_INTERVAL))))
+POLL_MAX_PER_HOUR = int(os.getenv("POLL_MAX_PER_HOUR", "12"))
+POLL_FLOOR_SHARE = float(os.getenv("POLL_FLOOR_SHARE", "0.2"))  # Budget share spread evenly
+
+# Multi-instance coordination: "off", "file" (shared filesystem) or "kv" (KV store)
+CLUSTER_MODE = os.getenv("CLUSTER_MODE", "off").lower()
+CLUSTER_DIR = os.getenv("CLUSTER_DIR", ".cluster")
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))  # Seconds before a silent instance is considered dead
+BROADCAST_TTL = int(os.getenv("BROADCAST_TTL", "3600"))  # How long instances keep working on a broadcast
+
+# Check-and-notify pipeline
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))  # Items buffered between stages
+PIPELINE_CHUNK_SIZE = int(os.getenv("PIPELINE_CHUNK_SIZE", "500"))  # Subscribers per chunk / storage batch
+PIPELINE_SEND_CONCURRENCY = int(os.getenv("PIPELINE_SEND_CONCURRENCY", "4"))
+
+# Optional broadcast channel (@name or -100... id; the bot must be an admin there).
+# Alerts for subscribers without filters are posted there once instead of DMed
+# to each of them; BROADCAST_CHANNEL_URL is the link /track shows (defaults to
+# t.me/<name> for @name channels)
+BROADCAST_CHANNEL_ID = os.getenv("BROADCAST_CHANNEL_ID", "")
+BROADCAST_CHANNEL_URL = os.getenv("BROADCAST_CHANNEL_URL", "")
+
+# Time-to-notify SLO: alert admins when a broadcast's p99 exceeds this many seconds
+TTN_BUDGET_SECONDS = float(os.getenv("TTN_BUDGET_SECONDS", "120"))
+BROADCAST_STATS_FILE = os.getenv("BROADCAST_STATS_FILE", "broadcast_stats.json")
+ADMIN_CHAT_IDS = [c.strip() for c in os.getenv("ADMIN_CHAT_IDS", "").split(",") if c.strip()]
+
+# Update delivery: "polling" (getUpdates) or "webhook" (embedded HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", "8443")))  # Heroku sets PORT
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Only command messages are handled, so don't ask Telegram for anything else
+ALLOWED_UPDATES = ["message"]
+
+# Append-only stock history log (rollups are kept next to it)
+HISTORY_FILE = os.getenv("HISTORY_FILE", "stock_history.bin")
+
+# Subscriber registry backend: "file" (tracked_users.json), "sqlite" or "kv" (KV REST hash)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "file").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "tracked_users.db")
+
+# /check rate limits over a sliding window (0 disables a limit); requests over
+# the limit get the last result or a cooldown reply instead of a new fetch
+CHECK_RATE_WINDOW = float(os.getenv("CHECK_RATE_WINDOW", "60"))
+CHECK_RATE_PER_CHAT = int(os.getenv("CHECK_RATE_PER_CHAT", "3"))
+CHECK_RATE_GLOBAL = int(os.getenv("CHECK_RATE_GLOBAL", "30"))
+
+# /check answers from a result younger than this instead of fetching (seconds, 0 disables)
+STOCK_CACHE_TTL = int(os.getenv("STOCK_CACHE_TTL", "60"))
+
+# Warm-restart checkpoint for scheduler.py (empty path disables), saved every
+# CHECKPOINT_INTERVAL seconds and on shutdown
+CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "checkpoint.json")
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "60"))
+
+# StanShop API resilience
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "5"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.5"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "60"))
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Latencies needed before hedging
+
+# Open StanShop/Telegram connections this many seconds before each check (0 disables),
+# then keep Telegram warm for PREWARM_HOLD_SECONDS in case a broadcast follows
+PREWARM_LEAD_SECONDS = float(os.getenv("PREWARM_LEAD_SECONDS", "5"))
+PREWARM_HOLD_SECONDS = float(os.getenv("PREWARM_HOLD_SECONDS", "30"))
+TELEGRAM_KEEPALIVE_INTERVAL = float(os.getenv("TELEGRAM_KEEPALIVE_INTERVAL", "4"))  # Under httpx's 5s idle expiry
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "300"))
+
+# Logging: level, "text" or "json" lines, records buffered for the writer thread,
+# and the share of per-recipient broadcast lines that are logged (errors always are)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Re-check stock during long broadcasts and stop sending once it sells out (0 disables)
+REVALIDATE_INTERVAL = float(os.getenv("REVALIDATE_INTERVAL", "5"))
+REVALIDATE_TIMEOUT = float(os.getenv("REVALIDATE_TIMEOUT", "5"))
+
 # StanShop API Configuration
 STANSHOP_API_URL = "https://api.getstan.app/api/v1/shop/store/inventory/slug/phonepe-gift-voucher"
 STANSHOP_PRODUCT_URL = "https://www.stanshop.co/in/product/phonepe-gift-voucher"
@@ -30,6 +123,28 @@ def validate_config():
     
     # Note: TELEGRAM_CHAT_ID is optional - users register via /track command
     
+    if BOT_MODE not in ("polling", "webhook"):
+        errors.append(f"BOT_MODE must be 'polling' or 'webhook', got '{BOT_MODE}'.")
+    
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            errors.append("WEBHOOK_URL is required when BOT_MODE=webhook.")
+        if not WEBHOOK_SECRET:
+            errors.append("WEBHOOK_SECRET is required when BOT_MODE=webhook.")
+        elif not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+            errors.append("WEBHOOK_SECRET may only contain A-Z, a-z, 0-9, _ and - (max 256 chars).")
+    
+    if CLUSTER_MODE == "kv" and STORAGE_BACKEND != "kv":
+        # Each host would shard and mark users against its own local registry
+        errors.append(f"CLUSTER_MODE=kv needs STORAGE_BACKEND=kv (got '{STORAGE_BACKEND}').")
+    elif CLUSTER_MODE == "file" and STORAGE_BACKEND == "file":
+        # Instances would overwrite each other's changes to the one JSON file
+        errors.append("CLUSTER_MODE=file needs STORAGE_BACKEND=sqlite or kv (got 'file').")
+    
+    if BROADCAST_CHANNEL_ID and not BROADCAST_CHANNEL_ID.startswith("@") and not BROADCAST_CHANNEL_URL:
+        # Subscribers would be told to join a channel they have no way to find
+        errors.append("BROADCAST_CHANNEL_URL (an invite link) is required when BROADCAST_CHANNEL_ID is a numeric id.")
+    
     if errors:
         print("Configuration Errors:")
         for error in errors:
@@ -45,6 +160,9 @@ if __name__ == "__main__":
     print(f"  TELEGRAM_BOT_TOKEN: {'*' * 10 if TELEGRAM_BOT_TOKEN else 'NOT SET'}")
     print(f"  TELEGRAM_CHAT_ID: {TELEGRAM_CHAT_ID if TELEGRAM_CHAT_ID else 'NOT SET'}")
     print(f"  CHECK_INTERVAL: {CHECK_INTERVAL} seconds")
+    print(f"  BOT_MODE: {BOT_MODE}")
+    if BOT_MODE == "webhook":
+        print(f"  WEBHOOK_URL: {WEBHOOK_URL}/{WEBHOOK_PATH} (listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT})")
     print(f"  STANSHOP_API_URL: {STANSHOP_API_URL}")
     print()
     
@@ -0,0 +1,185 @@
+"""
+Aggregate subscriber counters kept alongside the registry.
+Every registry mutation is turned into counter deltas (total, pending,
+notified, pruned, signups per day), so stats can be read in constant time
+instead of scanning all users.
+"""
+
+import json
+import os
+from datetime import date
+
+STATS_KEY = "tracked_users_stats"
+
+COUNTERS = ("total", "pending", "notified", "pruned")
+SIGNUP_PREFIX = "signups:"
+
+
+def state_of(record):
+    """Registry state of a user record: None, 'pending' or 'notified'."""
+    if record is None:
+        return None
+    return "notified" if record.get("notified", False) else "pending"
+
+
+def transition_deltas(before, after, pruned=False, day=None):
+    """
+    Counter deltas for one user record changing from `before` to `after`.
+
+    Args:
+        before: Previous record (None if the user wasn't tracked)
+        after: New record (None if the user was removed)
+        pruned: Whether the removal was a prune (e.g. the user blocked the bot)
+        day: Signup date, defaults to today
+
+    Returns:
+        dict: Counter name -> delta (zero deltas omitted)
+    """
+    deltas = {}
+    old, new = state_of(before), state_of(after)
+    if old == new:
+        return deltas
+
+    if old is not None:
+        deltas[old] = deltas.get(old, 0) - 1
+        deltas["total"] = deltas.get("total", 0) - 1
+    if new is not None:
+        deltas[new] = deltas.get(new, 0) + 1
+        deltas["total"] = deltas.get("total", 0) + 1
+    if old is None and new is not None:
+        deltas[SIGNUP_PREFIX + (day or date.today()).isoformat()] = 1
+    if new is None and pruned:
+        deltas["pruned"] = 1
+    return {name: delta for name, delta in deltas.items() if delta}
+
+
+def merge_deltas(*many):
+    """Sum several delta dicts."""
+    merged = {}
+    for deltas in many:
+        for name, delta in deltas.items():
+            merged[name] = merged.get(name, 0) + delta
+    return {name: delta for name, delta in merged.items() if delta}
+
+
+def rebuild(users):
+    """Compute counters from a full registry (used once when none exist)."""
+    stats = {name: 0 for name in COUNTERS}
+    for data in users.values():
+        stats = apply_deltas(stats, transition_deltas(None, data, day=_signup_day(data)))
+    return stats
+
+
+def _signup_day(data):
+    try:
+        return date.fromisoformat(data.get("tracked_at", "")[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_deltas(stats, deltas):
+    """Apply deltas to a stats dict in place and return it."""
+    for name, delta in deltas.items():
+        stats[name] = stats.get(name, 0) + delta
+    return stats
+
+
+def recent_signups(stats, days=7):
+    """Signups for the most recent days, newest first: [(date_str, count)]."""
+    signups = [
+        (name[len(SIGNUP_PREFIX):], count) for name, count in stats.items()
+        if name.startswith(SIGNUP_PREFIX)
+    ]
+    return sorted(signups, reverse=True)[:days]
+
+
+def format_stats(stats):
+    """Stats summary for the admin /stats command (Markdown)."""
+    lines = [
+        "📊 *Subscriber Stats*\n",
+        f"👥 Total: {stats.get('total', 0)}",
+        f"🔔 Pending: {stats.get('pending', 0)}",
+        f"✅ Notified: {stats.get('notified', 0)}",
+        f"🧹 Pruned: {stats.get('pruned', 0)}",
+    ]
+    signups = recent_signups(stats)
+    if signups:
+        lines.append("\n*Signups:*")
+        lines.extend(f"{day}: {count}" for day, count in signups)
+    return "\n".join(lines)
+
+
+class FileCounters:
+    """Counters stored in a JSON file next to the registry file."""
+
+    def __init__(self, path, load_registry):
+        self.path = path
+        self._load_registry = load_registry
+
+    def get(self):
+        """Read the counters, rebuilding them from the registry if missing."""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                pass
+        stats = rebuild(self._load_registry())
+        self._save(stats)
+        return stats
+
+    def apply(self, deltas):
+        """
+        Apply deltas. Call after saving the registry change: when no counters
+        exist yet they are rebuilt from the registry, which already has it.
+        """
+        if deltas:
+            if os.path.exists(self.path):
+                self._save(apply_deltas(self.get(), deltas))
+            else:
+                self.get()
+
+    def _save(self, stats):
+        with open(self.path, "w") as f:
+            json.dump(stats, f, indent=2)
+
+
+class KVCounters:
+    """Counters stored as a KV hash and updated with atomic HINCRBY."""
+
+    def __init__(self, load_registry=None, key=STATS_KEY):
+        from api.stock_cache import kv_command
+        self._kv = kv_command
+        self._load_registry = load_registry
+        self.key = key
+        self._exists = False
+
+    def get(self):
+        """Read the counters; rebuild from the registry if none exist yet."""
+        flat = self._kv("HGETALL", self.key) or []
+        if isinstance(flat, dict):
+            stats = {name: int(value) for name, value in flat.items()}
+        else:
+            stats = {flat[i]: int(flat[i + 1]) for i in range(0, len(flat) - 1, 2)}
+        if not stats and self._load_registry is not None:
+            stats = rebuild(self._load_registry())
+            args = [item for pair in stats.items() for item in pair]
+            self._kv("HSET", self.key, *args)
+        self._exists = bool(stats)
+        return stats
+
+    def apply(self, deltas):
+        """
+        Apply deltas atomically per counter. Call after saving the registry
+        change: when no counters exist yet they are rebuilt from the registry.
+        """
+        if not deltas:
+            return
+        if not self._exists and self._load_registry is not None:
+            # Checked once per process; HINCRBY would otherwise start a partial hash
+            if not self._kv("EXISTS", self.key):
+                self.get()
+                return
+            self._exists = True
+        for name, delta in deltas.items():
+            self._kv("HINCRBY", self.key, name, delta)
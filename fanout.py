@@ -0,0 +1,82 @@
+"""
+Channel fan-out for stock alerts.
+Telegram lets a bot send about 30 messages a second, so DMing every
+subscriber takes over an hour at 100k users. With a broadcast channel
+configured, one channel post stands in for the DMs of every matched
+subscriber without filters whose record accepts channel delivery (set by
+`/track`, cleared by `/track dm`); everyone else, including records from
+before channel mode, is still messaged one by one.
+"""
+
+DM_KEYWORD = "dm"
+
+
+def channel_link(channel_id, url=""):
+    """
+    Public link to the broadcast channel.
+
+    Args:
+        channel_id: Channel username (@name) or numeric id
+        url: Explicit invite link, used as is when set
+
+    Returns:
+        str: The link, or "" if none can be derived (private channel without a URL)
+    """
+    if url:
+        return url
+    if channel_id.startswith("@"):
+        return f"https://t.me/{channel_id[1:]}"
+    return ""
+
+
+def parse_delivery(args):
+    """
+    Split the `dm` keyword off /track arguments.
+
+    Args:
+        args: Command arguments, e.g. ["dm", "500"]
+
+    Returns:
+        tuple: (remaining arguments, whether channel delivery is wanted)
+    """
+    args = list(args or [])
+    remaining = [arg for arg in args if arg.lower() != DM_KEYWORD]
+    return remaining, len(remaining) == len(args)
+
+
+def uses_channel(record):
+    """Whether a subscriber's alert is covered by the channel post."""
+    return record is not None and not record.get("filters") and record.get("channel", False)
+
+
+def split_recipients(chat_ids, records):
+    """
+    Split matched subscribers between the channel post and DMs.
+
+    Args:
+        chat_ids: Matched chat ids
+        records: Registry records for (some of) them, keyed by str chat id
+
+    Returns:
+        tuple: (chat ids covered by the channel post, chat ids to DM);
+            chats without a record are DMed, as before channel mode
+    """
+    covered, direct = [], []
+    for chat_id in chat_ids:
+        (covered if uses_channel(records.get(str(chat_id))) else direct).append(chat_id)
+    return covered, direct
+
+
+def format_delivery(filters, channel, link):
+    """
+    Where a subscriber's alerts go, for /track and /status (Markdown).
+
+    Args:
+        filters: The subscriber's filters (None for any voucher)
+        channel: Whether the subscriber accepts channel delivery
+        link: Channel link from channel_link()
+    """
+    if filters or not channel:
+        return "💬 Alerts: private message"
+    where = f"[the alerts channel]({link})" if link else "the alerts channel"
+    return f"📣 Alerts: posted in {where} - join it to get them, or use `/track dm` for a private message"
@@ -0,0 +1,279 @@
+"""
+Append-only stock history for PhonePe voucher checks.
+Every check is stored as fixed-width binary records (one per denomination)
+and read back through a memory map. Hourly and daily availability rollups
+are maintained on append so /history never has to scan the raw log.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from config import HISTORY_FILE
+from inventory import as_denomination
+
+# timestamp (epoch s), denomination (₹), price (paise), discount (% x100), flags, pad
+RECORD = struct.Struct("<IIIHBx")
+RECORD_SIZE = RECORD.size
+
+FLAG_AVAILABLE = 0x01
+
+# Denomination value used for a check that found nothing in stock
+NO_STOCK = 0
+
+BUCKETS = {"hour": 3600, "day": 86400}
+
+# Hourly rollups older than this are dropped; daily ones are kept forever
+HOURLY_RETENTION = 30 * 86400
+
+Record = namedtuple("Record", "timestamp denomination price discount available")
+
+# record_check runs from executor threads (scheduled checks and /check);
+# the rollups are read-modify-written, so updates are serialized
+_lock = threading.RLock()
+
+
+def _rollup_path(path):
+    return path + ".rollup.json"
+
+
+def _to_number(value):
+    """Best-effort numeric conversion for API fields."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def encode_check(timestamp, denominations):
+    """
+    Encode one check result as binary records.
+
+    Args:
+        timestamp: Epoch seconds of the check
+        denominations: Denominations found in stock (may be empty)
+
+    Returns:
+        bytes: One record per denomination, or a single no-stock record
+    """
+    ts = int(timestamp)
+    if not denominations:
+        return RECORD.pack(ts, NO_STOCK, 0, 0, 0)
+
+    chunks = []
+    for denom in denominations:
+        denom = as_denomination(denom)
+        chunks.append(RECORD.pack(
+            ts,
+            int(_to_number(denom.value)),
+            int(round(_to_number(denom.price) * 100)),
+            min(max(int(round(_to_number(denom.discount) * 100)), 0), 0xFFFF),
+            FLAG_AVAILABLE
+        ))
+    return b"".join(chunks)
+
+
+def _empty_rollups():
+    return {"hour": {}, "day": {}, "last_check": None, "last_restock": None, "last_available": False}
+
+
+def load_rollups(path=HISTORY_FILE):
+    """Load precomputed rollups, rebuilding them from the log if missing."""
+    with _lock:
+        try:
+            with open(_rollup_path(path), "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return rebuild_rollups(path)
+
+
+def _save_rollups(rollups, path):
+    tmp = _rollup_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(rollups, f)
+    os.replace(tmp, _rollup_path(path))
+
+
+def _apply_check(rollups, timestamp, available):
+    """Fold one check into the rollups in place."""
+    for name, size in BUCKETS.items():
+        key = str(timestamp - timestamp % size)
+        counts = rollups[name].setdefault(key, [0, 0])
+        counts[0] += 1
+        counts[1] += 1 if available else 0
+
+    if available and not rollups["last_available"]:
+        rollups["last_restock"] = timestamp
+    rollups["last_available"] = available
+    rollups["last_check"] = timestamp
+
+    cutoff = timestamp - HOURLY_RETENTION
+    if len(rollups["hour"]) > HOURLY_RETENTION // 3600:
+        rollups["hour"] = {k: v for k, v in rollups["hour"].items() if int(k) >= cutoff}
+
+
+def record_check(denominations, timestamp=None, path=HISTORY_FILE):
+    """
+    Append one check result to the log and update the rollups.
+
+    Args:
+        denominations: Denominations found in stock (empty if none)
+        timestamp: Epoch seconds of the check (defaults to now)
+        path: History log file
+    """
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    with _lock:
+        # Load first, so a missing rollup file is rebuilt without this check in it
+        rollups = load_rollups(path)
+        with open(path, "ab") as f:
+            f.write(encode_check(timestamp, denominations))
+
+        _apply_check(rollups, timestamp, bool(denominations))
+        _save_rollups(rollups, path)
+
+
+class HistoryLog:
+    """Read-only, memory-mapped view of the history log."""
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self._file = None
+        self._map = None
+        if os.path.exists(path) and os.path.getsize(path) >= RECORD_SIZE:
+            self._file = open(path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def __len__(self):
+        return len(self._map) // RECORD_SIZE if self._map is not None else 0
+
+    def _timestamp(self, index):
+        return struct.unpack_from("<I", self._map, index * RECORD_SIZE)[0]
+
+    def record(self, index):
+        ts, denom, price, discount, flags = RECORD.unpack_from(self._map, index * RECORD_SIZE)
+        return Record(ts, denom, price / 100, discount / 100, bool(flags & FLAG_AVAILABLE))
+
+    def _lower_bound(self, timestamp):
+        """Index of the first record at or after timestamp (log is time-ordered)."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range_scan(self, start=0, end=None):
+        """
+        Yield records with start <= timestamp < end.
+
+        Args:
+            start: Epoch seconds, inclusive
+            end: Epoch seconds, exclusive (None for no upper bound)
+        """
+        index = self._lower_bound(start)
+        stop = self._lower_bound(end) if end is not None else len(self)
+        for i in range(index, stop):
+            yield self.record(i)
+
+    def iter_checks(self, start=0, end=None):
+        """
+        Yield one (timestamp, records) pair per check in the range.
+
+        Records of a single check share its timestamp.
+        """
+        current, records = None, []
+        for record in self.range_scan(start, end):
+            if record.timestamp != current and records:
+                yield current, records
+                records = []
+            current = record.timestamp
+            records.append(record)
+        if records:
+            yield current, records
+
+    def downsample(self, start=0, end=None, bucket="hour"):
+        """
+        Compute availability ratios per bucket from the raw log.
+
+        Args:
+            start: Epoch seconds, inclusive
+            end: Epoch seconds, exclusive
+            bucket: "hour" or "day"
+
+        Returns:
+            list: (bucket_start, availability_ratio, check_count) tuples
+        """
+        size = BUCKETS[bucket]
+        counts = {}
+        for timestamp, records in self.iter_checks(start, end):
+            key = timestamp - timestamp % size
+            total, available = counts.get(key, (0, 0))
+            counts[key] = (total + 1, available + any(r.available for r in records))
+        return [(key, available / total, total) for key, (total, available) in sorted(counts.items())]
+
+
+def rebuild_rollups(path=HISTORY_FILE):
+    """Recompute rollups from the raw log and save them."""
+    rollups = _empty_rollups()
+    with HistoryLog(path) as log:
+        for timestamp, records in log.iter_checks():
+            _apply_check(rollups, timestamp, any(r.available for r in records))
+    if rollups["last_check"] is not None:
+        _save_rollups(rollups, path)
+    return rollups
+
+
+def _rollup_rows(rollups, bucket, since):
+    rows = []
+    for key, (total, available) in rollups[bucket].items():
+        if int(key) >= since and total:
+            rows.append((int(key), available / total, total))
+    return sorted(rows)
+
+
+def get_summary(days=7, path=HISTORY_FILE):
+    """
+    Summarize recent availability from the rollups.
+
+    Returns:
+        dict: 'daily' rows for the last `days` days, 'last_24h' ratio and
+              check count, plus 'last_check' and 'last_restock' timestamps
+    """
+    rollups = load_rollups(path)
+    now = time.time()
+    hourly = _rollup_rows(rollups, "hour", now - 86400)
+    checks_24h = sum(total for _, _, total in hourly)
+    available_24h = sum(ratio * total for _, ratio, total in hourly)
+    return {
+        "daily": _rollup_rows(rollups, "day", now - days * 86400),
+        "last_24h": (available_24h / checks_24h if checks_24h else None, checks_24h),
+        "last_check": rollups["last_check"],
+        "last_restock": rollups["last_restock"],
+    }
+
+
+if __name__ == "__main__":
+    # Print what the log holds
+    with HistoryLog() as log:
+        print(f"{len(log)} records in {HISTORY_FILE}")
+        for bucket_start, ratio, checks in log.downsample(bucket="day"):
+            day = time.strftime("%Y-%m-%d", time.gmtime(bucket_start))
+            print(f"  {day}: {ratio:.0%} available over {checks} checks")
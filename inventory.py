@@ -0,0 +1,175 @@
+"""
+Canonical snapshot of the StanShop inventory.
+Both response layouts the API has served - `inventory.stanValueDenomination`
+and `data.variants` with prices in paise - are normalized once per fetch
+into slotted Denomination records. A Snapshot carries a content fingerprint
+for change detection and renders its /check and alert text at most once,
+however many consumers (bot, scheduler, cron, webhook) use it.
+"""
+
+import hashlib
+import re
+
+NO_STOCK_MESSAGE = "📭 No PhonePe vouchers currently available"
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_number(value):
+    return f"{value:.0f}" if float(value).is_integer() else f"{value:.2f}"
+
+
+class Denomination:
+    """
+    One denomination in stock.
+
+    Args:
+        value: Face value in ₹ (None if the API didn't say)
+        price: Selling price in ₹, if known
+        discount: Discount in percent; derived from value and price when omitted
+    """
+
+    __slots__ = ("value", "price", "discount")
+
+    def __init__(self, value, price=None, discount=None):
+        if discount is None and value and price:
+            discount = (value - price) / value * 100
+        self.value = value
+        self.price = price
+        self.discount = discount
+
+    def to_dict(self):
+        """JSON-safe form, in the stanValueDenomination layout."""
+        return {"value": self.value, "price": self.price, "discount": self.discount}
+
+    def render(self):
+        """One line of the availability message."""
+        line = f"💰 ₹{self.value if self.value is not None else 'Unknown'}"
+        if self.price:
+            line += f" - Price: ₹{_format_number(self.price)}"
+        if self.discount and self.discount > 0:
+            line += f" ({self.discount:.0f}% OFF)"
+        return line
+
+    def __repr__(self):
+        return f"Denomination(value={self.value!r}, price={self.price!r}, discount={self.discount!r})"
+
+
+def as_denomination(entry):
+    """
+    Normalize one denomination entry.
+
+    Args:
+        entry: A Denomination, a stanValueDenomination dict, or a bare value
+
+    Returns:
+        Denomination: The entry itself if it already is one
+    """
+    if isinstance(entry, Denomination):
+        return entry
+    if isinstance(entry, dict):
+        value = _to_number(entry.get("value", entry.get("denomination")))
+        price = _to_number(entry.get("price", entry.get("sellingPrice")))
+        discount = _to_number(entry.get("discount"))
+    else:
+        value, price, discount = _to_number(entry), None, None
+    return Denomination(int(value) if value is not None else None, price, discount)
+
+
+def _from_variant(variant):
+    """Normalize a `data.variants` entry (price in paise, value in the title)."""
+    value = _to_number(variant.get("value", variant.get("denomination")))
+    if value is None:
+        digits = re.search(r"\d+", str(variant.get("title", "")).replace(",", ""))
+        value = float(digits.group()) if digits else None
+    price = _to_number(variant.get("price"))
+    return Denomination(
+        int(value) if value is not None else None,
+        price / 100 if price is not None else None,
+        _to_number(variant.get("discount"))
+    )
+
+
+class Snapshot:
+    """
+    Denominations in stock at one fetch.
+
+    Args:
+        denominations: Denomination records (or entries as_denomination() accepts)
+        product_url: Product page linked from the availability message
+    """
+
+    __slots__ = ("denominations", "fingerprint", "product_url", "_message")
+
+    def __init__(self, denominations, product_url=None):
+        self.denominations = [as_denomination(d) for d in denominations]
+        self.product_url = product_url
+        self.fingerprint = self._fingerprint(self.denominations)
+        self._message = None
+
+    @staticmethod
+    def _fingerprint(denominations):
+        """Order-independent digest of the stock contents."""
+        canonical = sorted(f"{d.value}:{d.price}:{d.discount}" for d in denominations)
+        return hashlib.blake2b("|".join(canonical).encode(), digest_size=8).hexdigest()
+
+    @property
+    def available(self):
+        return bool(self.denominations)
+
+    @property
+    def message(self):
+        """The /check reply and alert text (Markdown), rendered on first use."""
+        if self._message is None:
+            if not self.denominations:
+                self._message = NO_STOCK_MESSAGE
+            else:
+                lines = ["*Available Denominations:*\n"] + [d.render() for d in self.denominations]
+                self._message = "🎉 *PhonePe Vouchers Available!*\n\n" + "\n".join(lines)
+                if self.product_url:
+                    self._message += f"\n\n🔗 [Buy Now]({self.product_url})"
+        return self._message
+
+    def as_dicts(self):
+        """JSON-safe denominations, e.g. for checkpoints and cluster broadcasts."""
+        return [d.to_dict() for d in self.denominations]
+
+    def to_body(self):
+        """The snapshot as an API response body (stanValueDenomination layout)."""
+        return {"inventory": {"stanValueDenomination": self.as_dicts()}}
+
+
+def parse_inventory(data, product_url=None):
+    """
+    Normalize an inventory API response.
+
+    Args:
+        data: Parsed JSON response (None or malformed data means no stock)
+        product_url: Product page linked from the availability message
+
+    Returns:
+        Snapshot: The denominations currently in stock
+    """
+    if not isinstance(data, dict):
+        return Snapshot([], product_url)
+
+    inventory = data.get("inventory")
+    if isinstance(inventory, dict):
+        entries = inventory.get("stanValueDenomination")
+        if not isinstance(entries, list):
+            entries = []
+        return Snapshot([as_denomination(e) for e in entries if e is not None], product_url)
+
+    payload = data.get("data")
+    variants = payload.get("variants") if isinstance(payload, dict) else None
+    if isinstance(variants, list):
+        return Snapshot(
+            [_from_variant(v) for v in variants if isinstance(v, dict) and v.get("available", False)],
+            product_url
+        )
+    return Snapshot([], product_url)
@@ -0,0 +1,142 @@
+"""
+Non-blocking logging for the bot and scheduler.
+Log calls only put the record on a queue; a background listener thread
+formats and writes it, so a large broadcast never waits on stdout. Records
+can carry structured fields (extra={...}) and be emitted as text or JSON.
+Per-recipient lines are sampled; errors are always logged.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+def record_fields(record):
+    """Structured fields attached to a record via extra={...}."""
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """The usual text line, with structured fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that drops (and counts) records instead of blocking when
+    the queue is full. Errors are never dropped; they wait for room.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.ERROR:
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+    def prepare(self, record):
+        # Keep the fields as attributes so the listener can format them
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, queue_size=LOG_QUEUE_SIZE):
+    """
+    Route all logging through a queue drained by a background thread.
+
+    Safe to call more than once; only the first call installs the handlers.
+
+    Args:
+        level: Root log level name, e.g. "INFO"
+        fmt: "text" or "json"
+        queue_size: Records buffered before new ones are dropped
+    """
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        stream = logging.StreamHandler()
+        stream.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        root = logging.getLogger()
+        root.handlers = [_handler]
+        root.setLevel(level)
+        # PTB's HTTP client logs every Bot API request at INFO, one line per recipient
+        for name in ("httpx", "httpcore"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+        _listener = QueueListener(_handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def dropped_records():
+    """Records dropped because the log queue was full."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def sample(rate=LOG_SAMPLE_RATE):
+    """Whether to log this per-recipient event (errors should always be logged)."""
+    return rate >= 1 or random.random() < rate
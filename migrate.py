@@ -0,0 +1,391 @@
+"""
+Streaming export, import and migration of the subscriber registry.
+Users are moved in chunks between tracked_users.json, the SQLite and KV hash
+registry stores (registry.py), the old single-blob KV registry and NDJSON
+files, so memory stays bounded by the chunk size however large the registry
+is. Transfers resume from a cursor file and are verified with record counts
+and checksums.
+
+Usage:
+    python migrate.py copy file:tracked_users.json ndjson:users.ndjson   # export
+    python migrate.py copy ndjson:users.ndjson kv                        # import
+    python migrate.py copy file:tracked_users.json sqlite:tracked_users.db
+    python migrate.py copy kv file:tracked_users.json --chunk-size 5000
+    python migrate.py verify file:tracked_users.json kv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from counters import STATS_KEY
+from registry import iter_object_items, iter_kv_blob, SQLiteStore, KVStore, USERS_HASH_KEY
+
+READ_CHUNK = 64 * 1024
+DEFAULT_CHUNK_SIZE = 1000
+TRACKED_USERS_KEY = "tracked_users"
+TRACKED_USERS_STATS_FILE = "tracked_users_stats.json"
+
+
+class Tally:
+    """Record count and an order-independent checksum of (chat_id, record) pairs."""
+
+    def __init__(self, count=0, checksum=0):
+        self.count = count
+        self.checksum = checksum
+
+    def add(self, chat_id, data):
+        raw = json.dumps([str(chat_id), data], sort_keys=True, separators=(",", ":"))
+        digest = hashlib.blake2b(raw.encode(), digest_size=8).digest()
+        self.count += 1
+        self.checksum = (self.checksum + int.from_bytes(digest, "big")) % 2 ** 64
+
+    def __eq__(self, other):
+        return (self.count, self.checksum) == (other.count, other.checksum)
+
+    def __str__(self):
+        return f"{self.count} records, checksum {self.checksum:016x}"
+
+
+# ---- Backends ----------------------------------------------------------------
+
+class FileRegistry:
+    """A registry JSON file like tracked_users.json, written via a temp file."""
+
+    idempotent = False
+
+    def __init__(self, path):
+        self.path = path
+        self.spec = f"file:{path}"
+        self._tmp = path + ".migrating"
+        self._file = None
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            yield from iter_object_items(lambda: f.read(READ_CHUNK))
+
+    def open(self, resume):
+        """Start (or continue) writing. Returns the bytes already written."""
+        if resume and os.path.exists(self._tmp):
+            self._file = open(self._tmp, "ab")
+            return self._file.tell()
+        self._file = open(self._tmp, "wb")
+        self._file.write(b"{")
+        return 1
+
+    def encode(self, items, written):
+        parts = [f"{json.dumps(str(chat_id))}: {json.dumps(data)}" for chat_id, data in items]
+        return ((", " if written else "") + ", ".join(parts)).encode()
+
+    def append(self, data):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def commit(self):
+        self._file.write(b"}")
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        # Counters are rebuilt from the new registry on next read
+        stats = os.path.join(os.path.dirname(self.path), TRACKED_USERS_STATS_FILE)
+        if os.path.exists(stats):
+            os.remove(stats)
+
+
+class KVRegistry:
+    """
+    The old single-blob registry in KV, read with GETRANGE and written with
+    APPEND to a temp key that is renamed over the live key at the end.
+    """
+
+    idempotent = False
+
+    def __init__(self, key=TRACKED_USERS_KEY):
+        from api.stock_cache import kv_command
+        self._kv = kv_command
+        self.key = key
+        self.spec = f"kvblob:{key}"
+        self._tmp = f"{key}:migrating"
+
+    def _strict(self, *args):
+        result = self._kv(*args)
+        if result is None:
+            raise RuntimeError(f"KV command {args[0]} failed")
+        return result
+
+    def read(self):
+        return iter_kv_blob(self._kv, self.key)
+
+    def open(self, resume):
+        """Start (or continue) writing. Returns the bytes already written."""
+        if resume:
+            written = int(self._strict("STRLEN", self._tmp))
+            if written:
+                return written
+        self._kv("DEL", self._tmp)
+        return int(self._strict("APPEND", self._tmp, "{"))
+
+    def encode(self, items, written):
+        # ASCII-only JSON, so byte offsets and string lengths agree
+        parts = [f"{json.dumps(str(chat_id))}: {json.dumps(data)}" for chat_id, data in items]
+        return ((", " if written else "") + ", ".join(parts)).encode()
+
+    def append(self, data):
+        self._strict("APPEND", self._tmp, data.decode())
+
+    def commit(self):
+        self._strict("APPEND", self._tmp, "}")
+        self._strict("RENAME", self._tmp, self.key)
+        self._kv("DEL", STATS_KEY)
+
+
+class NDJSONRegistry:
+    """One JSON object per line: {"chat_id": ..., <record fields>}. '-' is stdin/stdout."""
+
+    idempotent = False
+
+    def __init__(self, path):
+        self.path = path
+        self.spec = f"ndjson:{path}"
+        self._file = None
+
+    def read(self):
+        f = sys.stdin if self.path == "-" else open(self.path, "r")
+        try:
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    yield str(data.pop("chat_id")), data
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    def open(self, resume):
+        """Start (or continue) writing. Returns the bytes already written."""
+        if self.path == "-":
+            if resume:
+                raise ValueError("Can't resume a transfer to stdout")
+            self._file = sys.stdout.buffer
+            return 0
+        self._file = open(self.path, "ab" if resume else "wb")
+        return self._file.tell()
+
+    def encode(self, items, written):
+        return "".join(json.dumps({"chat_id": str(chat_id), **data}) + "\n" for chat_id, data in items).encode()
+
+    def append(self, data):
+        self._file.write(data)
+        self._file.flush()
+
+    def commit(self):
+        if self._file is not sys.stdout.buffer:
+            self._file.close()
+
+
+class StoreRegistry:
+    """
+    A registry store from registry.py (SQLite or the KV hash), written with
+    put_many. Records already in the store are kept; re-putting a chunk
+    after an interruption is harmless.
+    """
+
+    idempotent = True
+
+    def __init__(self, spec, store):
+        self.spec = spec
+        self.store = store
+
+    def read(self):
+        for chunk in self.store.iter_all(DEFAULT_CHUNK_SIZE):
+            yield from chunk
+
+    def open(self, resume):
+        return 0
+
+    def put(self, items):
+        self.store.put_many(dict(items))
+
+    def commit(self):
+        # Counters are rebuilt from the new registry on next read
+        if isinstance(self.store, KVStore):
+            self.store._kv("DEL", STATS_KEY)
+        else:
+            stats = os.path.join(os.path.dirname(self.store.path), TRACKED_USERS_STATS_FILE)
+            if os.path.exists(stats):
+                os.remove(stats)
+
+
+def open_backend(spec):
+    """
+    Parse a backend spec: file:PATH, sqlite:PATH, kv[:KEY] (the KV hash),
+    kvblob[:KEY] (the old single-blob KV registry) or ndjson:PATH (ndjson:- for stdio).
+    """
+    kind, _, target = spec.partition(":")
+    if kind == "file" and target:
+        return FileRegistry(target)
+    if kind == "sqlite" and target:
+        return StoreRegistry(spec, SQLiteStore(target))
+    if kind in ("kv", "kvblob"):
+        from api.stock_cache import kv_configured
+        if not kv_configured():
+            raise ValueError("KV_REST_API_URL and KV_REST_API_TOKEN must be set")
+        if kind == "kvblob":
+            return KVRegistry(target or TRACKED_USERS_KEY)
+        key = target or USERS_HASH_KEY
+        return StoreRegistry(f"kv:{key}", KVStore(key))
+    if kind == "ndjson" and target:
+        return NDJSONRegistry(target)
+    raise ValueError(
+        f"Unknown backend '{spec}' (use file:PATH, sqlite:PATH, kv[:KEY], kvblob[:KEY] or ndjson:PATH)"
+    )
+
+
+# ---- Transfer ----------------------------------------------------------------
+
+def _load_cursor(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _save_cursor(path, cursor):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cursor, f)
+    os.replace(tmp, path)
+
+
+def tally_backend(backend):
+    """Count and checksum every record of a backend."""
+    tally = Tally()
+    for chat_id, data in backend.read():
+        tally.add(chat_id, data)
+    return tally
+
+
+def copy(source, dest, chunk_size=DEFAULT_CHUNK_SIZE, cursor_path=None, restart=False, progress=None):
+    """
+    Stream every record from source to dest in chunks.
+
+    After each chunk the cursor file records how many records and bytes were
+    written, so an interrupted copy continues where it stopped. The source
+    must not change between runs.
+
+    Args:
+        source, dest: Backends from open_backend()
+        chunk_size: Records per write
+        cursor_path: Cursor file (None disables resuming)
+        restart: Ignore an existing cursor and start over
+        progress: Optional fn(tally, bytes_written, seconds) called per chunk
+
+    Returns:
+        Tally: Count and checksum of the records copied
+
+    Raises:
+        ValueError: If the cursor doesn't match this transfer or dest
+    """
+    cursor = None if restart or cursor_path is None else _load_cursor(cursor_path)
+    transfer = {"source": source.spec, "dest": dest.spec, "chunk_size": chunk_size}
+    if cursor is not None and {k: cursor.get(k) for k in transfer} != transfer:
+        raise ValueError(f"Cursor {cursor_path} belongs to another transfer; use --restart")
+
+    tally = Tally(cursor["count"], cursor["checksum"]) if cursor else Tally()
+    offset = cursor["offset"] if cursor else None
+    written = dest.open(resume=cursor is not None)
+    if offset is None:
+        offset = written
+
+    items = source.read()
+    if tally.count and len(list(islice(items, tally.count))) < tally.count:
+        raise ValueError("Source has fewer records than the cursor; use --restart")
+
+    started, sent = time.monotonic(), 0
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        if dest.idempotent:
+            dest.put(chunk)
+        else:
+            data = dest.encode(chunk, tally.count)
+            if written != offset:
+                # Interrupted after a write but before saving the cursor: the
+                # chunk (same records, same chunking) is already in dest
+                if written != offset + len(data):
+                    raise ValueError(f"{dest.spec} has {written} bytes, cursor expects {offset}; use --restart")
+            else:
+                dest.append(data)
+            offset = written = offset + len(data)
+            sent += len(data)
+        for chat_id, record in chunk:
+            tally.add(chat_id, record)
+        if cursor_path is not None:
+            _save_cursor(cursor_path, dict(transfer, count=tally.count, checksum=tally.checksum, offset=offset))
+        if progress is not None:
+            progress(tally, sent, time.monotonic() - started)
+
+    dest.commit()
+    if cursor_path is not None and os.path.exists(cursor_path):
+        os.remove(cursor_path)
+    return tally
+
+
+def _print_progress(tally, sent, seconds):
+    rate = tally.count / seconds if seconds > 0 else 0
+    size = f"{sent / 1e6:.1f} MB, " if sent else ""
+    print(f"\r{tally.count} records, {size}{rate:,.0f} records/s", end="", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    copy_parser = commands.add_parser("copy", help="Stream all users from SOURCE to DEST")
+    copy_parser.add_argument("source")
+    copy_parser.add_argument("dest")
+    copy_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    copy_parser.add_argument("--cursor", default="migrate.cursor.json", help="Resume cursor file")
+    copy_parser.add_argument("--restart", action="store_true", help="Ignore an existing cursor")
+    copy_parser.add_argument("--no-verify", dest="verify", action="store_false")
+
+    verify_parser = commands.add_parser("verify", help="Compare counts and checksums of two backends")
+    verify_parser.add_argument("source")
+    verify_parser.add_argument("dest")
+
+    args = parser.parse_args()
+    try:
+        source, dest = open_backend(args.source), open_backend(args.dest)
+        if args.command == "verify":
+            expected, actual = tally_backend(source), tally_backend(dest)
+        else:
+            started = time.monotonic()
+            expected = copy(source, dest, args.chunk_size, args.cursor, args.restart, _print_progress)
+            seconds = time.monotonic() - started
+            print(file=sys.stderr)
+            print(f"Copied {expected} in {seconds:.1f}s "
+                  f"({expected.count / seconds if seconds > 0 else 0:,.0f} records/s)", file=sys.stderr)
+            if not args.verify or dest.spec == "ndjson:-":
+                return 0
+            actual = tally_backend(dest)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"\n❌ {e}", file=sys.stderr)
+        return 1
+
+    print(f"{source.spec}: {expected}\n{dest.spec}: {actual}", file=sys.stderr)
+    if actual != expected:
+        print("❌ Verification failed", file=sys.stderr)
+        return 1
+    print("✅ Verified", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,55 +3,176 @@ API Monitor for PhonePe Voucher availability on StanShop.
 Fetches inventory data and tracks denomination availability.
 """
 
+import time
 import requests
 from datetime import datetime
-from config import STANSHOP_API_URL, STANSHOP_PRODUCT_URL
+from config import (
+    STANSHOP_API_URL, STANSHOP_PRODUCT_URL, FETCH_TIMEOUT, REVALIDATE_TIMEOUT,
+    BREAKER_ERROR_RATE, BREAKER_SLOW_CALL_SECONDS, BREAKER_SLOW_RATE,
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_OPEN_SECONDS,
+    HEDGE_REQUESTS, HEDGE_MIN_SAMPLES,
+)
+from history import record_check
+from inventory import Snapshot, parse_inventory
+from resilience import CircuitBreaker, LatencyTracker, hedged_call, OPEN
 
 
 # Store previous state to detect changes
-_previous_denominations = None
+_previous_snapshot = None
 _last_check_time = None
 
+# Reused across checks so keep-alive connections to StanShop are pooled
+_session = None
+
+# Guards the inventory API: stop calling it while it is failing or slow
+_breaker = CircuitBreaker(
+    error_rate=BREAKER_ERROR_RATE,
+    slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+    slow_rate=BREAKER_SLOW_RATE,
+    window=BREAKER_WINDOW,
+    min_calls=BREAKER_MIN_CALLS,
+    open_seconds=BREAKER_OPEN_SECONDS,
+)
+_fetch_latency = LatencyTracker()
+
+# Validators and availability from the last full fetch, for conditional re-checks
+_validators = {}
+_last_available = None
+
+# Last parsed inventory; a fetch with the same contents reuses it and its rendered text
+_last_snapshot = None
+
+# Last successful check_availability() result, served to rate-limited /check calls
+_last_status = None
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "application/json",
+}
+
+
+def _get_session():
+    """Get the shared requests session, creating it on first use."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def _fetch_once():
+    """Make a single timed request to the inventory API."""
+    started = time.monotonic()
+    response = _get_session().get(STANSHOP_API_URL, headers=HEADERS, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    _fetch_latency.add(time.monotonic() - started)
+    return _remember_response(response, data)
+
+
+def _remember_response(response, data):
+    """
+    Parse a response once and keep its cache validators and availability
+    for revalidate_stock().
+    
+    Returns:
+        Snapshot: The parsed inventory, or the previous snapshot if the
+            contents are unchanged (so its rendered text is reused)
+    """
+    global _validators, _last_available, _last_snapshot
+    _validators = {
+        "If-None-Match": response.headers.get("ETag"),
+        "If-Modified-Since": response.headers.get("Last-Modified"),
+    }
+    snapshot = parse_inventory(data, STANSHOP_PRODUCT_URL)
+    if _last_snapshot is None or _last_snapshot.fingerprint != snapshot.fingerprint:
+        _last_snapshot = snapshot
+    _last_available = _last_snapshot.available
+    return _last_snapshot
+
 
 def fetch_inventory():
     """
     Fetch inventory data from StanShop API.
     
+    Calls go through a circuit breaker, so while the API is failing or slow
+    this returns None immediately instead of waiting on another request.
+    With HEDGE_REQUESTS enabled, a second request is fired if the first is
+    still running after the recent p95 latency.
+    
     Returns:
-        dict: API response data or None if request fails
+        Snapshot: The normalized inventory, or None if the request fails
     """
+    if not _breaker.allow():
+        print("Skipping inventory fetch: circuit breaker is open")
+        return None
+    
+    started = time.monotonic()
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "application/json",
-        }
-        response = requests.get(STANSHOP_API_URL, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        if HEDGE_REQUESTS and len(_fetch_latency) >= HEDGE_MIN_SAMPLES:
+            snapshot = hedged_call(_fetch_once, _fetch_latency.percentile(95))
+        else:
+            snapshot = _fetch_once()
+    except (requests.RequestException, ValueError) as e:
+        _breaker.record_failure()
         print(f"Error fetching inventory: {e}")
         return None
+    
+    _breaker.record_success(time.monotonic() - started)
+    return snapshot
 
 
-def parse_denominations(data):
+def warm_connection():
     """
-    Extract denomination information from API response.
+    Open a pooled keep-alive connection to the inventory API ahead of a check.
+    
+    Returns:
+        float: Seconds taken (DNS, TCP and TLS setup), or None if it failed
+    """
+    started = time.monotonic()
+    try:
+        _get_session().head(STANSHOP_API_URL, headers=HEADERS, timeout=REVALIDATE_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"Error warming inventory API connection: {e}")
+        return None
+    return time.monotonic() - started
+
+
+def revalidate_stock():
+    """
+    Cheaply re-check whether vouchers are still in stock.
+    
+    Sends a conditional request with the ETag / Last-Modified of the last
+    full fetch, so an unchanged inventory costs a bodyless 304. Used during
+    long broadcasts to stop sending once stock has sold out.
     
-    Args:
-        data: API response dictionary
-        
     Returns:
-        list: List of denomination dictionaries with value and price info
+        bool: Whether stock is available, or None if it couldn't be checked
     """
-    if not data:
-        return []
+    global _previous_snapshot
+    
+    if _breaker.state == OPEN:
+        return None
     
+    headers = dict(HEADERS)
+    headers.update({name: value for name, value in _validators.items() if value})
     try:
-        inventory = data.get("inventory", {})
-        denominations = inventory.get("stanValueDenomination", [])
-        return denominations if denominations else []
-    except (KeyError, TypeError):
-        return []
+        response = _get_session().get(STANSHOP_API_URL, headers=headers, timeout=REVALIDATE_TIMEOUT)
+        if response.status_code != 304:
+            response.raise_for_status()
+            _remember_response(response, response.json())
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error revalidating stock: {e}")
+        return None
+    
+    if _last_available is False:
+        # Sold out: the next scheduled check must see a fresh out -> in transition
+        _previous_snapshot = Snapshot([], STANSHOP_PRODUCT_URL)
+    return _last_available
+
+
+def get_breaker_state():
+    """Get the inventory API circuit breaker state."""
+    return _breaker.state
 
 
 def check_availability():
@@ -61,122 +182,159 @@ def check_availability():
     Returns:
         dict: Status information including:
             - available: bool indicating if vouchers are in stock
-            - denominations: list of available denominations
+            - denominations: list of available Denomination records
             - message: Human-readable status message
             - check_time: Timestamp of this check
+            - snapshot: The parsed Snapshot (absent on errors)
     """
-    global _last_check_time
+    global _last_check_time, _last_status
     
     _last_check_time = datetime.now()
     
-    data = fetch_inventory()
-    if data is None:
+    snapshot = fetch_inventory()
+    if snapshot is None:
+        if _breaker.state == OPEN:
+            message = "⏳ StanShop API is having trouble. Please try again in a minute."
+        else:
+            message = "❌ Failed to fetch data from StanShop API"
         return {
             "available": False,
             "denominations": [],
-            "message": "❌ Failed to fetch data from StanShop API",
+            "message": message,
             "check_time": _last_check_time,
             "error": True
         }
     
-    denominations = parse_denominations(data)
+    try:
+        record_check(snapshot.denominations, _last_check_time.timestamp())
+    except OSError as e:
+        # History is best-effort (e.g. read-only filesystem on serverless)
+        print(f"Error recording stock history: {e}")
     
-    if denominations:
-        # Format denomination details
-        denom_text = format_denominations(denominations)
-        return {
-            "available": True,
-            "denominations": denominations,
-            "message": f"🎉 *PhonePe Vouchers Available!*\n\n{denom_text}\n\n🔗 [Buy Now]({STANSHOP_PRODUCT_URL})",
-            "check_time": _last_check_time,
-            "error": False
-        }
-    else:
-        return {
-            "available": False,
-            "denominations": [],
-            "message": "📭 No PhonePe vouchers currently available",
-            "check_time": _last_check_time,
-            "error": False
-        }
+    _last_status = {
+        "available": snapshot.available,
+        "denominations": snapshot.denominations,
+        "message": snapshot.message,
+        "check_time": _last_check_time,
+        "error": False,
+        "snapshot": snapshot
+    }
+    return _last_status
 
 
-def format_denominations(denominations):
+def detect_stock_change(status):
     """
-    Format denomination list for display.
+    Compare a check result with the previous one.
+    Only alerts when stock appears (unavailable -> available); a different
+    mix of denominations while in stock is reported but doesn't alert.
     
     Args:
-        denominations: List of denomination objects
-        
-    Returns:
-        str: Formatted string with denomination details
-    """
-    if not denominations:
-        return "No denominations available"
-    
-    lines = ["*Available Denominations:*\n"]
-    
-    for denom in denominations:
-        # Handle different possible data structures
-        if isinstance(denom, dict):
-            value = denom.get("value", denom.get("denomination", "Unknown"))
-            price = denom.get("price", denom.get("sellingPrice", ""))
-            discount = denom.get("discount", "")
-            
-            line = f"💰 ₹{value}"
-            if price:
-                line += f" - Price: ₹{price}"
-            if discount:
-                line += f" ({discount}% OFF)"
-            lines.append(line)
-        else:
-            # If it's just a value
-            lines.append(f"💰 ₹{denom}")
-    
-    return "\n".join(lines)
-
-
-def check_for_stock_change():
-    """
-    Check if stock status has changed from unavailable to available.
-    Used for notifications - only alerts when stock appears.
+        status: Result of check_availability()
     
     Returns:
-        dict: Contains 'changed' bool and full status info
+        dict: Contains 'changed' bool, the snapshot's fingerprint and full status info
     """
-    global _previous_denominations
-    
-    status = check_availability()
+    global _previous_snapshot
     
     if status.get("error"):
         return {"changed": False, "status": status, "reason": "api_error"}
     
-    current_available = status["available"]
-    previous_available = _previous_denominations is not None and len(_previous_denominations) > 0
+    snapshot = status.get("snapshot") or Snapshot(status["denominations"], STANSHOP_PRODUCT_URL)
+    previous = _previous_snapshot
     
     # Detect change: was unavailable, now available
-    stock_appeared = current_available and not previous_available
+    stock_appeared = snapshot.available and not (previous is not None and previous.available)
+    if stock_appeared:
+        reason = "stock_appeared"
+    elif snapshot.available and previous.fingerprint != snapshot.fingerprint:
+        reason = "contents_changed"
+    else:
+        reason = "no_change"
     
     # Update previous state
-    _previous_denominations = status["denominations"]
+    _previous_snapshot = snapshot
     
     return {
         "changed": stock_appeared,
         "status": status,
-        "reason": "stock_appeared" if stock_appeared else "no_change"
+        "fingerprint": snapshot.fingerprint,
+        "reason": reason
     }
 
 
+def check_for_stock_change():
+    """
+    Check if stock status has changed from unavailable to available.
+    Used for notifications - only alerts when stock appears.
+    
+    Returns:
+        dict: Contains 'changed' bool and full status info
+    """
+    return detect_stock_change(check_availability())
+
+
 def get_last_check_time():
     """Get the timestamp of the last check."""
     return _last_check_time
 
 
+def get_last_status():
+    """Get the last successful availability result, or None."""
+    return _last_status
+
+
+def export_state():
+    """
+    Tracking state worth keeping across restarts, as JSON-safe values.
+
+    Returns:
+        dict: Last snapshot, check time, last result and cache validators
+    """
+    status = None
+    if _last_status is not None:
+        status = {key: value for key, value in _last_status.items() if key != "snapshot"}
+        status["check_time"] = _last_status["check_time"].isoformat()
+        status["denominations"] = [d.to_dict() for d in _last_status["denominations"]]
+    return {
+        "previous_denominations": _previous_snapshot.as_dicts() if _previous_snapshot is not None else None,
+        "last_check_time": _last_check_time.isoformat() if _last_check_time else None,
+        "last_status": status,
+        "validators": _validators,
+        "last_available": _last_available,
+    }
+
+
+def restore_state(state):
+    """Restore tracking state saved by export_state()."""
+    global _previous_snapshot, _last_check_time, _validators, _last_available, _last_status, _last_snapshot
+    previous = state.get("previous_denominations")
+    _previous_snapshot = Snapshot(previous, STANSHOP_PRODUCT_URL) if previous is not None else None
+    last_check = state.get("last_check_time")
+    _last_check_time = datetime.fromisoformat(last_check) if last_check else None
+    status = state.get("last_status")
+    if status is not None:
+        snapshot = Snapshot(status.get("denominations") or [], STANSHOP_PRODUCT_URL)
+        status = dict(
+            status,
+            check_time=datetime.fromisoformat(status["check_time"]),
+            denominations=snapshot.denominations,
+            snapshot=snapshot
+        )
+        _last_snapshot = snapshot
+    _last_status = status
+    _validators = state.get("validators") or {}
+    _last_available = state.get("last_available")
+
+
 def reset_tracking():
     """Reset tracking state (useful for testing)."""
-    global _previous_denominations, _last_check_time
-    _previous_denominations = None
+    global _previous_snapshot, _last_check_time, _validators, _last_available, _last_status, _last_snapshot
+    _previous_snapshot = None
     _last_check_time = None
+    _validators = {}
+    _last_available = None
+    _last_status = None
+    _last_snapshot = None
 
 
 if __name__ == "__main__":
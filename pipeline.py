@@ -0,0 +1,154 @@
+"""
+Staged async pipeline for the check-and-notify flow.
+Each stage runs its own workers and hands items to the next stage through
+a bounded queue, so slow stages apply backpressure, memory stays flat and
+stages overlap (rendering and storage writes don't wait on network sends).
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+
+class StageStats:
+    """Counters for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.received = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def throughput(self):
+        """Items handled per second of stage wall time."""
+        end = self.finished_at or time.monotonic()
+        elapsed = end - self.started_at if self.started_at else 0
+        return self.received / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self, queue=None):
+        return {
+            "stage": self.name,
+            "received": self.received,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "queue_depth": queue.qsize() if queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "throughput": round(self.throughput, 1),
+        }
+
+
+class Stage:
+    """
+    One pipeline stage.
+
+    Args:
+        name: Stage name used in stats and logs
+        handler: async fn(item, emit) that processes one item and calls
+            `await emit(output)` for each output it produces
+        concurrency: Number of workers for this stage
+        queue_size: Capacity of the queue feeding this stage
+        on_finish: Optional async fn(emit) called once after the last item,
+            e.g. to flush a batch
+    """
+
+    def __init__(self, name, handler, concurrency=1, queue_size=100, on_finish=None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.on_finish = on_finish
+
+
+class Pipeline:
+    """Runs a list of stages connected by bounded queues."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.stats = [StageStats(stage.name) for stage in stages]
+
+    def snapshot(self):
+        """Current per-stage stats, including live queue depths."""
+        return [stats.as_dict(queue) for stats, queue in zip(self.stats, self.queues)]
+
+    def _emitter(self, index):
+        stats = self.stats[index]
+        if index + 1 >= len(self.stages):
+            async def emit(item):
+                stats.emitted += 1
+            return emit
+
+        queue, next_stats = self.queues[index + 1], self.stats[index + 1]
+
+        async def emit(item):
+            stats.emitted += 1
+            await queue.put(item)
+            next_stats.max_queue_depth = max(next_stats.max_queue_depth, queue.qsize())
+        return emit
+
+    async def _worker(self, index):
+        stage, stats, queue = self.stages[index], self.stats[index], self.queues[index]
+        emit = self._emitter(index)
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            stats.received += 1
+            started = time.monotonic()
+            try:
+                await stage.handler(item, emit)
+            except Exception as e:
+                stats.errors += 1
+                logger.error(f"Pipeline stage '{stage.name}' failed: {e}")
+            stats.busy_seconds += time.monotonic() - started
+
+    async def _run_stage(self, index):
+        stage, stats = self.stages[index], self.stats[index]
+        stats.started_at = time.monotonic()
+        await asyncio.gather(*(self._worker(index) for _ in range(stage.concurrency)))
+        if stage.on_finish is not None:
+            await stage.on_finish(self._emitter(index))
+        stats.finished_at = time.monotonic()
+        # Let every worker of the next stage see the end of the stream
+        if index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].concurrency):
+                await self.queues[index + 1].put(_DONE)
+
+    async def run(self, items):
+        """
+        Push items through all stages and wait for the pipeline to drain.
+
+        Returns:
+            list: Final per-stage stats
+        """
+        runners = [asyncio.ensure_future(self._run_stage(i)) for i in range(len(self.stages))]
+        try:
+            for item in items:
+                await self.queues[0].put(item)
+            for _ in range(self.stages[0].concurrency):
+                await self.queues[0].put(_DONE)
+            await asyncio.gather(*runners)
+        finally:
+            for runner in runners:
+                runner.cancel()
+        return self.snapshot()
+
+
+def format_stats(stats):
+    """One log line per stage."""
+    return "\n".join(
+        f"  {s['stage']:<8} in={s['received']:<6} out={s['emitted']:<6} err={s['errors']:<4} "
+        f"queue={s['queue_depth']:<4} max_queue={s['max_queue_depth']:<4} busy={s['busy_seconds']:.2f}s {s['throughput']:.1f}/s"
+        for s in stats
+    )
@@ -0,0 +1,180 @@
+"""
+Predictive polling for restock hours.
+Learns how likely a restock is in each hour of the week from the stock
+history log, then spreads a fixed daily request budget so that likely
+hours are polled often and quiet hours rarely.
+"""
+
+import math
+import time
+from datetime import datetime
+from apscheduler.triggers.base import BaseTrigger
+
+from config import HISTORY_FILE, POLL_BUDGET_PER_DAY, POLL_MAX_PER_HOUR, POLL_FLOOR_SHARE
+from history import HistoryLog
+
+HOURS_PER_WEEK = 168
+WEEK = HOURS_PER_WEEK * 3600
+
+# Pseudo-observations pulling sparse buckets toward the overall restock rate
+SMOOTHING = 2.0
+
+
+def week_bucket(timestamp):
+    """Hour-of-week bucket (0 = Monday 00:00 UTC) for an epoch timestamp."""
+    t = time.gmtime(timestamp)
+    return t.tm_wday * 24 + t.tm_hour
+
+
+def restock_events(path=HISTORY_FILE, start=0, end=None):
+    """
+    Find restocks in the history log.
+
+    Returns:
+        list: (restock_time, sold_out_time) pairs; sold_out_time is None if
+              stock was still available at the end of the range
+    """
+    events = []
+    restocked_at = None
+    with HistoryLog(path) as log:
+        for timestamp, records in log.iter_checks(start, end):
+            available = any(r.available for r in records)
+            if available and restocked_at is None:
+                restocked_at = timestamp
+            elif not available and restocked_at is not None:
+                events.append((restocked_at, timestamp))
+                restocked_at = None
+    if restocked_at is not None:
+        events.append((restocked_at, None))
+    return events
+
+
+def learn_probabilities(path=HISTORY_FILE, start=0, end=None):
+    """
+    Estimate restock likelihood per hour-of-week bucket.
+
+    Each bucket's probability is restocks seen in it divided by the number
+    of weeks it was observed, smoothed toward the overall rate.
+
+    Returns:
+        list: 168 probabilities (uniform when there is no history)
+    """
+    restocks = [0] * HOURS_PER_WEEK
+    observed = [set() for _ in range(HOURS_PER_WEEK)]
+
+    with HistoryLog(path) as log:
+        for timestamp, _ in log.iter_checks(start, end):
+            observed[week_bucket(timestamp)].add(timestamp // WEEK)
+    for restocked_at, _ in restock_events(path, start, end):
+        restocks[week_bucket(restocked_at)] += 1
+
+    weeks = [len(seen) for seen in observed]
+    total_weeks = sum(weeks)
+    if not total_weeks:
+        return [1.0 / HOURS_PER_WEEK] * HOURS_PER_WEEK
+
+    prior = sum(restocks) / total_weeks
+    return [
+        (restocks[b] + SMOOTHING * prior) / (weeks[b] + SMOOTHING)
+        for b in range(HOURS_PER_WEEK)
+    ]
+
+
+def build_plan(probabilities, budget_per_day=POLL_BUDGET_PER_DAY,
+               max_per_hour=POLL_MAX_PER_HOUR, floor_share=POLL_FLOOR_SHARE):
+    """
+    Turn restock probabilities into polls per hour-of-week.
+
+    A floor_share of the budget is spread evenly so no hour goes blind; the
+    rest goes to buckets in proportion to their probability, capped at
+    max_per_hour with any excess handed to the remaining buckets.
+
+    Returns:
+        list: 168 integers, polls to make in each hour of the week
+    """
+    budget = budget_per_day * 7
+    floor = budget * floor_share / HOURS_PER_WEEK
+    shares = [floor] * HOURS_PER_WEEK
+    remaining = budget - floor * HOURS_PER_WEEK
+
+    # Water-fill the rest by probability, respecting the per-hour cap
+    open_buckets = [b for b in range(HOURS_PER_WEEK) if shares[b] < max_per_hour]
+    while remaining > 1e-9 and open_buckets:
+        weights = [probabilities[b] for b in open_buckets]
+        if not sum(weights):
+            weights = [1.0] * len(open_buckets)
+        total_weight = sum(weights)
+        overflow = 0.0
+        for b, weight in zip(open_buckets, weights):
+            shares[b] += remaining * weight / total_weight
+            if shares[b] > max_per_hour:
+                overflow += shares[b] - max_per_hour
+                shares[b] = max_per_hour
+        remaining = overflow
+        open_buckets = [b for b in open_buckets if shares[b] < max_per_hour]
+
+    # Largest-remainder rounding keeps the total on budget
+    plan = [math.floor(s) for s in shares]
+    leftover = int(round(sum(shares))) - sum(plan)
+    by_remainder = sorted(range(HOURS_PER_WEEK), key=lambda b: shares[b] - plan[b], reverse=True)
+    for b in by_remainder[:max(leftover, 0)]:
+        plan[b] += 1
+    return plan
+
+
+def next_poll_time(plan, after):
+    """
+    First planned poll strictly after a timestamp.
+
+    Polls within an hour are spread evenly across it.
+
+    Args:
+        plan: 168 polls-per-hour counts from build_plan
+        after: Epoch seconds
+
+    Returns:
+        float: Epoch seconds of the next poll, or None if the plan is empty
+    """
+    hour_start = int(after) - int(after) % 3600
+    for offset in range(HOURS_PER_WEEK + 1):
+        start = hour_start + offset * 3600
+        polls = plan[week_bucket(start)]
+        if not polls:
+            continue
+        spacing = 3600 / polls
+        k = max(0, math.floor((after - start) / spacing) + 1)
+        if k < polls:
+            return start + k * spacing
+    return None
+
+
+def describe_plan(plan):
+    """Short human-readable summary of where the budget goes."""
+    busiest = sorted(range(HOURS_PER_WEEK), key=lambda b: plan[b], reverse=True)[:5]
+    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    hot = ", ".join(f"{days[b // 24]} {b % 24:02d}:00 UTC x{plan[b]}" for b in busiest)
+    return f"{sum(plan)} polls/week; busiest hours: {hot}"
+
+
+class PlanTrigger(BaseTrigger):
+    """APScheduler trigger that fires according to a polling plan."""
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        after = now.timestamp()
+        if previous_fire_time is not None:
+            after = max(after, previous_fire_time.timestamp())
+        next_time = next_poll_time(self.plan, after)
+        if next_time is None:
+            return None
+        return datetime.fromtimestamp(next_time, tz=now.tzinfo)
+
+    def __str__(self):
+        return f"plan[{sum(self.plan)} polls/week]"
+
+
+if __name__ == "__main__":
+    plan = build_plan(learn_probabilities())
+    print(describe_plan(plan))
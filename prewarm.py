@@ -0,0 +1,72 @@
+"""
+Connection pre-warming for the check-and-notify path.
+DNS answers are cached with a TTL, and shortly before each scheduled check
+the StanShop and Telegram connections are opened ahead of time, so the
+check and the alerts right after it skip DNS, TCP and TLS setup.
+"""
+
+import socket
+import threading
+import time
+
+from config import DNS_CACHE_TTL
+
+_original_getaddrinfo = socket.getaddrinfo
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_dns_ttl = 0
+
+# Latest warm-up timings (seconds) per target, i.e. setup moved off the critical path
+_warmups = {}
+
+
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    key = (host, port, family, type, proto, flags)
+    now = time.monotonic()
+    with _dns_lock:
+        hit = _dns_cache.get(key)
+    if hit is not None and hit[0] > now:
+        return list(hit[1])
+    # Failures raise and are not cached
+    result = _original_getaddrinfo(host, port, family, type, proto, flags)
+    with _dns_lock:
+        _dns_cache[key] = (now + _dns_ttl, result)
+    return list(result)
+
+
+def install_dns_cache(ttl=DNS_CACHE_TTL):
+    """
+    Cache socket.getaddrinfo results process-wide for `ttl` seconds.
+
+    Covers requests (StanShop, KV) and python-telegram-bot's HTTP client,
+    which both resolve through getaddrinfo. Safe to call more than once.
+
+    Args:
+        ttl: Cache lifetime in seconds (0 leaves resolution uncached)
+    """
+    global _dns_ttl
+    if ttl <= 0:
+        return
+    _dns_ttl = ttl
+    socket.getaddrinfo = _cached_getaddrinfo
+
+
+def record_warmup(target, seconds):
+    """Record how long warming a connection took (None if it failed)."""
+    _warmups[target] = {"seconds": seconds, "at": time.time()}
+
+
+def get_warmups():
+    """Latest warm-up timings per target."""
+    return dict(_warmups)
+
+
+def format_warmups():
+    """One-line summary of the latest warm-ups, or '' if none ran yet."""
+    parts = []
+    for target, warmup in sorted(_warmups.items()):
+        if warmup["seconds"] is None:
+            parts.append(f"{target} failed")
+        else:
+            parts.append(f"{target} {warmup['seconds'] * 1000:.0f}ms")
+    return "Pre-warmed: " + ", ".join(parts) if parts else ""
@@ -0,0 +1,170 @@
+"""
+Sliding-window rate limits for expensive commands like /check.
+Each key keeps only two counters - this window's and the previous one's -
+and the request rate is estimated by weighting the previous window by how
+much of it still overlaps the sliding window. Limits apply per chat and
+globally, in process for the polling bot or in KV for serverless instances.
+"""
+
+import math
+import threading
+import time
+
+GLOBAL_KEY = "*"
+
+
+def estimate(previous, current, elapsed, window):
+    """Requests in the sliding window ending now, from the two fixed-window counts."""
+    return previous * (1 - elapsed / window) + current
+
+
+def retry_after(previous, current, elapsed, window, limit):
+    """
+    Seconds until one more request fits under the limit.
+
+    Args:
+        previous: Count in the previous fixed window
+        current: Count in the current fixed window
+        elapsed: Seconds since the current window started
+        window: Window length in seconds
+        limit: Maximum requests per window
+
+    Returns:
+        float: 0 if a request is allowed now
+    """
+    if estimate(previous, current, elapsed, window) + 1 <= limit:
+        return 0.0
+    if current + 1 <= limit and previous:
+        # The previous window's share decays enough later in this window
+        return max(0.0, window * (1 - (limit - 1 - current) / previous) - elapsed)
+    # Not before the next window, where this window's count is the previous one
+    wait = window - elapsed
+    if current:
+        wait += max(0.0, window * (1 - (limit - 1) / current))
+    return wait
+
+
+def _duration(seconds):
+    seconds = max(1, math.ceil(seconds))
+    return f"{seconds}s" if seconds < 120 else f"{seconds // 60} min"
+
+
+def format_limited(wait, message=None, age=None):
+    """
+    Reply for a rate-limited /check (Markdown).
+
+    Args:
+        wait: Seconds until a fresh check is allowed
+        message: Last stock result to repeat, if there is one
+        age: Seconds since that result was fetched
+
+    Returns:
+        str: The last result with its age, or a cooldown notice
+    """
+    if message is None:
+        return f"⏳ Too many stock checks right now. Please try again in {_duration(wait)}."
+    return f"{message}\n\n_Checked {_duration(age or 0)} ago. Try again in {_duration(wait)} for a fresh check._"
+
+
+class SlidingWindowLimiter:
+    """
+    In-process per-chat and global limits.
+
+    Args:
+        per_chat: Requests allowed per chat per window (0 disables)
+        global_limit: Requests allowed across all chats per window (0 disables)
+        window: Window length in seconds
+        clock: Time source, for tests and benchmarks
+    """
+
+    def __init__(self, per_chat, global_limit, window, clock=time.time):
+        self.per_chat = per_chat
+        self.global_limit = global_limit
+        self.window = window
+        self.clock = clock
+        self._counts = {}  # key -> [window index, current count, previous count]
+        self._lock = threading.Lock()
+        self._pruned = 0
+
+    def _limits(self, chat_id):
+        limits = []
+        if self.per_chat > 0:
+            limits.append((str(chat_id), self.per_chat))
+        if self.global_limit > 0:
+            limits.append((GLOBAL_KEY, self.global_limit))
+        return limits
+
+    def _roll(self, key, index):
+        entry = self._counts.get(key)
+        if entry is None or entry[0] < index - 1:
+            entry = self._counts[key] = [index, 0, 0]
+        elif entry[0] == index - 1:
+            entry[:] = [index, 0, entry[1]]
+        return entry
+
+    def _prune(self, index):
+        # Keys idle for two windows count nothing any more
+        if index - self._pruned < 2:
+            return
+        self._counts = {key: entry for key, entry in self._counts.items() if entry[0] >= index - 1}
+        self._pruned = index
+
+    def acquire(self, chat_id):
+        """
+        Count a request if it is within every limit.
+
+        Returns:
+            float: 0 if allowed, else seconds until the chat may try again
+        """
+        now = self.clock()
+        index, elapsed = divmod(now, self.window)
+        with self._lock:
+            self._prune(index)
+            entries = [(self._roll(key, index), limit) for key, limit in self._limits(chat_id)]
+            wait = max(
+                (retry_after(entry[2], entry[1], elapsed, self.window, limit) for entry, limit in entries),
+                default=0.0
+            )
+            if wait == 0:
+                for entry, _ in entries:
+                    entry[1] += 1
+            return wait
+
+
+class KVSlidingWindowLimiter(SlidingWindowLimiter):
+    """
+    The same limits shared by every serverless instance through KV.
+
+    Counters are plain KV integers per key and fixed window, expiring after
+    two windows. A request is counted with INCR and taken back with DECR
+    if it turns out to be over a limit.
+    """
+
+    def __init__(self, per_chat, global_limit, window, prefix="ratelimit:check", clock=time.time):
+        super().__init__(per_chat, global_limit, window, clock)
+        from api.stock_cache import kv_command
+        self._kv = kv_command
+        self.prefix = prefix
+
+    def _key(self, key, index):
+        return f"{self.prefix}:{key}:{int(index)}"
+
+    def acquire(self, chat_id):
+        now = self.clock()
+        index, elapsed = divmod(now, self.window)
+        counted, wait = [], 0.0
+        for key, limit in self._limits(chat_id):
+            current_key = self._key(key, index)
+            current = self._kv("INCR", current_key)
+            if current is None:
+                # KV unavailable: don't block commands on the limiter
+                continue
+            counted.append(current_key)
+            if int(current) == 1:
+                self._kv("EXPIRE", current_key, int(self.window * 2) + 1)
+            previous = int(self._kv("GET", self._key(key, index - 1)) or 0)
+            wait = max(wait, retry_after(previous, int(current) - 1, elapsed, self.window, limit))
+        if wait > 0:
+            for current_key in counted:
+                self._kv("DECR", current_key)
+        return wait
@@ -0,0 +1,532 @@
+"""
+Subscriber registry storage.
+One interface over every place subscribers are kept - the JSON file, SQLite
+and a KV hash over the REST API - with batch-first operations, so the bot,
+the cron and the webhook share one implementation of each storage path.
+"""
+
+import ast
+import json
+import os
+import re
+import sys
+import threading
+
+USERS_HASH_KEY = "tracked_users:by_id"
+LEGACY_KV_KEY = "tracked_users"
+DEFAULT_CHUNK_SIZE = 500
+READ_CHUNK = 64 * 1024
+
+# Keeps IN (...) lists and multi-field KV commands to a sane size
+_BATCH = 500
+
+
+def iter_object_items(read):
+    """
+    Yield (key, value) pairs of a JSON object without loading it whole.
+
+    Args:
+        read: Callable returning the next piece of text, or '' at the end
+
+    Raises:
+        ValueError: If the text is not a JSON object
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = read()
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def peek(skip=""):
+        # Next significant character, skipping whitespace and `skip`
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n" + skip:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            fill()
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A value running to the end of the buffer may be cut short
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    if peek() != "{":
+        raise ValueError("Registry is not a JSON object")
+    pos += 1
+    while True:
+        char = peek(",")
+        if char == "}":
+            return
+        if not char:
+            raise ValueError("Registry ends unexpectedly")
+        key = decode()
+        if peek() != ":":
+            raise ValueError(f"Expected ':' after key {key!r}")
+        pos += 1
+        peek()
+        yield key, decode()
+
+
+def iter_kv_blob(kv, key=LEGACY_KV_KEY):
+    """
+    Yield (chat_id, record) pairs of a registry stored as one KV string,
+    read in pieces with GETRANGE.
+
+    Args:
+        kv: kv_command-like callable
+        key: Key holding the registry
+    """
+    head = kv("GETRANGE", key, 0, 63) or ""
+    if re.match(r"\s*\{\s*'", head):
+        # Written by vercel_kv as a Python dict repr - can only be parsed whole
+        print("Warning: registry is a Python literal, loading it in one piece", file=sys.stderr)
+        yield from ast.literal_eval(kv("GET", key)).items()
+        return
+    offset = 0
+
+    def read_chunk():
+        nonlocal offset
+        chunk = kv("GETRANGE", key, offset, offset + READ_CHUNK - 1) or ""
+        offset += len(chunk.encode())
+        return chunk
+
+    if head:
+        yield from iter_object_items(read_chunk)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class RegistryStore:
+    """
+    Storage protocol for the subscriber registry.
+
+    Records are dicts (username, tracked_at, notified, filters) keyed by chat
+    id as a string. Mutations return the records they replaced, so callers
+    can derive counter deltas without another read. Backends implement
+    get_many, put_many, remove_many, iter_all and count; the rest has
+    batch-friendly defaults that backends may override.
+    """
+
+    def get_many(self, chat_ids):
+        """Records of the given chats that exist: {chat_id: record}."""
+        raise NotImplementedError
+
+    def put_many(self, records):
+        """
+        Insert or replace records.
+
+        Args:
+            records: {chat_id: record}
+
+        Returns:
+            dict: {chat_id: previous record or None}
+        """
+        raise NotImplementedError
+
+    def remove_many(self, chat_ids):
+        """Remove chats. Returns {chat_id: previous record} for those that existed."""
+        raise NotImplementedError
+
+    def iter_all(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield every (chat_id, record) pair, in lists of up to chunk_size."""
+        raise NotImplementedError
+
+    def count(self):
+        """Number of tracked users."""
+        raise NotImplementedError
+
+    def get(self, chat_id):
+        """A user's record, or None if they aren't tracked."""
+        return self.get_many([chat_id]).get(str(chat_id))
+
+    def put(self, chat_id, record):
+        """Insert or replace one record. Returns the previous record or None."""
+        return self.put_many({str(chat_id): record}).get(str(chat_id))
+
+    def remove(self, chat_id):
+        """Remove one chat. Returns its previous record, or None if it wasn't tracked."""
+        return self.remove_many([chat_id]).get(str(chat_id))
+
+    def mark_notified_many(self, chat_ids):
+        """
+        Mark pending users as notified.
+
+        Returns:
+            dict: {chat_id: previous record} for the users that changed
+        """
+        pending = {
+            chat_id: record for chat_id, record in self.get_many(chat_ids).items()
+            if not record.get("notified", False)
+        }
+        if pending:
+            self.put_many({chat_id: dict(record, notified=True) for chat_id, record in pending.items()})
+        return pending
+
+    def iter_pending(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield (chat_id, record) pairs of users not yet notified, in lists of up to chunk_size."""
+        chunk = []
+        for batch in self.iter_all(chunk_size):
+            chunk.extend(item for item in batch if not item[1].get("notified", False))
+            if len(chunk) >= chunk_size:
+                yield chunk[:chunk_size]
+                chunk = chunk[chunk_size:]
+        if chunk:
+            yield chunk
+
+    def load_all(self):
+        """The whole registry as {chat_id: record}."""
+        return {chat_id: record for chunk in self.iter_all() for chat_id, record in chunk}
+
+    def load_pending(self):
+        """Users not yet notified as {chat_id: record}."""
+        return {chat_id: record for chunk in self.iter_pending() for chat_id, record in chunk}
+
+    def import_from(self, source, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Copy every record of another store into this one. Returns the count."""
+        copied = 0
+        for chunk in source.iter_all(chunk_size):
+            self.put_many(dict(chunk))
+            copied += len(chunk)
+        return copied
+
+
+class FileStore(RegistryStore):
+    """
+    The registry as one JSON file (tracked_users.json).
+
+    The parsed file is cached until its mtime or size changes, and every
+    batch operation costs at most one load and one save. Saves go through a
+    temp file and os.replace, so readers never see a half-written registry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._users = {}
+        self._stamp = None
+
+    def _load(self, strict=False):
+        """
+        The parsed registry, re-read if the file changed.
+
+        Args:
+            strict: Raise instead of treating an unreadable file as empty;
+                used before writes, which would otherwise replace it with
+                (nearly) no users
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._users, self._stamp = {}, None
+            return self._users
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            try:
+                with open(self.path, "r") as f:
+                    self._users = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                if strict:
+                    raise RuntimeError(f"Cannot read {self.path}, refusing to overwrite it: {e}") from e
+                return {}
+            self._stamp = stamp
+        return self._users
+
+    def _save(self, users):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(users, f, indent=2)
+        os.replace(tmp, self.path)
+        stat = os.stat(self.path)
+        self._users, self._stamp = users, (stat.st_mtime_ns, stat.st_size)
+
+    def get_many(self, chat_ids):
+        with self._lock:
+            users = self._load()
+            keys = (str(chat_id) for chat_id in chat_ids)
+            return {key: dict(users[key]) for key in keys if key in users}
+
+    def put_many(self, records):
+        with self._lock:
+            users = self._load(strict=True)
+            previous = {}
+            for chat_id, record in records.items():
+                previous[str(chat_id)] = users.get(str(chat_id))
+                users[str(chat_id)] = record
+            if records:
+                self._save(users)
+            return previous
+
+    def remove_many(self, chat_ids):
+        with self._lock:
+            users = self._load(strict=True)
+            previous = {}
+            for chat_id in chat_ids:
+                record = users.pop(str(chat_id), None)
+                if record is not None:
+                    previous[str(chat_id)] = record
+            if previous:
+                self._save(users)
+            return previous
+
+    def mark_notified_many(self, chat_ids):
+        with self._lock:
+            users = self._load(strict=True)
+            previous = {}
+            for chat_id in chat_ids:
+                record = users.get(str(chat_id))
+                if record is not None and not record.get("notified", False):
+                    previous[str(chat_id)] = record
+                    users[str(chat_id)] = dict(record, notified=True)
+            if previous:
+                self._save(users)
+            return previous
+
+    def iter_all(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        with self._lock:
+            items = list(self._load().items())
+        yield from _chunks(items, chunk_size)
+
+    def load_all(self):
+        with self._lock:
+            return dict(self._load())
+
+    def count(self):
+        with self._lock:
+            return len(self._load())
+
+
+class SQLiteStore(RegistryStore):
+    """
+    The registry as a SQLite table, one row per user.
+
+    Single-user reads and writes touch one row instead of the whole
+    registry, and pending users are paged off an index on (notified, chat_id).
+    """
+
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "chat_id TEXT PRIMARY KEY, notified INTEGER NOT NULL, record TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS users_pending ON users (notified, chat_id)")
+
+    def _write(self, statement, rows):
+        # One transaction per batch; the lock keeps threads from interleaving them
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(statement, rows)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def get_many(self, chat_ids):
+        found = {}
+        with self._lock:
+            for batch in _chunks((str(chat_id) for chat_id in chat_ids), _BATCH):
+                rows = self._db.execute(
+                    f"SELECT chat_id, record FROM users WHERE chat_id IN ({','.join('?' * len(batch))})", batch
+                )
+                found.update((chat_id, json.loads(record)) for chat_id, record in rows)
+        return found
+
+    def put_many(self, records):
+        with self._lock:
+            found = self.get_many(records)
+            self._write(
+                "INSERT INTO users (chat_id, notified, record) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET notified = excluded.notified, record = excluded.record",
+                [(str(chat_id), int(bool(record.get("notified", False))), json.dumps(record))
+                 for chat_id, record in records.items()]
+            )
+        return {str(chat_id): found.get(str(chat_id)) for chat_id in records}
+
+    def remove_many(self, chat_ids):
+        with self._lock:
+            previous = self.get_many(chat_ids)
+            if previous:
+                self._write("DELETE FROM users WHERE chat_id = ?", [(chat_id,) for chat_id in previous])
+        return previous
+
+    def mark_notified_many(self, chat_ids):
+        with self._lock:
+            previous = {
+                chat_id: record for chat_id, record in self.get_many(chat_ids).items()
+                if not record.get("notified", False)
+            }
+            if previous:
+                self._write(
+                    "UPDATE users SET notified = 1, record = ? WHERE chat_id = ?",
+                    [(json.dumps(dict(record, notified=True)), chat_id) for chat_id, record in previous.items()]
+                )
+        return previous
+
+    def _pages(self, where, chunk_size):
+        # Keyset pagination: each page starts after the last chat id seen
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT chat_id, record FROM users WHERE {where} chat_id > ? ORDER BY chat_id LIMIT ?",
+                    (last, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [(chat_id, json.loads(record)) for chat_id, record in rows]
+            last = rows[-1][0]
+
+    def iter_all(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        return self._pages("", chunk_size)
+
+    def iter_pending(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        return self._pages("notified = 0 AND", chunk_size)
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class KVStore(RegistryStore):
+    """
+    The registry as a KV hash (chat id -> record JSON) over the REST API.
+
+    Reads and writes address individual fields (HMGET/HSET/HDEL), and scans
+    page through the hash with HSCAN. The first call in a process moves a
+    registry left in the old single `tracked_users` blob into the hash.
+    """
+
+    def __init__(self, key=USERS_HASH_KEY, legacy_key=LEGACY_KV_KEY):
+        from api.stock_cache import kv_command
+        self._kv = kv_command
+        self.key = key
+        self.legacy_key = legacy_key
+        self._migrated = legacy_key is None
+
+    def _strict(self, *args):
+        result = self._kv(*args)
+        if result is None:
+            raise RuntimeError(f"KV command {args[0]} failed")
+        return result
+
+    def _ready(self):
+        if self._migrated:
+            return
+        if self._kv("EXISTS", self.legacy_key):
+            batch = {}
+            for chat_id, record in iter_kv_blob(self._kv, self.legacy_key):
+                if isinstance(record, str):
+                    # Older webhook versions stored some entries double-encoded
+                    try:
+                        record = json.loads(record)
+                    except json.JSONDecodeError:
+                        continue
+                if isinstance(record, dict):
+                    batch[str(chat_id)] = record
+                if len(batch) >= _BATCH:
+                    self._hset(batch)
+                    batch = {}
+            self._hset(batch)
+            # Kept under another name in case the import needs to be redone
+            self._kv("RENAME", self.legacy_key, f"{self.legacy_key}:legacy")
+        self._migrated = True
+
+    def _hset(self, records):
+        for batch in _chunks(records.items(), _BATCH):
+            args = [item for chat_id, record in batch for item in (chat_id, json.dumps(record))]
+            self._strict("HSET", self.key, *args)
+
+    def get_many(self, chat_ids):
+        self._ready()
+        found = {}
+        for batch in _chunks((str(chat_id) for chat_id in chat_ids), _BATCH):
+            values = self._strict("HMGET", self.key, *batch)
+            found.update((chat_id, json.loads(value)) for chat_id, value in zip(batch, values) if value)
+        return found
+
+    def put_many(self, records):
+        records = {str(chat_id): record for chat_id, record in records.items()}
+        found = self.get_many(records)
+        self._hset(records)
+        return {chat_id: found.get(chat_id) for chat_id in records}
+
+    def remove_many(self, chat_ids):
+        previous = self.get_many(chat_ids)
+        for batch in _chunks(previous, _BATCH):
+            self._strict("HDEL", self.key, *batch)
+        return previous
+
+    def iter_all(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._ready()
+        cursor, seen = "0", set()
+        while True:
+            reply = self._strict("HSCAN", self.key, cursor, "COUNT", chunk_size)
+            cursor, flat = str(reply[0]), reply[1]
+            # HSCAN may return a field twice while the hash is resized
+            chunk = [
+                (flat[i], json.loads(flat[i + 1])) for i in range(0, len(flat) - 1, 2)
+                if flat[i] not in seen
+            ]
+            seen.update(chat_id for chat_id, _ in chunk)
+            if chunk:
+                yield chunk
+            if cursor == "0":
+                return
+
+    def count(self):
+        self._ready()
+        return int(self._kv("HLEN", self.key) or 0)
+
+
+def create_store(kind, path, sqlite_path=None):
+    """
+    Open the registry backend selected by STORAGE_BACKEND.
+
+    An empty SQLite store is seeded from the JSON file at `path`, so
+    switching backends keeps existing subscribers.
+
+    Args:
+        kind: "file", "sqlite" or "kv"
+        path: Registry JSON file (tracked_users.json)
+        sqlite_path: Database file for the sqlite backend
+
+    Raises:
+        ValueError: For an unknown kind
+    """
+    if kind == "file":
+        return FileStore(path)
+    if kind == "sqlite":
+        store = SQLiteStore(sqlite_path)
+        if store.count() == 0 and os.path.exists(path):
+            store.import_from(FileStore(path))
+        return store
+    if kind == "kv":
+        return KVStore()
+    raise ValueError(f"Unknown storage backend '{kind}' (use file, sqlite or kv)")
@@ -0,0 +1,164 @@
+"""
+Resilience helpers for calls to the StanShop API.
+A circuit breaker stops piling requests onto a failing or slow upstream,
+and hedged calls fire a backup attempt when the first one runs past the
+usual (p95) latency.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LatencyTracker:
+    """Rolling window of call latencies with percentile lookups."""
+
+    def __init__(self, size=100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """Latency at percentile p (0-100), or None with no samples."""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker.
+
+    The circuit opens when, over the last `window` calls (and at least
+    `min_calls`), the share of failures reaches `error_rate` or the share of
+    calls slower than `slow_call_seconds` reaches `slow_rate`. After
+    `open_seconds` it lets `half_open_calls` probes through; if they all
+    succeed quickly it closes, otherwise it opens again.
+    """
+
+    def __init__(self, error_rate=0.5, slow_call_seconds=5.0, slow_rate=0.5,
+                 window=20, min_calls=5, open_seconds=60.0, half_open_calls=1):
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def allow(self):
+        """Whether a call may proceed right now."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self, seconds):
+        """Record a completed call and its latency."""
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if slow:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self):
+        """Record a failed call."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append((True, False))
+            self._evaluate()
+
+    def _evaluate(self):
+        calls = len(self._outcomes)
+        if self._state != CLOSED or calls < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+        if failures / calls >= self.error_rate or slow / calls >= self.slow_rate:
+            self._open()
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+    return _executor
+
+
+def hedged_call(fn, hedge_delay):
+    """
+    Call fn, firing a second attempt if the first is still running after
+    hedge_delay seconds. The first successful result wins.
+
+    Raises:
+        The last attempt's exception if both attempts fail
+    """
+    executor = _get_executor()
+    pending = {executor.submit(fn)}
+    done, pending = wait(pending, timeout=hedge_delay)
+    if not done:
+        pending.add(executor.submit(fn))
+
+    error = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
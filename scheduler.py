@@ -6,30 +6,233 @@ Runs the bot with hourly automated checks.
 import asyncio
 import logging
 import signal
+import time
+import uuid
+from datetime import timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
-from config import CHECK_INTERVAL, validate_config
-from bot import create_bot, scheduled_check
-
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
+from config import (
+    CHECK_INTERVAL, POLL_MODE, CLUSTER_MODE, LEASE_TTL, BROADCAST_TTL, validate_config,
+    PREWARM_LEAD_SECONDS, PREWARM_HOLD_SECONDS, TELEGRAM_KEEPALIVE_INTERVAL,
+    BOT_MODE, CHECKPOINT_FILE, CHECKPOINT_INTERVAL,
+)
+from cluster import create_coordinator, owner_of
+from monitor import check_for_stock_change, warm_connection
+from predictor import build_plan, learn_probabilities, describe_plan, PlanTrigger
+from prewarm import install_dns_cache, record_warmup, format_warmups
+from logsetup import setup_logging
+from bot import (
+    create_bot, scheduled_check, start_receiving_updates, send_notification_to_users, warm_telegram,
+    get_last_update_id, confirm_updates, post_to_channel,
 )
+import checkpoint
+
+# Configure logging (queued, written by a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
+# Cluster coordinator (None when running as a single instance)
+_coordinator = None
+_is_leader = False
+_last_broadcast_view = None
+# The leader's check and the poll job can both reach run_cluster_broadcast at once
+_broadcast_lock = asyncio.Lock()
+
+
+def cluster_heartbeat():
+    """Announce this instance and take or renew the leader lease."""
+    global _is_leader
+    try:
+        _coordinator.heartbeat()
+        was_leader = _is_leader
+        _is_leader = _coordinator.try_acquire_leadership()
+        if _is_leader != was_leader:
+            logger.info(f"Instance {_coordinator.instance_id} is {'now' if _is_leader else 'no longer'} the leader")
+    except Exception as e:
+        _is_leader = False
+        logger.error(f"Error during cluster heartbeat: {e}")
+
+
+async def run_cluster_broadcast():
+    """
+    Send the current broadcast to the chats this instance owns.
+    
+    Re-runs whenever cluster membership changes, so chats owned by an
+    instance that died are picked up by the survivors while still pending.
+    """
+    global _last_broadcast_view
+    
+    async with _broadcast_lock:
+        job = _coordinator.get_broadcast()
+        if not job or time.time() - job["created_at"] > BROADCAST_TTL:
+            return
+        
+        members = _coordinator.live_members()
+        me = _coordinator.instance_id
+        if me not in members:
+            members = sorted(members + [me])
+        
+        view = (job["id"], tuple(members))
+        if view == _last_broadcast_view:
+            return
+        
+        # Claimed before sending, so a concurrent call can't start the same broadcast
+        previous_view, _last_broadcast_view = _last_broadcast_view, view
+        try:
+            count = await send_notification_to_users(
+                job["message"],
+                job["denominations"],
+                owns=lambda chat_id: owner_of(chat_id, members) == me,
+                detected_at=job.get("detected_at"),
+                via_channel=job.get("via_channel", False),
+                claim=lambda chat_ids: _coordinator.claim(job["id"], chat_ids)
+            )
+        except Exception:
+            # Let the next poll retry the users still pending
+            _last_broadcast_view = previous_view
+            raise
+    logger.info(f"Broadcast {job['id']}: notified {count} user(s) as 1 of {len(members)} instance(s)")
+
+
 async def run_scheduled_check():
     """Wrapper for scheduled check to handle exceptions."""
     try:
-        await scheduled_check()
+        if _coordinator is None:
+            await scheduled_check()
+            return
+        
+        if not _is_leader:
+            logger.info("Skipping scheduled check: not the leader")
+            return
+        
+        logger.info("Running scheduled stock check as leader...")
+        # Blocking fetch and history write: keep the loop free for heartbeats and lease renewal
+        result = await asyncio.get_running_loop().run_in_executor(None, check_for_stock_change)
+        if result["changed"]:
+            # The leader posts to the broadcast channel once; every shard then skips the chats it covers
+            snapshot = result["status"]["snapshot"]
+            via_channel = await post_to_channel(snapshot.message)
+            _coordinator.publish_broadcast({
+                "id": uuid.uuid4().hex,
+                "via_channel": via_channel,
+                "message": snapshot.message,
+                "denominations": snapshot.as_dicts(),
+                "detected_at": result["status"]["check_time"].timestamp(),
+                "created_at": time.time()
+            })
+            await run_cluster_broadcast()
+        else:
+            logger.info(f"No stock change. Reason: {result['reason']}")
     except Exception as e:
         logger.error(f"Error during scheduled check: {e}")
 
 
+async def run_cluster_broadcast_safe():
+    """Wrapper for the broadcast poll to handle exceptions."""
+    try:
+        await run_cluster_broadcast()
+    except Exception as e:
+        logger.error(f"Error during cluster broadcast: {e}")
+
+
+class LeadTrigger(BaseTrigger):
+    """Fires `lead` seconds ahead of each fire time of another trigger."""
+    
+    def __init__(self, trigger, lead):
+        self.trigger = trigger
+        self.lead = timedelta(seconds=lead)
+    
+    def get_next_fire_time(self, previous_fire_time, now):
+        if previous_fire_time is not None:
+            previous_fire_time += self.lead
+        next_time = self.trigger.get_next_fire_time(previous_fire_time, now + self.lead)
+        return next_time - self.lead if next_time is not None else None
+    
+    def __str__(self):
+        return f"{self.trigger} - {self.lead.total_seconds():g}s"
+
+
+async def prewarm_connections():
+    """
+    Open StanShop and Telegram connections ahead of the next check.
+    
+    DNS lookups and TCP/TLS handshakes happen here instead of on the path
+    to a restock alert. Telegram is then pinged often enough to keep its
+    pooled connection alive through the check and a possible broadcast.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        stanshop, telegram = await asyncio.gather(
+            loop.run_in_executor(None, warm_connection),
+            warm_telegram()
+        )
+        record_warmup("stanshop", stanshop)
+        record_warmup("telegram", telegram)
+        logger.info(format_warmups())
+        
+        deadline = time.monotonic() + PREWARM_LEAD_SECONDS + PREWARM_HOLD_SECONDS
+        while time.monotonic() + TELEGRAM_KEEPALIVE_INTERVAL < deadline:
+            await asyncio.sleep(TELEGRAM_KEEPALIVE_INTERVAL)
+            await warm_telegram()
+    except Exception as e:
+        logger.error(f"Error pre-warming connections: {e}")
+
+
+def schedule_prewarm(scheduler, check_trigger):
+    """Schedule (or reschedule) connection pre-warming ahead of each check."""
+    if PREWARM_LEAD_SECONDS <= 0:
+        return
+    scheduler.add_job(
+        prewarm_connections,
+        trigger=LeadTrigger(check_trigger, PREWARM_LEAD_SECONDS),
+        id="prewarm",
+        name="Connection Pre-warm",
+        replace_existing=True
+    )
+
+
+def build_check_trigger(start_date=None):
+    """
+    Trigger for stock checks: fixed interval, or a plan learned from history.
+    
+    Args:
+        start_date: First fixed-interval check (e.g. restored from the checkpoint)
+    """
+    if POLL_MODE == "predictive":
+        plan = build_plan(learn_probabilities())
+        logger.info(f"Predictive polling plan: {describe_plan(plan)}")
+        return PlanTrigger(plan)
+    return IntervalTrigger(seconds=CHECK_INTERVAL, start_date=start_date)
+
+
+def save_checkpoint(scheduler):
+    """Write the warm-restart checkpoint (monitor state, update offset, next check)."""
+    if not CHECKPOINT_FILE:
+        return
+    try:
+        job = scheduler.get_job("stock_check")
+        state = checkpoint.collect(job.next_run_time if job else None, get_last_update_id())
+        checkpoint.save(state, CHECKPOINT_FILE)
+    except Exception as e:
+        logger.error(f"Error saving checkpoint: {e}")
+
+
+def refresh_polling_plan(scheduler):
+    """Re-learn the polling plan from the latest history."""
+    try:
+        trigger = build_check_trigger()
+        scheduler.reschedule_job("stock_check", trigger=trigger)
+        schedule_prewarm(scheduler, trigger)
+    except Exception as e:
+        logger.error(f"Error refreshing polling plan: {e}")
+
+
 async def main():
     """Main entry point - runs bot with scheduler."""
+    global _coordinator
     
     # Validate configuration
     if not validate_config():
@@ -39,38 +242,113 @@ async def main():
         print("   3. Add your TELEGRAM_CHAT_ID from @userinfobot")
         return
     
+    install_dns_cache()
+    
+    # Pick up where the last process stopped: stock state, schedule and update offset
+    saved = checkpoint.load(CHECKPOINT_FILE) if CHECKPOINT_FILE else None
+    next_check = None
+    if saved is not None:
+        started = time.perf_counter()
+        next_check = checkpoint.restore(saved)
+        logger.info(f"Restored checkpoint from {time.time() - saved['saved_at']:.0f}s ago "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        if POLL_MODE == "predictive":
+            # The polling plan picks its own times, so the saved one isn't resumed
+            next_check = None
+    
     # Create bot
     app = create_bot()
     
     # Create scheduler
     scheduler = AsyncIOScheduler()
     
-    # Add hourly check job
+    # Join the cluster before the first check so leadership is settled
+    _coordinator = create_coordinator(CLUSTER_MODE)
+    if _coordinator is not None:
+        cluster_heartbeat()
+        scheduler.add_job(
+            cluster_heartbeat,
+            trigger=IntervalTrigger(seconds=max(1, LEASE_TTL / 3)),
+            id="cluster_heartbeat",
+            name="Cluster Heartbeat",
+            replace_existing=True
+        )
+        scheduler.add_job(
+            run_cluster_broadcast_safe,
+            trigger=IntervalTrigger(seconds=5),
+            id="cluster_broadcast",
+            name="Cluster Broadcast Poll",
+            replace_existing=True
+        )
+        logger.info(f"Cluster mode '{CLUSTER_MODE}' as instance {_coordinator.instance_id}")
+    
+    # Add hourly check job, with connections pre-warmed a few seconds ahead
+    check_trigger = build_check_trigger(start_date=next_check)
     scheduler.add_job(
         run_scheduled_check,
-        trigger=IntervalTrigger(seconds=CHECK_INTERVAL),
+        trigger=check_trigger,
         id="stock_check",
         name="PhonePe Voucher Stock Check",
         replace_existing=True
     )
+    schedule_prewarm(scheduler, check_trigger)
+    
+    if POLL_MODE == "predictive":
+        # Keep the plan in step with newly recorded history
+        scheduler.add_job(
+            refresh_polling_plan,
+            trigger=IntervalTrigger(hours=24),
+            args=[scheduler],
+            id="refresh_polling_plan",
+            name="Refresh Predictive Polling Plan",
+            replace_existing=True
+        )
+    
+    if CHECKPOINT_FILE and CHECKPOINT_INTERVAL > 0:
+        scheduler.add_job(
+            save_checkpoint,
+            trigger=IntervalTrigger(seconds=CHECKPOINT_INTERVAL),
+            args=[scheduler],
+            id="checkpoint",
+            name="Warm-restart Checkpoint",
+            replace_existing=True
+        )
     
     # Start scheduler
     scheduler.start()
-    logger.info(f"Scheduler started. Checking every {CHECK_INTERVAL} seconds ({CHECK_INTERVAL // 3600} hour(s))")
+    if POLL_MODE == "predictive":
+        logger.info("Scheduler started with predictive polling")
+    else:
+        logger.info(f"Scheduler started. Checking every {CHECK_INTERVAL} seconds ({CHECK_INTERVAL // 3600} hour(s))")
     
     # Initialize bot
     await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    if saved is not None and saved.get("last_update_id") is not None and BOT_MODE != "webhook":
+        # Updates handled before the restart aren't delivered again
+        try:
+            await confirm_updates(app, saved["last_update_id"])
+        except Exception as e:
+            logger.error(f"Error confirming handled updates: {e}")
+    await start_receiving_updates(app)
     
-    logger.info("Bot is running! Press Ctrl+C to stop.")
+    # Platforms stop dynos with SIGTERM; cancel the loop below so cleanup runs
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows
     
-    # Run initial check (just to log current state)
-    logger.info("Running initial stock check...")
-    await run_scheduled_check()
+    logger.info("Bot is running! Press Ctrl+C to stop.")
     
-    # Keep running
     try:
+        if next_check is None:
+            # Run initial check (just to log current state)
+            logger.info("Running initial stock check...")
+            await run_scheduled_check()
+        else:
+            logger.info(f"Next stock check at {next_check} (from checkpoint)")
+        
+        # Keep running
         while True:
             await asyncio.sleep(1)
     except asyncio.CancelledError:
@@ -78,7 +356,10 @@ async def main():
     finally:
         # Cleanup
         logger.info("Shutting down...")
+        save_checkpoint(scheduler)
         scheduler.shutdown()
+        if _coordinator is not None:
+            _coordinator.leave()
         await app.updater.stop()
         await app.stop()
         await app.shutdown()
@@ -0,0 +1,158 @@
+"""
+Time-to-notify tracking for stock alert broadcasts.
+Each broadcast is stamped when stock is detected; every delivery's latency
+is measured from that stamp and summarized (p50/p90/p99/max, successes,
+failures, throughput) so we can see how quickly alerts reach users.
+"""
+
+import json
+import math
+import os
+import time
+import uuid
+
+from config import BROADCAST_STATS_FILE, TTN_BUDGET_SECONDS
+
+# Summaries kept in the stats file / KV list
+MAX_SUMMARIES = 50
+
+# KV list holding summaries from the serverless cron, newest first
+BROADCAST_STATS_KEY = "broadcast_stats"
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class BroadcastTracker:
+    """Collects delivery latencies for one broadcast."""
+
+    def __init__(self, detected_at=None, source="bot"):
+        self.event_id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.detected_at = detected_at
+        self.started_at = None
+        self.last_delivery_at = None
+        self.latencies = []
+        self.failed = 0
+        self.skipped = 0  # Sends dropped after the broadcast was cancelled
+        self.cancelled = False
+        self.channel_posts = 0
+        self.channel_covered = 0  # Subscribers reached by a channel post instead of a DM
+
+    def stamp(self, detected_at=None):
+        """Set the detection time (epoch seconds, defaults to now)."""
+        self.detected_at = detected_at if detected_at is not None else time.time()
+
+    def record_delivery(self, ok=True, delivered_at=None):
+        """Record one delivery attempt."""
+        now = delivered_at if delivered_at is not None else time.time()
+        if self.started_at is None:
+            self.started_at = now
+        self.last_delivery_at = now
+        if self.detected_at is None:
+            self.detected_at = now
+        if ok:
+            self.latencies.append(now - self.detected_at)
+        else:
+            self.failed += 1
+
+    def record_channel_post(self, delivered_at=None):
+        """Record a successful post to the broadcast channel."""
+        self.channel_posts += 1
+        self.record_delivery(ok=True, delivered_at=delivered_at)
+
+    def record_channel(self, count):
+        """Record subscribers whose DM was replaced by the channel post."""
+        self.channel_covered += count
+
+    def cancel(self):
+        """Mark the broadcast as stopped early (stock sold out)."""
+        self.cancelled = True
+
+    def record_skipped(self, count=1):
+        """Record sends dropped because the broadcast was cancelled."""
+        self.skipped += count
+
+    def summary(self):
+        """
+        Summarize the broadcast.
+
+        Returns:
+            dict: Latency percentiles (seconds), counts and throughput
+        """
+        ordered = sorted(self.latencies)
+        finished_at = self.last_delivery_at or time.time()
+        send_window = finished_at - self.started_at if self.started_at else 0
+        sent = len(ordered)
+
+        def rounded(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            "event_id": self.event_id,
+            "source": self.source,
+            "detected_at": self.detected_at,
+            "finished_at": finished_at,
+            "sent": sent,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "p50": rounded(percentile(ordered, 50)),
+            "p90": rounded(percentile(ordered, 90)),
+            "p99": rounded(percentile(ordered, 99)),
+            "max": rounded(ordered[-1] if ordered else None),
+            "throughput": round(sent / send_window, 1) if send_window > 0 else float(sent),
+            "budget": TTN_BUDGET_SECONDS,
+            "channel_covered": self.channel_covered,
+            "sends_saved": self.channel_covered - self.channel_posts,
+        }
+
+
+def over_budget(summary, budget=TTN_BUDGET_SECONDS):
+    """Whether a broadcast's p99 time-to-notify exceeded the budget."""
+    return summary.get("p99") is not None and summary["p99"] > budget
+
+
+def format_summary(summary):
+    """Human-readable one-broadcast report (Markdown)."""
+    if not summary["sent"] and not summary["failed"]:
+        return "No deliveries in this broadcast."
+    detected = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["detected_at"]))
+    flag = "🚨" if over_budget(summary, summary.get("budget", TTN_BUDGET_SECONDS)) else "✅"
+    text = (
+        f"{flag} Broadcast `{summary['event_id']}` ({summary['source']}) detected {detected}\n"
+        f"Sent {summary['sent']}, failed {summary['failed']}, {summary['throughput']}/s\n"
+        f"Time-to-notify p50 {summary['p50']}s · p90 {summary['p90']}s · "
+        f"p99 {summary['p99']}s · max {summary['max']}s (budget {summary['budget']}s)"
+    )
+    if summary.get("channel_covered"):
+        text += (
+            f"\n📣 Channel post covered {summary['channel_covered']} subscriber(s), "
+            f"{summary['sends_saved']} sends saved"
+        )
+    if summary.get("cancelled"):
+        text += f"\n🛑 Stopped early: sold out ({summary.get('skipped', 0)} sends skipped)"
+    return text
+
+
+def load_summaries(path=BROADCAST_STATS_FILE):
+    """Load persisted summaries, newest first."""
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return []
+    return []
+
+
+def save_summary(summary, path=BROADCAST_STATS_FILE):
+    """Persist a summary, keeping the most recent MAX_SUMMARIES."""
+    summaries = [summary] + load_summaries(path)
+    with open(path, "w") as f:
+        json.dump(summaries[:MAX_SUMMARIES], f, indent=2)
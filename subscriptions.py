@@ -0,0 +1,203 @@
+"""
+Subscription filters and matching for stock alerts.
+Users can limit /track to certain denominations, a maximum price and a
+minimum discount. Pending subscriptions are kept in an inverted index so a
+stock event is matched to its recipients without scanning every user.
+"""
+
+import math
+from bisect import bisect_left
+
+from inventory import as_denomination
+
+NO_LIMIT = float("inf")
+
+USAGE = (
+    "Usage: /track [denominations] [max=PRICE] [discount=PERCENT]\n"
+    "Example: /track 500 1000 max=480 discount=5"
+)
+
+
+def parse_filters(args):
+    """
+    Parse /track arguments into a filters dict.
+
+    Args:
+        args: Command arguments, e.g. ["500", "max=480", "discount=5"]
+
+    Returns:
+        dict: Filters with 'denominations', 'max_price' and 'min_discount'
+              keys, or None when no arguments were given
+
+    Raises:
+        ValueError: If an argument can't be understood or is out of range
+    """
+    if not args:
+        return None
+
+    def finite(text):
+        # inf/nan would overflow int() or break the index's sorted thresholds
+        number = float(text)
+        if not math.isfinite(number):
+            raise ValueError
+        return number
+
+    denominations, max_price, min_discount = [], None, None
+    for arg in args:
+        key, sep, value = arg.lower().lstrip("₹").partition("=")
+        try:
+            if not sep:
+                number = finite(key)
+            elif key in ("max", "max_price", "price"):
+                max_price = finite(value.lstrip("₹"))
+            elif key in ("discount", "min_discount", "off"):
+                min_discount = finite(value.rstrip("%"))
+            else:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Can't understand '{arg}'.\n{USAGE}")
+
+        # Out-of-range values would parse, but then never match any stock
+        if not sep:
+            if number <= 0 or not number.is_integer():
+                raise ValueError(f"'{arg}' isn't a voucher value - use a whole amount like 500.")
+            denominations.append(int(number))
+        elif key in ("max", "max_price", "price") and max_price <= 0:
+            raise ValueError(f"'{arg}': the maximum price must be above 0.")
+        elif key in ("discount", "min_discount", "off") and not 0 <= min_discount <= 100:
+            raise ValueError(f"'{arg}': the discount must be between 0 and 100%.")
+
+    return {
+        "denominations": sorted(set(denominations)),
+        "max_price": max_price,
+        "min_discount": min_discount,
+    }
+
+
+def format_filters(filters):
+    """Describe filters for status messages."""
+    if not filters:
+        return "all vouchers"
+    parts = []
+    if filters.get("denominations"):
+        parts.append(", ".join(f"₹{d}" for d in filters["denominations"]))
+    if filters.get("max_price") is not None:
+        parts.append(f"max ₹{filters['max_price']:g}")
+    if filters.get("min_discount") is not None:
+        parts.append(f"≥{filters['min_discount']:g}% off")
+    return " · ".join(parts) or "all vouchers"
+
+
+def normalize_item(denom):
+    """
+    Extract (value, price, discount) from a Denomination or an API entry.
+
+    Discount is derived from value and price when the API omits it.
+    """
+    denom = as_denomination(denom)
+    return (denom.value, denom.price, denom.discount)
+
+
+class SubscriptionIndex:
+    """
+    Inverted index of pending subscriptions.
+
+    Chats are bucketed by denomination (None for "any denomination"); each
+    bucket keeps max-price thresholds sorted so that the chats willing to pay
+    a given price are found with one bisect.
+    """
+
+    def __init__(self):
+        self._filters = {}
+        self._thresholds = {}  # denomination -> sorted max prices
+        self._chats = {}       # denomination -> chat ids, parallel to _thresholds
+
+    @classmethod
+    def from_users(cls, users):
+        """Build an index from a registry of users, keeping only pending ones."""
+        index = cls()
+        for chat_id, data in users.items():
+            if not data.get("notified", False):
+                index.add(chat_id, data.get("filters"))
+        return index
+
+    def __len__(self):
+        return len(self._filters)
+
+    def __contains__(self, chat_id):
+        return str(chat_id) in self._filters
+
+    def add(self, chat_id, filters=None):
+        """Add or replace a chat's subscription."""
+        chat_id = str(chat_id)
+        self.remove(chat_id)
+        filters = filters or {}
+        self._filters[chat_id] = filters
+
+        threshold = filters.get("max_price")
+        threshold = NO_LIMIT if threshold is None else threshold
+        for key in filters.get("denominations") or [None]:
+            thresholds = self._thresholds.setdefault(key, [])
+            chats = self._chats.setdefault(key, [])
+            position = bisect_left(thresholds, threshold)
+            thresholds.insert(position, threshold)
+            chats.insert(position, chat_id)
+
+    def remove(self, chat_id):
+        """Remove a chat's subscription if present."""
+        chat_id = str(chat_id)
+        filters = self._filters.pop(chat_id, None)
+        if filters is None:
+            return
+
+        threshold = filters.get("max_price")
+        threshold = NO_LIMIT if threshold is None else threshold
+        for key in filters.get("denominations") or [None]:
+            thresholds, chats = self._thresholds[key], self._chats[key]
+            position = bisect_left(thresholds, threshold)
+            while chats[position] != chat_id:
+                position += 1
+            del thresholds[position]
+            del chats[position]
+
+    def iter_match(self, denominations):
+        """
+        Yield pending chats whose filters accept any of the denominations.
+
+        Each chat is yielded once; work is proportional to the chats that
+        pass the denomination and price lookups. Chats removed while the
+        generator is suspended are skipped; callers that mutate the index
+        from other threads should advance it under their own lock.
+
+        Args:
+            denominations: Denominations currently in stock
+        """
+        matched = set()
+        for denom in denominations:
+            value, price, discount = normalize_item(denom)
+            for key in (value, None):
+                thresholds = self._thresholds.get(key)
+                if not thresholds:
+                    continue
+                # Everyone from here on accepts this price
+                start = bisect_left(thresholds, price) if price is not None else 0
+                for chat_id in self._chats[key][start:]:
+                    if chat_id in matched:
+                        continue
+                    filters = self._filters.get(chat_id)
+                    if filters is None:
+                        # Removed (e.g. /untrack) since the slice was taken
+                        continue
+                    min_discount = filters.get("min_discount")
+                    if min_discount is None or (discount is not None and discount >= min_discount):
+                        matched.add(chat_id)
+                        yield chat_id
+
+    def match(self, denominations):
+        """
+        Find pending chats whose filters accept any of the denominations.
+
+        Returns:
+            list: Matching chat ids
+        """
+        return list(self.iter_match(denominations))